@@ -0,0 +1,44 @@
+"""
+原子写入文件：storage（数据文件、状态文件）与metrics（多进程指标文件）共用，不依赖其他模块
+"""
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    原子写入：调用方写入同目录临时文件，完成后替换原文件，读取方不会读到写入一半的文件；
+    临时文件以0666创建（由内核去掉umask，与直接新建文件相同，不像mkstemp仅创建者可读），
+    原文件存在时改为原文件的权限；写入异常时删除临时文件，不修改原文件
+
+        with atomic_write(path) as tmp_path:
+            df.to_csv(tmp_path, index=False)
+
+    :param path: 文件路径
+    :return: 临时文件路径
+    """
+    directory = os.path.dirname(path) or '.'
+    prefix = '.' + os.path.basename(path) + '.'
+    for _ in range(tempfile.TMP_MAX):
+        tmp_path = os.path.join(directory, prefix + os.urandom(6).hex() + '.tmp')
+        try:
+            os.close(os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+            break
+        except FileExistsError:
+            continue
+    else:
+        raise FileExistsError('No usable temporary file name found in ' + directory)
+    try:
+        yield tmp_path
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
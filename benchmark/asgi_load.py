@@ -0,0 +1,218 @@
+"""
+Web接口并发压力测试：进程内ASGI客户端直接调用应用，不经过网络，对比不同并发数下的吞吐量与延迟
+
+    python -m benchmark.asgi_load --concurrency 1 4 8 16 --requests 200
+
+blocking：按原实现在async接口中直接调用同步查询（阻塞事件循环）
+threadpool：当前实现，查询在线程池中执行
+probe为压测期间每10ms请求一次轻量接口（/reportCacheStats）的额外等待时间（事件循环延迟），
+事件循环被阻塞时探测请求需等到其他请求处理完毕才能执行
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from benchmark import synthetic
+
+
+class ASGIClient:
+    """
+    最简ASGI HTTP客户端：构造请求scope直接调用应用
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def get(self, path, params=None, headers=None):
+        """
+        :param path: 请求路径
+        :param params: 查询参数
+        :param headers: 请求头 dict
+        :return: (状态码, 响应体bytes)
+        """
+        status, _, body = await self.request(path, params, headers)
+        return status, body
+
+    async def request(self, path, params=None, headers=None, method='GET'):
+        """
+        :param path: 请求路径
+        :param params: 查询参数
+        :param headers: 请求头 dict
+        :param method: 请求方法
+        :return: (状态码, 响应头dict（小写）, 响应体bytes)
+        """
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode('latin-1'),
+            'query_string': urlencode(params or {}).encode('latin-1'),
+            'root_path': '',
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in (headers or {}).items()],
+            'client': ('127.0.0.1', 50000),
+            'server': ('127.0.0.1', 8001),
+        }
+        sent = False
+        status = None
+        response_headers = {}
+        body = []
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # 请求体已发送完毕，等待至响应结束
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                response_headers.update((k.decode('latin-1').lower(), v.decode('latin-1'))
+                                        for k, v in message.get('headers', []))
+            elif message['type'] == 'http.response.body':
+                body.append(message.get('body', b''))
+
+        await self.app(scope, receive, send)
+        return status, response_headers, b''.join(body)
+
+
+def blocking_app():
+    """
+    原实现：async接口中直接调用同步查询
+    :return: FastAPI应用
+    """
+    from fastapi import FastAPI
+
+    import report_cache
+    import report_engine
+    import service as sv
+
+    app = FastAPI()
+
+    @app.get('/tradeInfo')
+    async def get_trade_info(date):
+        try:
+            return sv.query_trade_info(date)
+        except Exception:
+            return {"Status": 100}
+
+    @app.get('/getOptReport')
+    async def get_opt_report(date):
+        try:
+            return json.loads(report_cache.get(date, report_engine.build_opt_report).body)
+        except Exception:
+            return {"Status": 100}
+
+    @app.get('/reportCacheStats')
+    async def get_report_cache_stats():
+        return report_cache.stats()
+
+    return app
+
+
+async def _load(client, paths, concurrency):
+    """
+    以固定并发数发送全部请求，同时每10ms探测一次轻量接口
+    :return: (总耗时秒, 请求延迟列表ms, 探测延迟列表ms)
+    """
+    queue = asyncio.Queue()
+    for item in paths:
+        queue.put_nowait(item)
+    latencies = []
+    probes = []
+    done = asyncio.Event()
+
+    async def worker():
+        while not queue.empty():
+            path, params = queue.get_nowait()
+            start = time.perf_counter()
+            status, _ = await client.get(path, params)
+            assert status == 200, (path, params, status)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            await client.get('/reportCacheStats')
+            probes.append((time.perf_counter() - start - 0.01) * 1000)
+
+    probe_task = asyncio.ensure_future(probe())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+    return elapsed, latencies, probes
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1 if len(samples) > 1 else 0], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def run(concurrency=(1, 4, 8, 16), requests=200, years=2, cache=False):
+    """
+    :param concurrency: 并发数列表
+    :param requests: 每轮请求数
+    :param years: 模拟数据年数
+    :param cache: 是否启用报表缓存，默认关闭（每次请求都重新生成报表）
+    :return: 测试结果列表
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, 'data')
+        dates = [d for d in synthetic.generate(data_dir, years, 2022) if d.startswith('2022')]
+        os.makedirs(os.path.join(tmp, 'static'))
+        os.chdir(tmp)
+        import storage
+        storage.DATA_DIR = data_dir
+        try:
+            import report_cache
+            import server
+
+            if not cache:
+                report_cache.CACHE_SIZE = 0
+            paths = []
+            for i in range(requests):
+                date = dates[i * 7 % len(dates)]
+                paths.append(('/getOptReport' if i % 2 == 0 else '/tradeInfo', {'date': date}))
+
+            results = []
+            for name, app in [('blocking', blocking_app()), ('threadpool', server.app)]:
+                client = ASGIClient(app)
+                # 预热：加载年度数据表及汇总表
+                asyncio.run(_load(client, paths[:10], 1))
+                for n in concurrency:
+                    elapsed, latencies, probes = asyncio.run(_load(client, paths, n))
+                    results.append(dict(app=name, concurrency=n, requests=len(paths),
+                                        throughput_rps=round(len(paths) / elapsed, 1),
+                                        latency=_summary(latencies), probe=_summary(probes)))
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Web接口并发压力测试')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--cache', action='store_true', help='启用报表缓存')
+    args = parser.parse_args()
+    print(json.dumps(run(args.concurrency, args.requests, args.years, args.cache), indent=2))
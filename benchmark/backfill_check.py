@@ -0,0 +1,157 @@
+"""
+历史数据补采检查：以本地模拟接口（benchmark.dce_stub）在临时数据目录中执行schedule_service.backfill.run，
+第二个年度保存前中断，重新执行后检查只采集剩余的日期（断点），每个年度只写入一次，请求频率不超过限流，
+已有数据的日期跳过，--overwrite重新采集时保留人工维护的场外期权字段
+
+    python -m benchmark.backfill_check
+
+检查项不通过时以退出码1结束
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import storage
+from benchmark import dce_stub
+from schedule_service import backfill, otc_daily_rept
+
+# 模拟交易日：跨两个年度
+DATES = ['20211227', '20211228', '20211229', '20211230', '20211231',
+         '20220104', '20220105', '20220106', '20220107', '20220110']
+# 已有数据（人工录入了场外期权数据）的日期
+STORED = '20220105'
+MANUAL = {'turnover': 1234.5, 'trade_num': 3, 'variety_names': '豆粕'}
+# 每个接口每日记录数
+ROWS = 10
+# 每秒请求数上限
+RATE = 40
+WORKERS = 4
+
+
+class _Interrupted(Exception):
+    pass
+
+
+def _prepare(tmp):
+    with open(os.path.join(tmp, 'trade_date.csv'), 'w') as f:
+        f.write(''.join(date + '\n' for date in DATES))
+    otc_daily_rept.save_records([(STORED, 'opt', '', '', 0, 0, 0)])
+    storage.update_record(STORED, 'opt', MANUAL)
+
+
+def _manual_kept():
+    record = storage.get_record(STORED, 'opt')
+    return all(record[field] == value for field, value in MANUAL.items())
+
+
+def _run(handler, fetched, **kwargs):
+    """
+    :return: (采集的日期列表, 接口请求数, 耗时s, 异常)
+    """
+    fetched.clear()
+    before = sum(handler.hits.values())
+    start = time.perf_counter()
+    error = None
+    try:
+        backfill.run(DATES[0], DATES[-1], workers=WORKERS, rate=RATE, **kwargs)
+    except _Interrupted as e:
+        error = repr(e)
+    return sorted(fetched), sum(handler.hits.values()) - before, time.perf_counter() - start, error
+
+
+def run():
+    """
+    :return: 检查结果
+    """
+    data_dir = storage.DATA_DIR
+    api_url = otc_daily_rept.API_URL
+    collect = otc_daily_rept.collect
+    save_records = otc_daily_rept.save_records
+    fetched = []
+    writes = {}
+    interrupt = set()
+
+    def counting_collect(date, *args, **kwargs):
+        fetched.append(date)
+        return collect(date, *args, **kwargs)
+
+    def interrupting_save(records, *args, **kwargs):
+        if {record[0][:4] for record in records} & interrupt:
+            raise _Interrupted('interrupted before saving %s' % sorted(interrupt))
+        return save_records(records, *args, **kwargs)
+
+    def on_write(year, dates):
+        writes[year] = writes.get(year, 0) + 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DATA_DIR = tmp
+        storage.invalidate()
+        server, otc_daily_rept.API_URL = dce_stub.start(rows=ROWS)
+        handler = server.RequestHandlerClass
+        otc_daily_rept.collect = counting_collect
+        otc_daily_rept.save_records = interrupting_save
+        try:
+            _prepare(tmp)
+            storage.add_listener(on_write)
+            remaining = [date for date in DATES if date != STORED]
+            # 第二个年度保存前中断
+            interrupt.add('2022')
+            first = _run(handler, fetched)
+            interrupt.clear()
+            checkpoint = backfill.Checkpoint.load(os.path.join(tmp, backfill.CHECKPOINT_FILE), DATES[0], DATES[-1])
+            first_done = sorted(checkpoint.done)
+            resumed = _run(handler, fetched)
+            year_writes = dict(writes)
+            checkpoint = backfill.Checkpoint.load(os.path.join(tmp, backfill.CHECKPOINT_FILE), DATES[0], DATES[-1])
+            done = sorted(checkpoint.done)
+            manual_after_backfill = _manual_kept()
+            again = _run(handler, fetched)
+            overwrite = _run(handler, fetched, restart=True, overwrite=True)
+            wbill = storage.get_record(STORED, 'wbill')
+            manual_after_overwrite = _manual_kept()
+        finally:
+            otc_daily_rept.collect = collect
+            otc_daily_rept.save_records = save_records
+            server.shutdown()
+            otc_daily_rept.API_URL = api_url
+            storage.DATA_DIR = data_dir
+            storage.invalidate()
+
+    burst = backfill.RateLimiter(RATE).burst
+    runs = {}
+    for name, (dates, requests, elapsed, error) in (('first', first), ('resumed', resumed), ('again', again),
+                                                    ('overwrite', overwrite)):
+        runs[name] = {'fetched': dates, 'requests': requests, 'elapsed_s': round(elapsed, 3), 'error': error}
+    year_2021 = [date for date in remaining if date < '2022']
+    year_2022 = [date for date in remaining if date >= '2022']
+    checks = {
+        'interrupted': first[3] is not None and first_done == year_2021,
+        # 重新执行时只采集断点之后的日期
+        'resumed_remaining_only': resumed[0] == year_2022 and resumed[3] is None,
+        'checkpoint_done': done == remaining,
+        'one_write_per_year': year_writes == {'2021': 1, '2022': 1},
+        # 令牌桶：请求数不超过 初始令牌 + 速率 * 耗时
+        'rate_limited': first[1] > burst and first[1] <= burst + RATE * first[2] + 1,
+        'stored_date_skipped': STORED not in first[0] + resumed[0] and manual_after_backfill,
+        'nothing_pending': again[0] == [] and again[1] == 0,
+        # 重新采集的日期写入了采集结果，人工录入的场外期权字段不变
+        'overwrite_keeps_manual': overwrite[0] == DATES and wbill is not None and manual_after_overwrite,
+    }
+    return {
+        'params': {'dates': DATES, 'stored': STORED, 'rows': ROWS, 'rate': RATE, 'burst': burst, 'workers': WORKERS},
+        'runs': runs,
+        'writes': year_writes,
+        'checks': checks,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='历史数据补采检查')
+    parser.parse_args()
+    result = run()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if not all(result['checks'].values()):
+        sys.exit(1)
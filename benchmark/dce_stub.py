@@ -0,0 +1,155 @@
+"""
+大商所OTC门户数据接口本地模拟服务，用于采集服务的联调与性能测试
+
+    python -m benchmark.dce_stub --port 8765 --rows 250 --delay 0.2
+
+采集服务指向模拟服务：
+    otc_daily_rept.API_URL = 'http://127.0.0.1:8765/portal/data/app/{api}'
+"""
+import argparse
+import datetime
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from schedule_service.otc_daily_rept import RESULT_KEYS, TOTAL_KEY, variety_order
+
+VARIETIES = list(variety_order)
+# 历史记录每日条数
+HISTORY_PER_DAY = 100
+
+
+def make_row(api, date, i):
+    """
+    生成一条模拟结果记录，同一(接口, 日期, 序号)结果固定
+    :param api: 接口名称
+    :param date: 日期 yyyymmdd
+    :param i: 记录序号
+    :return: 结果记录
+    """
+    rnd = random.Random('%s-%s-%d' % (api, date, i))
+    name = rnd.choice(VARIETIES)
+    contract = name + '2209'
+    return {
+        'varietyId': 'v%02d' % variety_order[name],
+        'varietyName': name,
+        'opDate': date,
+        'matchTotWeight': '%.0f' % rnd.uniform(10, 5000),
+        'turnover': '%.2f' % rnd.uniform(1e4, 1e7),
+        'applyWeight': '%.0f' % rnd.uniform(10, 5000),
+        'price': '%.2f' % rnd.uniform(1000, 10000),
+        'qty': '%.0f' % rnd.uniform(10, 5000),
+        'nominalMatchAmt': '%.4f' % rnd.uniform(1, 500),
+        'contractType': '1',
+        'subjectContractId': contract,
+    }
+
+
+def _row_date(date, i, day_rows):
+    """
+    不按日期查询时第i条记录的日期：前day_rows条为当日，之后每HISTORY_PER_DAY条早一日
+    """
+    if i < day_rows:
+        return date
+    days = 1 + (i - day_rows) // HISTORY_PER_DAY
+    return (datetime.datetime.strptime(date, '%Y%m%d') - datetime.timedelta(days=days)).strftime('%Y%m%d')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # 接口名称 -> 每日记录数
+    rows = {}
+    default_rows = 250
+    # 每次请求的模拟延迟 单位：秒
+    delay = 0
+    # 返回异常的接口名称
+    failing = set()
+    # 是否返回总记录数字段
+    with_total = True
+    # 请求参数不含日期时（如wbillApplyList）记录使用的日期，默认当日
+    date = None
+    # 请求参数不含日期时，当日记录之后按日期倒序返回的历史记录数（每日HISTORY_PER_DAY条）
+    history = 0
+    # 请求计数：接口名称 -> 次数
+    hits = {}
+    hits_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        api = self.path.rsplit('/', 1)[-1]
+        with self.hits_lock:
+            self.hits[api] = self.hits.get(api, 0) + 1
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if self.delay:
+            time.sleep(self.delay)
+        if api not in RESULT_KEYS or api in self.failing:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        query = next((v for v in body.values() if isinstance(v, dict)), {})
+        date = query.get('startDate') or self.date or time.strftime('%Y%m%d')
+        page = int(body.get('page', 1))
+        limit = int(body.get('limit', 100))
+        day_rows = self.rows.get(api, self.default_rows)
+        total = day_rows if query.get('startDate') else day_rows + self.history
+        rows = [make_row(api, _row_date(date, i, day_rows), i)
+                for i in range((page - 1) * limit, min(page * limit, total))]
+        result = {'rows': rows}
+        if self.with_total:
+            result[TOTAL_KEY] = total
+        data = json.dumps({'data': {RESULT_KEYS[api]: result}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start(port=0, rows=250, delay=0, failing=(), with_total=True, date=None, history=0):
+    """
+    在后台线程启动模拟服务
+    :param port: 监听端口，0为随机端口
+    :param rows: 每个接口每日记录数（int或 接口名称 -> 记录数）
+    :param delay: 每次请求的模拟延迟 单位：秒
+    :param failing: 返回异常的接口名称
+    :param with_total: 是否返回总记录数字段
+    :param date: 请求参数不含日期时记录使用的日期
+    :param history: 请求参数不含日期时当日记录之后的历史记录数
+    :return: (server, api_url) api_url可直接赋值给otc_daily_rept.API_URL
+    """
+    handler = type('Handler', (StubHandler,), {
+        'rows': rows if isinstance(rows, dict) else {},
+        'default_rows': rows if isinstance(rows, int) else StubHandler.default_rows,
+        'delay': delay,
+        'failing': set(failing),
+        'with_total': with_total,
+        'date': date,
+        'history': history,
+        'hits': {},
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = 'http://127.0.0.1:%d/portal/data/app/{api}' % server.server_address[1]
+    return server, api_url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='大商所OTC数据接口模拟服务')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rows', type=int, default=250)
+    parser.add_argument('--delay', type=float, default=0)
+    parser.add_argument('--history', type=int, default=0, help='不按日期查询的接口返回的历史记录数')
+    args = parser.parse_args()
+    server, api_url = start(args.port, args.rows, args.delay, history=args.history)
+    print('DCE stub: ' + api_url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
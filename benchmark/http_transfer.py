@@ -0,0 +1,270 @@
+"""
+页面传输测试：模拟浏览器打开报表页面（页面、静态文件、当日报表接口）及查询区间报表，
+统计首次访问、再次访问（浏览器已缓存）的传输字节数，按链路往返时延及带宽估算首屏时间，
+对比原实现（每次从磁盘读取页面且无缓存头，静态文件及接口不压缩）与当前实现
+
+    python -m benchmark.http_transfer --static static
+
+未指定静态文件目录时生成模拟页面（index.html及较大的js、css文件）；解压后的内容与原实现不一致时以退出码1结束
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import storage
+from benchmark import synthetic
+from benchmark.asgi_load import ASGIClient
+
+# 链路：名称 -> (往返时延ms, 带宽Mbit/s)
+LINKS = {
+    'lan': (1, 100),
+    '4g': (50, 10),
+    '3g': (150, 1.6),
+}
+# 浏览器对同一域名的并发连接数
+CONNECTIONS = 6
+# 首屏需要的接口：当日成交信息及报表
+PAGE_APIS = ['/tradeInfo', '/getOptReport']
+BROWSER_HEADERS = {'Accept-Encoding': 'gzip, deflate, br'}
+
+
+def _dashboard(directory, seed=0):
+    """
+    生成模拟页面：index.html引用的js（约300KB，近似打包后的图表库）、css
+    """
+    rnd = random.Random(seed)
+    os.makedirs(os.path.join(directory, 'js'))
+    os.makedirs(os.path.join(directory, 'css'))
+    words = ['chart', 'series', 'axis', 'option', 'render', 'data', 'value', 'label', 'tooltip', 'legend', 'grid',
+             'variety', 'turnover', 'volume', 'report', 'date', 'format', 'update', 'element', 'style']
+    lines = []
+    while sum(len(line) for line in lines) < 300 * 1024:
+        a, b, c = rnd.sample(words, 3)
+        lines.append('function %s%s%d(%s,%s){var t=%s.%s||{};return t.%s=%s,%s(t,%d)}' % (
+            a, b.title(), rnd.randrange(1000), a, b, a, c, b, b, c, rnd.randrange(100)))
+    with open(os.path.join(directory, 'js', 'app.js'), 'w') as f:
+        f.write('\n'.join(lines))
+    rules = []
+    while sum(len(rule) for rule in rules) < 30 * 1024:
+        rules.append('.%s-%s{margin:%dpx;padding:%dpx;color:#%06x}' % (
+            rnd.choice(words), rnd.choice(words), rnd.randrange(20), rnd.randrange(20), rnd.randrange(1 << 24)))
+    with open(os.path.join(directory, 'css', 'app.css'), 'w') as f:
+        f.write('\n'.join(rules))
+    rows = ''.join('<tr><td class="variety-%d">-</td><td>-</td><td>-</td></tr>' % i for i in range(60))
+    with open(os.path.join(directory, 'index.html'), 'w') as f:
+        f.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>OTC日报</title>'
+                '<link rel="stylesheet" href="/static/css/app.css"></head><body><table>%s</table>'
+                '<script src="/static/js/app.js"></script></body></html>' % rows)
+
+
+def _assets(directory):
+    """
+    :return: 静态文件请求路径列表
+    """
+    paths = []
+    for root, _, files in os.walk(directory):
+        for file in files:
+            name = os.path.relpath(os.path.join(root, file), directory).replace(os.sep, '/')
+            if name != 'index.html':
+                paths.append('/static/' + name)
+    return sorted(paths)
+
+
+def baseline_app(app, static_dir):
+    """
+    原实现：页面每次从磁盘读取，无缓存头；静态文件由StaticFiles返回（不压缩）；接口不压缩
+    :param app: 当前应用（接口请求去掉Accept-Encoding后转发）
+    :param static_dir: 静态文件目录
+    :return: ASGI应用
+    """
+    from fastapi.staticfiles import StaticFiles
+    from starlette.responses import HTMLResponse
+
+    static = StaticFiles(directory=static_dir)
+
+    async def baseline(scope, receive, send):
+        if scope['path'] == '/':
+            with open(os.path.join(static_dir, 'index.html'), 'r') as fp:
+                data = fp.read()
+            await HTMLResponse(data)(scope, receive, send)
+        elif scope['path'].startswith('/static/'):
+            await static(dict(scope, path=scope['path'][len('/static'):], root_path='/static'), receive, send)
+        else:
+            headers = [(k, v) for k, v in scope['headers'] if k != b'accept-encoding']
+            await app(dict(scope, headers=headers), receive, send)
+
+    return baseline
+
+
+def _max_age(cache_control):
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    return int(match.group(1)) if match and 'no-cache' not in cache_control else 0
+
+
+def _header_bytes(status, headers):
+    return len('HTTP/1.1 %d\r\n' % status) + sum(len(k) + len(v) + 4 for k, v in headers.items()) + 2
+
+
+class Browser:
+    """
+    模拟浏览器缓存：缓存未过期时不发请求，过期后以If-None-Match校验
+    """
+
+    def __init__(self, client):
+        self.client = client
+        # 路径及参数 -> (ETag, 过期时间, 解码后的内容)
+        self.cache = {}
+
+    async def fetch(self, path, params=None):
+        """
+        :return: (是否发出请求, 传输字节数, 服务端耗时ms, 解码后的内容)
+        """
+        key = (path, tuple(sorted((params or {}).items())))
+        cached = self.cache.get(key)
+        if cached is not None and cached[1] > time.time():
+            return False, 0, 0.0, cached[2]
+        headers = dict(BROWSER_HEADERS)
+        if cached is not None and cached[0]:
+            headers['If-None-Match'] = cached[0]
+        start = time.perf_counter()
+        status, response_headers, body = await self.client.request(path, params, headers)
+        elapsed = (time.perf_counter() - start) * 1000
+        size = _header_bytes(status, response_headers) + len(body)
+        if status == 304:
+            content = cached[2]
+        else:
+            assert status == 200, (path, params, status)
+            content = gzip.decompress(body) if response_headers.get('content-encoding') == 'gzip' else body
+        etag = response_headers.get('etag')
+        if etag or _max_age(response_headers.get('cache-control')):
+            self.cache[key] = (etag, time.time() + _max_age(response_headers.get('cache-control')), content)
+        return True, size, elapsed, content
+
+
+def _phase(results):
+    requested = [item for item in results if item[0]]
+    return {'requests': len(requested), 'bytes': sum(item[1] for item in requested),
+            'server_ms': round(sum(item[2] for item in requested), 2)}
+
+
+def _first_render(phases, rtt, mbps):
+    """
+    估算首屏时间：页面 -> 静态文件（并发CONNECTIONS个请求，共享带宽）-> 接口，各阶段依次进行
+    :param phases: 各阶段统计
+    :param rtt: 往返时延ms
+    :param mbps: 带宽Mbit/s
+    :return: ms
+    """
+    total = 0.0
+    for phase in phases:
+        if not phase['requests']:
+            continue
+        rounds = -(-phase['requests'] // CONNECTIONS)
+        total += rounds * rtt + phase['bytes'] * 8 / (mbps * 1000) + phase['server_ms']
+    return round(total, 1)
+
+
+async def _visit(browser, assets, date):
+    """
+    打开页面：页面 -> 静态文件 -> 首屏接口
+    :return: (各阶段统计, 各请求的内容)
+    """
+    page = [await browser.fetch('/')]
+    static = await asyncio.gather(*[browser.fetch(path) for path in assets])
+    apis = await asyncio.gather(*[browser.fetch(path, {'date': date}) for path in PAGE_APIS])
+    contents = [item[3] for item in page + list(static) + list(apis)]
+    return [_phase(page), _phase(static), _phase(apis)], contents
+
+
+async def _measure(app, assets, date, ranges):
+    browser = Browser(ASGIClient(app))
+    first, first_contents = await _visit(browser, assets, date)
+    repeat, repeat_contents = await _visit(browser, assets, date)
+    reports = {}
+    for name, params in ranges.items():
+        _, size, elapsed, content = await browser.fetch('/getRangeReport', params)
+        reports[name] = {'bytes': size, 'server_ms': round(elapsed, 2)}
+        first_contents.append(content)
+    return {'first': first, 'repeat': repeat, 'range': reports}, first_contents + repeat_contents
+
+
+def _summary(result):
+    summary = {}
+    for visit in ('first', 'repeat'):
+        phases = result[visit]
+        summary[visit] = {
+            'requests': sum(phase['requests'] for phase in phases),
+            'bytes': sum(phase['bytes'] for phase in phases),
+            'first_render_ms': {name: _first_render(phases, rtt, mbps) for name, (rtt, mbps) in LINKS.items()},
+        }
+    summary['range'] = result['range']
+    return summary
+
+
+def run(static_dir=None, years=1):
+    """
+    :param static_dir: 静态文件目录，默认生成模拟页面
+    :param years: 模拟数据年数
+    :return: 测试结果
+    """
+    import report_cache
+    import server
+    import static_assets
+
+    data_dir = storage.DATA_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DATA_DIR = os.path.join(tmp, 'data')
+        if static_dir is None:
+            static_dir = os.path.join(tmp, 'static')
+            _dashboard(static_dir)
+        static_dir = os.path.abspath(static_dir)
+        store = static_assets.store
+        directory, store.directory = store.directory, static_dir
+        try:
+            dates = [d for d in synthetic.generate(storage.DATA_DIR, years, 2022) if d.startswith('2022')]
+            if storage.BACKEND != 'csv':
+                storage.convert('csv', storage.BACKEND, verify=False)
+            storage.invalidate()
+            store.load()
+            assets = _assets(static_dir)
+            date = dates[-1]
+            ranges = {
+                'month_day': {'start': date[:6] + '01', 'end': date, 'granularity': 'day'},
+                'year_day': {'start': dates[0], 'end': date, 'granularity': 'day'},
+                'year_day_csv': {'start': dates[0], 'end': date, 'granularity': 'day', 'format': 'csv'},
+            }
+            # 预热：加载年度数据并生成报表，两种实现均在报表已缓存时比较
+            asyncio.run(_measure(server.app, assets, date, ranges))
+            before, before_contents = asyncio.run(_measure(baseline_app(server.app, static_dir), assets, date, ranges))
+            after, after_contents = asyncio.run(_measure(server.app, assets, date, ranges))
+            cache = report_cache.stats()
+        finally:
+            store.directory = directory
+            storage.DATA_DIR = data_dir
+            storage.invalidate()
+    return {
+        'params': {'assets': assets, 'links': LINKS, 'connections': CONNECTIONS, 'date': date},
+        'before': _summary(before),
+        'after': _summary(after),
+        'report_cache': cache,
+        # 解压后的内容与原实现一致
+        'identical': before_contents == after_contents,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='页面传输测试')
+    parser.add_argument('--static', default=None, help='静态文件目录，默认生成模拟页面')
+    parser.add_argument('--years', type=int, default=1)
+    args = parser.parse_args()
+    result = run(args.static, args.years)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if not result['identical']:
+        sys.exit(1)
@@ -0,0 +1,132 @@
+"""
+导入耗时测试：在新的解释器中以python -X importtime导入各模块，统计导入耗时（中位数）及耗时最多的依赖模块，
+并检查server（uvicorn各worker导入的模块）是否导入了应延迟导入的模块；
+与基准结果比较，导入耗时增加超过阈值或server导入了延迟导入的模块时以退出码1结束
+
+    python -m benchmark.import_time --output import.json
+    python -m benchmark.import_time --baseline import.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ('server', 'service', 'storage', 'schedule_service.otc_daily_rept')
+# server导入时不应加载的模块（查询模块在worker启动后导入，定时任务模块只在定时任务进程导入）
+LAZY = ('pandas', 'numpy', 'apscheduler', 'requests', 'storage', 'service', 'schedule_service.otc_daily_rept')
+TOP = 10
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse(stderr):
+    """
+    解析-X importtime输出
+    :param stderr: 标准错误输出
+    :return: [(模块名称, 层级, 自身耗时 单位：微秒, 累计耗时 单位：微秒)]
+    """
+    result = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            result.append((match.group(4), len(match.group(3)) // 2, int(match.group(1)), int(match.group(2))))
+    return result
+
+
+def measure(module, cwd):
+    """
+    在新的解释器中导入模块
+    :param module: 模块名称
+    :param cwd: 工作目录
+    :return: 导入记录，见parse
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                          cwd=cwd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError('导入%s失败：%s' % (module, proc.stderr.strip().splitlines()[-1]))
+    return parse(proc.stderr)
+
+
+def run(modules=MODULES, repeat=5):
+    """
+    :param modules: 模块列表
+    :param repeat: 每个模块的导入次数
+    :return: 测试结果
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # server按当前目录挂载static目录
+        os.makedirs(os.path.join(tmp, 'static'))
+        for module in modules:
+            samples = []
+            records = []
+            for _ in range(repeat):
+                records = measure(module, tmp)
+                samples.append(next(cumulative for name, level, own, cumulative in records if name == module))
+            samples.sort()
+            loaded = set(name for name, level, own, cumulative in records)
+            heaviest = sorted((r for r in records if r[1] == 1 and r[0] != module), key=lambda r: -r[3])[:TOP]
+            results.append({
+                'module': module,
+                'n': repeat,
+                'median_ms': round(statistics.median(samples) / 1000, 3),
+                'min_ms': round(samples[0] / 1000, 3),
+                'modules': len(loaded),
+                'heaviest': [{'module': name, 'cumulative_ms': round(cumulative / 1000, 3)}
+                             for name, level, own, cumulative in heaviest],
+                'lazy_loaded': sorted(name for name in LAZY if name in loaded) if module == 'server' else [],
+            })
+    return {'python': sys.version.split()[0], 'results': results}
+
+
+def compare(current, baseline, threshold=0.2):
+    """
+    与基准结果比较
+    :param current: 本次结果
+    :param baseline: 基准结果
+    :param threshold: 允许的耗时增加比例
+    :return: 性能退化的模块列表
+    """
+    base = {r['module']: r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = base.get(result['module'])
+        if old is None or old['median_ms'] <= 0:
+            continue
+        ratio = result['median_ms'] / old['median_ms'] - 1
+        if ratio > threshold:
+            regressions.append({
+                'module': result['module'],
+                'baseline_ms': old['median_ms'],
+                'current_ms': result['median_ms'],
+                'change': round(ratio, 3),
+            })
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='导入耗时测试')
+    parser.add_argument('--modules', nargs='+', default=list(MODULES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='结果输出文件，默认输出到标准输出')
+    parser.add_argument('--baseline', help='基准结果文件')
+    parser.add_argument('--threshold', type=float, default=0.2, help='允许的耗时增加比例')
+    args = parser.parse_args()
+    report = run(args.modules, args.repeat)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report['regressions'] = compare(report, json.load(f), args.threshold)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    if report.get('regressions') or any(r['lazy_loaded'] for r in report['results']):
+        sys.exit(1)
@@ -0,0 +1,165 @@
+"""
+日志写入测试：同步写文件（原utils.get_log：调用线程格式化并写入，每条记录刷新一次）与
+队列日志（logger.setup：调用线程只入队，后台线程批量写入）的调用耗时、全部写入耗时及刷新次数
+--slow-ms模拟磁盘繁忙（每次刷新的额外延迟）
+
+    python -m benchmark.log_write --records 20000 --threads 4 --slow-ms 0 1
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import statistics
+import tempfile
+import threading
+import time
+
+import logger
+
+
+class _SlowFile:
+    """
+    日志文件包装：统计刷新次数，每次刷新前等待delay秒
+    """
+
+    def __init__(self, f, delay):
+        self.f = f
+        self.delay = delay
+        self.flushes = 0
+
+    def write(self, data):
+        return self.f.write(data)
+
+    def flush(self):
+        self.flushes += 1
+        if self.delay:
+            time.sleep(self.delay)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class _SlowDailyFileHandler(logger.DailyFileHandler):
+    delay = 0
+
+    def _open(self, day):
+        super()._open(day)
+        self.stream = _SlowFile(self.stream, self.delay)
+
+
+def _emit(log, records, threads, legacy):
+    """
+    多个线程（模拟并发采集）写日志
+    :return: (调用耗时列表 单位：微秒, 调用线程总耗时 单位：秒)
+    """
+    per_thread = records // threads
+    samples = [[] for _ in range(threads)]
+
+    def work(out):
+        for i in range(per_thread):
+            start = time.perf_counter()
+            if legacy:
+                log.info('### 标准仓单信息采集服务 采集' + str(i) + '条结果')
+            else:
+                log.info('### 标准仓单信息采集服务 采集%d条结果', i, extra={'date': '20220720', 'type': 'wbill'})
+            out.append((time.perf_counter() - start) * 1e6)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=work, args=(out,)) for out in samples]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [sample for out in samples for sample in out], time.perf_counter() - start
+
+
+def _summary(samples, emit_seconds, total_seconds, flushes, path):
+    samples.sort()
+    return {
+        'calls': len(samples),
+        'call_median_us': round(statistics.median(samples), 2),
+        'call_p99_us': round(samples[int(len(samples) * 0.99)], 2),
+        'call_max_us': round(samples[-1], 2),
+        'emit_seconds': round(emit_seconds, 4),
+        'total_seconds': round(total_seconds, 4),
+        'flushes': flushes,
+        'bytes': os.path.getsize(path),
+    }
+
+
+def run_legacy(directory, records, threads, delay):
+    """
+    原实现：StreamHandler写入日志文件，调用线程格式化消息并刷新
+    """
+    path = os.path.join(directory, 'legacy.log')
+    stream = _SlowFile(open(path, 'a', encoding='utf-8'), delay)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(logger.TEXT_FORMAT, logger.TEXT_DATEFMT))
+    log = logging.getLogger('benchmark.log_write.legacy')
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.addHandler(handler)
+    try:
+        start = time.perf_counter()
+        samples, emit_seconds = _emit(log, records, threads, legacy=True)
+        total_seconds = time.perf_counter() - start
+    finally:
+        log.removeHandler(handler)
+        stream.close()
+    return _summary(samples, emit_seconds, total_seconds, stream.flushes, path)
+
+
+def run_queue(directory, records, threads, delay):
+    """
+    队列日志：调用线程入队，后台线程格式化为JSON并批量写入
+    """
+    handler = _SlowDailyFileHandler(directory, prefix='queue')
+    handler.delay = delay
+    handler.setFormatter(logger.JsonFormatter())
+    # 队列足够大，测试中不丢弃记录
+    records_queue = queue.Queue(records + 1)
+    writer = logger._Writer(records_queue, [handler])
+    writer.start()
+    log = logging.getLogger('benchmark.log_write.queue')
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    queue_handler = logger._QueueHandler(records_queue)
+    log.addHandler(queue_handler)
+    try:
+        start = time.perf_counter()
+        samples, emit_seconds = _emit(log, records, threads, legacy=False)
+        records_queue.put(logger._STOP)
+        writer.join()
+        total_seconds = time.perf_counter() - start
+    finally:
+        log.removeHandler(queue_handler)
+    flushes = handler.stream.flushes
+    path = handler.stream.f.name
+    handler.close()
+    return _summary(samples, emit_seconds, total_seconds, flushes, path)
+
+
+def run(records=20000, threads=4, slow_ms=(0, 1)):
+    """
+    :param records: 日志记录数
+    :param threads: 写日志的线程数
+    :param slow_ms: 每次刷新的模拟延迟列表 单位：毫秒
+    :return: 测试结果列表
+    """
+    results = []
+    for delay in slow_ms:
+        with tempfile.TemporaryDirectory() as tmp:
+            results.append(dict(mode='legacy', slow_ms=delay, **run_legacy(tmp, records, threads, delay / 1000)))
+            results.append(dict(mode='queue', slow_ms=delay, **run_queue(tmp, records, threads, delay / 1000)))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='日志写入测试')
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--slow-ms', type=float, nargs='+', default=[0, 1])
+    args = parser.parse_args()
+    print(json.dumps(run(args.records, args.threads, args.slow_ms), indent=2))
@@ -0,0 +1,99 @@
+"""
+分页采集检查：以本地模拟接口（benchmark.dce_stub）检查iter_rows及collect的结果记录数与接口请求数
+（返回/不返回总记录数、记录数为每页记录数的整数倍、无记录，以及不按日期查询的wbillApplyList遇到历史记录时停止分页）
+
+    python -m benchmark.paging_check
+
+检查项不通过时以退出码1结束
+"""
+import argparse
+import json
+import sys
+import tempfile
+
+import storage
+from benchmark import dce_stub
+from schedule_service import otc_daily_rept
+
+DATE = '20220720'
+# 不按日期查询的接口返回的历史记录数
+HISTORY = 20000
+
+
+def _iter_case(api, rows, with_total, history=0):
+    """
+    :return: (结果记录数, 当日记录数, 接口请求数)
+    """
+    api_url = otc_daily_rept.API_URL
+    server, otc_daily_rept.API_URL = dce_stub.start(rows=rows, with_total=with_total, date=DATE, history=history)
+    try:
+        payload = otc_daily_rept.wbill_requests(DATE)[api]
+        result = list(otc_daily_rept.iter_rows(api, payload, stop=otc_daily_rept.stop_condition(api, DATE)))
+    finally:
+        server.shutdown()
+        otc_daily_rept.API_URL = api_url
+    day = sum(1 for row in result if row['opDate'] == DATE)
+    return len(result), day, server.RequestHandlerClass.hits.get(api, 0)
+
+
+def _collect_case(rows, with_total):
+    """
+    完整采集：wbillApplyList只请求到当日记录所在的分页，交易笔数为当日记录数
+    采集结果的原始记录归档写入临时数据目录
+    """
+    data_dir = storage.DATA_DIR
+    api_url = otc_daily_rept.API_URL
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DATA_DIR = tmp
+        server, otc_daily_rept.API_URL = dce_stub.start(rows=rows, with_total=with_total, date=DATE, history=HISTORY)
+        try:
+            records, errors = otc_daily_rept.collect(DATE)
+        finally:
+            server.shutdown()
+            otc_daily_rept.API_URL = api_url
+            storage.DATA_DIR = data_dir
+    return {'errors': sorted(errors), 'wbill_trade_num': records['wbill'][4],
+            'hits': dict(sorted(server.RequestHandlerClass.hits.items()))}
+
+
+def run():
+    """
+    :return: 检查结果
+    """
+    limit = otc_daily_rept.wbill_requests(DATE)['wbillMatchList']['limit']
+    apply_limit = otc_daily_rept.wbill_requests(DATE)['wbillApplyList']['limit']
+    # 名称 -> (接口, 当日记录数, 是否返回总记录数, 历史记录数, 期望的请求数)
+    cases = {
+        'total': ('wbillMatchList', 2 * limit + limit // 2, True, 0, 3),
+        'no_total': ('wbillMatchList', 2 * limit + limit // 2, False, 0, 3),
+        'exact_multiple_total': ('wbillMatchList', 2 * limit, True, 0, 2),
+        # 不返回总记录数时只能以不足一页（空页）判断结束
+        'exact_multiple_no_total': ('wbillMatchList', 2 * limit, False, 0, 3),
+        'empty': ('wbillMatchList', 0, True, 0, 1),
+        'apply_history': ('wbillApplyList', apply_limit // 2, True, HISTORY, 1),
+        'apply_history_no_total': ('wbillApplyList', apply_limit // 2, False, HISTORY, 1),
+        'apply_history_pages': ('wbillApplyList', apply_limit + apply_limit // 2, True, HISTORY, 2),
+        'apply_exact_multiple': ('wbillApplyList', apply_limit, True, HISTORY, 2),
+        'apply_no_history': ('wbillApplyList', apply_limit, True, 0, 1),
+    }
+    results = {}
+    checks = {}
+    for name, (api, rows, with_total, history, expected) in cases.items():
+        count, day, hits = _iter_case(api, rows, with_total, history)
+        results[name] = {'rows': rows, 'returned': count, 'day_rows': day, 'requests': hits, 'expected': expected}
+        checks[name] = day == rows and hits == expected and (history > 0 or count == rows)
+    results['collect'] = _collect_case(250, True)
+    results['collect_no_total'] = _collect_case(250, False)
+    for name in ('collect', 'collect_no_total'):
+        item = results[name]
+        checks[name] = not item['errors'] and item['wbill_trade_num'] == 250 and item['hits']['wbillApplyList'] == 1
+    return {'results': results, 'checks': checks}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='分页采集检查')
+    parser.parse_args()
+    result = run()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if not all(result['checks'].values()):
+        sys.exit(1)
@@ -0,0 +1,134 @@
+"""
+推送测试：N个订阅者订阅同一日期，模拟采集时段内的K次数据变更，统计报表生成次数、推送消息数及
+数据写入到全部订阅者收到推送的延迟；与客户端每poll秒轮询一次/getOptReport、/tradeInfo的请求数比较；
+并检查订阅失败（日期的年度数据不存在）后不残留订阅者
+
+    python -m benchmark.push_fanout --subscribers 10 100 1000 --changes 5
+
+检查项不通过时以退出码1结束
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+
+import report_cache
+import report_push
+import service
+import storage
+from benchmark import synthetic
+
+# 采集时段 18:00~20:00
+WINDOW_SECONDS = 2 * 3600
+# 订阅失败检查使用的日期（年度数据不存在）
+MISSING_DATE = '20300105'
+
+
+async def _run(subscribers, changes, date):
+    hub = report_push.Hub(interval=0.05)
+    queues = [await hub.subscribe(date) for _ in range(subscribers)]
+    for queue in queues:
+        while not queue.empty():
+            queue.get_nowait()
+    misses = report_cache.stats()['misses']
+    latencies = []
+    received = 0
+    for i in range(changes):
+        start = time.perf_counter()
+        # 测试用Hub未注册storage监听，同其他进程写入，由定时检查发现
+        await service.run_blocking(storage.update_record, date, 'swap', {'turnover': 10000.0 * (i + 1)})
+        storage.invalidate()
+        for queue in queues:
+            await queue.get()
+            received += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+        for queue in queues:
+            while not queue.empty():
+                queue.get_nowait()
+                received += 1
+    await asyncio.sleep(hub.interval * 2)
+    for queue in queues:
+        received += queue.qsize()
+        hub.unsubscribe(date, queue)
+    await asyncio.sleep(hub.interval * 2)
+    return {
+        'report_builds': report_cache.stats()['misses'] - misses,
+        'messages': received,
+        'latency_median_ms': round(statistics.median(latencies), 2),
+        'latency_max_ms': round(max(latencies), 2),
+    }
+
+
+async def _check_failed_subscribe(attempts=3):
+    """
+    订阅年度数据不存在的日期：每次订阅均失败，失败后不残留订阅者，后台检查任务结束
+    """
+    hub = report_push.Hub(interval=0.05)
+    failures = 0
+    for _ in range(attempts):
+        try:
+            await hub.subscribe(MISSING_DATE)
+        except Exception:
+            failures += 1
+    # 同/subscribe接口：取首条消息时订阅失败
+    stream_failures = 0
+    for _ in range(attempts):
+        events = report_push.stream(MISSING_DATE)
+        try:
+            await events.__anext__()
+        except Exception:
+            stream_failures += 1
+    await asyncio.sleep(hub.interval * 4)
+    return {
+        'failures': failures,
+        'stream_failures': stream_failures,
+        'subscribers': hub.subscribers + report_push.hub.subscribers,
+        'topics': len(hub.topics) + len(report_push.hub.topics),
+        'task_done': hub.task is None or hub.task.done(),
+    }
+
+
+def run(subscriber_counts=(10, 100, 1000), changes=5, poll=10):
+    """
+    :param subscriber_counts: 订阅者数列表
+    :param changes: 数据变更次数
+    :param poll: 对比的客户端轮询间隔 单位：秒
+    :return: 测试结果及检查项
+    """
+    data_dir = storage.DATA_DIR
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DATA_DIR = tmp
+        try:
+            dates = synthetic.generate(tmp, 1, 2022)
+            if storage.BACKEND != 'csv':
+                storage.convert('csv', storage.BACKEND, verify=False)
+            storage.invalidate()
+            for count in subscriber_counts:
+                result = asyncio.run(_run(count, changes, dates[-1]))
+                results.append(dict(subscribers=count, changes=changes,
+                                    poll_requests=count * 2 * WINDOW_SECONDS // poll, **result))
+            failed = asyncio.run(_check_failed_subscribe())
+        finally:
+            storage.DATA_DIR = data_dir
+            storage.invalidate()
+    checks = {
+        'failed_subscribe_released': failed['failures'] == failed['stream_failures'] == 3 and
+                                     failed['subscribers'] == 0 and failed['topics'] == 0 and failed['task_done'],
+    }
+    return {'results': results, 'failed_subscribe': failed, 'checks': checks}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='推送测试')
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--changes', type=int, default=5)
+    parser.add_argument('--poll', type=int, default=10, help='对比的客户端轮询间隔（秒）')
+    args = parser.parse_args()
+    result = run(args.subscribers, args.changes, args.poll)
+    print(json.dumps(result, indent=2))
+    if not all(result['checks'].values()):
+        sys.exit(1)
@@ -0,0 +1,199 @@
+"""
+日报生成性能测试：向量化报表引擎与原逐字段标量查询实现对比
+
+    python -m benchmark.report_engine --years 3 --repeat 200
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+import report_engine
+import service as sv
+import storage
+from benchmark import synthetic
+
+
+def legacy_build_opt_report(date):
+    """
+    原日报生成实现（逐字段标量查询），作为性能对比基准
+    """
+    volume_unit = 10000
+    turnover_unit = 100000000
+    data = sv.query_daily_rept(date)
+    if data['daily_data'].shape[0] == 0:
+        return {
+            "Status": 100
+        }
+    daily_data = data['daily_data'].astype({'date': 'str'}).set_index(['date', 'type'])
+    last5_data_type = data['last5_data'].reset_index().set_index('type')
+    last5_data = data['last5_data'].reset_index()
+    month_data = data['month_data']
+    year_data = data['year_data']
+
+    day_wbill_num = int(daily_data['trade_num'][(date, 'wbill')])
+    day_wbill_varietys = str(daily_data['variety_names'][(date, 'wbill')])
+    day_wbill_volume = round(daily_data['volume'][(date, 'wbill')] / volume_unit, 2)
+    day_wbill_turnover = round(daily_data['turnover'][(date, 'wbill')] / turnover_unit, 2)
+
+    day_nonwbill_num = int(daily_data['trade_num'][(date, 'nonwbill')])
+    day_nonwbill_varietys = daily_data['variety_names'].fillna('')[(date, 'nonwbill')]
+    day_nonwbill_volume = round(daily_data['volume'][(date, 'nonwbill')] / volume_unit, 2)
+    day_nonwbill_turnover = round(daily_data['turnover'][(date, 'nonwbill')] / turnover_unit, 2)
+
+    day_basis_num = int(daily_data['trade_num'][(date, 'basis')])
+    day_basis_varietys = daily_data['variety_names'].fillna('')[(date, 'basis')]
+    day_basis_volume = round(daily_data['volume'][(date, 'basis')] / volume_unit, 2)
+    day_basis_turnover = round(daily_data['turnover'][(date, 'basis')] / turnover_unit, 2)
+
+    daily_sum_turnover = round(
+        day_wbill_turnover + day_nonwbill_turnover + day_basis_turnover, 2)
+    daily_sum_volume = round(
+        day_wbill_volume + day_nonwbill_volume + day_basis_volume, 2)
+    month_sum_turnover = round(month_data['turnover'].sum() / turnover_unit, 2)
+
+    last5_wbill = (last5_data_type['turnover']['wbill'] / turnover_unit).round(2).values
+    last5_nonwbill = (last5_data_type['turnover']['nonwbill'] / turnover_unit).round(2).values
+    last5_basis = (last5_data_type['turnover']['basis'] / turnover_unit).round(2).values
+    last5_sum = (last5_wbill + last5_nonwbill + last5_basis).round(2)
+
+    year_wbill_num = int(year_data['trade_num']['wbill'])
+    year_wbill_volume = (year_data['volume']['wbill'] / volume_unit).round(2)
+    year_wbill_turnover = (year_data['turnover']['wbill'] / turnover_unit).round(2)
+
+    year_nonwbill_num = int(year_data['trade_num']['nonwbill'])
+    year_nonwbill_volume = (year_data['volume']['nonwbill'] / volume_unit).round(2)
+    year_nonwbill_turnover = (year_data['turnover']['nonwbill'] / turnover_unit).round(2)
+
+    year_basis_num = int(year_data['trade_num']['basis'])
+    year_basis_volume = (year_data['volume']['basis'] / volume_unit).round(2)
+    year_basis_turnover = (year_data['turnover']['basis'] / turnover_unit).round(2)
+
+    year_swap_num = int(year_data['trade_num']['swap'])
+    year_swap_turnover = (year_data['turnover']['swap'] / turnover_unit).round(2)
+
+    year_opt_num = int(year_data['trade_num']['opt'])
+    year_opt_turnover = (year_data['turnover']['opt'] / turnover_unit).round(2)
+
+    year_sum_volume = (year_wbill_volume + year_nonwbill_volume + year_basis_volume).round(2)
+    year_sum_turnover = (year_wbill_turnover + year_nonwbill_turnover + year_basis_turnover + year_swap_turnover + year_opt_turnover).round(2)
+
+    daily = {
+        "daily_sum": '%.2f' % daily_sum_turnover,
+        "daily_volume_sum": '%.2f' % daily_sum_volume,
+        "month_sum": '%.2f' % month_sum_turnover,
+        "year_sum": '%.2f' % year_sum_turnover,
+        "wbill": {
+            "num": day_wbill_num,
+            "varietys": day_wbill_varietys,
+            "volume": '%.2f' % day_wbill_volume,
+            "turnover": '%.2f' % day_wbill_turnover
+        },
+        "non_wbill": {
+            "num": day_nonwbill_num,
+            "varietys": day_nonwbill_varietys,
+            "volume": '%.2f' % day_nonwbill_volume,
+            "turnover": '%.2f' % day_nonwbill_turnover
+        },
+        "index_basis": {
+            "num": day_basis_num,
+            "varietys": day_basis_varietys,
+            "volume": '%.2f' % day_basis_volume,
+            "turnover": '%.2f' % day_basis_turnover
+        },
+    }
+
+    weekly = {
+        "dates": [str(int(date[4:6])) + '月' + str(int(date[6:8])) + '日' for date in
+                  last5_data['date'].drop_duplicates().values.tolist()],
+        "wbill": last5_wbill.tolist(),
+        "non_wbill": last5_nonwbill.tolist(),
+        "index_basis": last5_basis.tolist(),
+        "sum": ['%.2f' % s for s in last5_sum.tolist()]
+    }
+
+    yearly = {
+        "wbill": {
+            "num": year_wbill_num,
+            "volume": '%.2f' % year_wbill_volume,
+            "turnover": '%.2f' % year_wbill_turnover
+        },
+        "non_wbill": {
+            "num": year_nonwbill_num,
+            "volume": '%.2f' % year_nonwbill_volume,
+            "turnover": '%.2f' % year_nonwbill_turnover
+        },
+        "index_basis": {
+            "num": year_basis_num,
+            "volume": '%.2f' % year_basis_volume,
+            "turnover": '%.2f' % year_basis_turnover
+        },
+        "swap": {
+            "num": year_swap_num,
+            "turnover": '%.2f' % year_swap_turnover
+        },
+        "opt": {
+            "num": year_opt_num,
+            "turnover": '%.2f' % year_opt_turnover
+        },
+        "sum": {
+            "num": int(year_data['trade_num'].sum()),
+            "volume": '%.2f' % year_sum_volume,
+            "turnover": '%.2f' % year_sum_turnover
+        }
+    }
+
+    return {
+        "Status": 200,
+        "daily": daily,
+        "weekly": weekly,
+        "yearly": yearly,
+    }
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return {'median_us': round(statistics.median(samples), 1), 'p99_us': round(sorted(samples)[int(len(samples) * 0.99) - 1], 1)}
+
+
+def run(years=3, repeat=200, end_year=2022):
+    """
+    :param years: 模拟数据年数
+    :param repeat: 每项重复次数
+    :param end_year: 截止年份
+    :return: 测试结果
+    """
+    results = []
+    data_dir = storage.DATA_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic.generate(tmp, years, end_year)
+        storage.DATA_DIR = tmp
+        try:
+            for date in (str(end_year) + '0104', str(end_year) + '0630'):
+                legacy = legacy_build_opt_report(date)
+                engine = report_engine.build_opt_report(date)
+                # 原实现当日无标准仓单成交时品种输出为'nan'，引擎统一输出空字符串
+                same_output = json.dumps(legacy).replace('"nan"', '""') == json.dumps(engine)
+                results.append({
+                    'date': date,
+                    'same_output': same_output,
+                    'legacy': _timed(lambda: legacy_build_opt_report(date), repeat),
+                    'engine': _timed(lambda: report_engine.build_opt_report(date), repeat),
+                })
+        finally:
+            storage.DATA_DIR = data_dir
+            storage.invalidate()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='日报生成性能测试')
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.years, args.repeat), indent=2))
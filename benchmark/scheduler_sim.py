@@ -0,0 +1,291 @@
+"""
+定时采集模拟：模拟时钟驱动schedule_service.scheduler.Poller，本地模拟接口按模拟时间发布数据
+（发布前无记录，PUBLISH后发布，REVISE后修订），连续模拟若干交易日，其间服务停止DOWNTIME个交易日，
+统计每日采集次数、接口请求数、数据发布到保存的延迟，与原定时任务（18点至20点每10分钟）比较（接口请求数不多于原定时任务）；
+并检查补采时数据尚未发布的日期不标记完成、采集状态丢失后补采不覆盖人工录入的场外期权数据、定时任务锁（同时只有一个实例运行，锁释放后其他实例接替）
+
+    python -m benchmark.scheduler_sim --days 8 --downtime 3
+
+检查项不通过时以退出码1结束
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import storage
+from benchmark import dce_stub, synthetic
+from schedule_service import collect_state, otc_daily_rept, scheduler
+
+PUBLISH = '18:37'
+REVISE = '19:05'
+# 发布及修订后的每个接口记录数
+PUBLISH_ROWS = 40
+REVISE_ROWS = 60
+# 原定时任务：18点至20点每10分钟
+CRON_TIMES = ['%02d:%02d' % (hour, minute) for hour in (18, 19, 20) for minute in range(0, 60, 10)]
+
+
+class _Clock:
+    def __init__(self, now):
+        self.now = now
+
+
+def _rows(date, now):
+    """
+    模拟时间now时接口返回的date日记录数
+    """
+    day = now.strftime('%Y%m%d')
+    if date < day or now >= scheduler._at(date, REVISE):
+        return REVISE_ROWS
+    if now >= scheduler._at(date, PUBLISH):
+        return PUBLISH_ROWS
+    return 0
+
+
+def _prepare(tmp, days):
+    """
+    生成模拟数据，删除最后days个交易日的记录（待采集），之前的交易日标记为已完成
+    :return: 模拟的交易日列表
+    """
+    dates = synthetic.generate(tmp, 1, 2022)
+    sim_dates = dates[-days:]
+    backend = storage.get_backend()
+    df = backend.read_year('2022')
+    backend.save_year('2022', df[~df['date'].isin(sim_dates)])
+    storage.invalidate()
+    with collect_state.CollectState.locked() as state:
+        for date in dates[-days - scheduler.CATCHUP_DAYS:-days]:
+            state.mark_complete(date)
+    return sim_dates
+
+
+def _saved(date):
+    record = storage.get_record(date, 'wbill')
+    return 0 if record is None else int(record['trade_num'])
+
+
+def simulate(days=8, downtime=3, tick=scheduler.TICK, cron=False):
+    """
+    :param days: 模拟的交易日数
+    :param downtime: 服务停止的交易日数（从第3个交易日起）
+    :param tick: 模拟的检查间隔 单位：秒
+    :param cron: True 模拟原定时任务
+    :return: (每日统计, 接口请求数)
+    """
+    data_dir = storage.DATA_DIR
+    api_url = otc_daily_rept.API_URL
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DATA_DIR = tmp
+        server, otc_daily_rept.API_URL = dce_stub.start(rows=0)
+        handler = server.RequestHandlerClass
+        try:
+            sim_dates = _prepare(tmp, days)
+            down = set(sim_dates[2:2 + downtime])
+            clock = _Clock(None)
+            runs = []
+
+            def run_job(date):
+                handler.default_rows = _rows(date, clock.now)
+                handler.date = date
+                before = sum(handler.hits.values())
+                try:
+                    return otc_daily_rept.job(date)
+                finally:
+                    runs.append((clock.now, date, sum(handler.hits.values()) - before))
+
+            poller = scheduler.Poller(run_job)
+            # 从第一个模拟交易日零点到最后一个交易日结束，服务停止期间不检查
+            day = datetime.datetime.strptime(sim_dates[0], '%Y%m%d')
+            end = datetime.datetime.strptime(sim_dates[-1], '%Y%m%d') + datetime.timedelta(days=1)
+            step = datetime.timedelta(seconds=tick)
+            clock.now = day
+            while clock.now < end:
+                date = clock.now.strftime('%Y%m%d')
+                if date not in down:
+                    if cron:
+                        if date in sim_dates and clock.now.strftime('%H:%M') in CRON_TIMES and \
+                                clock.now.second < tick:
+                            run_job(date)
+                    else:
+                        poller.tick(clock.now)
+                clock.now += step
+
+            state = collect_state.CollectState.load()
+            stats = []
+            for date in sim_dates:
+                day_runs = [now for now, d, _ in runs if d == date]
+                published = scheduler._at(date, PUBLISH)
+                revised = scheduler._at(date, REVISE)
+                after = lambda t: next((now for now in day_runs if now >= t), None)
+                stats.append({
+                    'date': date,
+                    'down': date in down,
+                    'runs': len(day_runs),
+                    # 当日采集时段内（不含补采）的接口请求数
+                    'window_requests': sum(n for now, d, n in runs if d == date and now.strftime('%Y%m%d') == date),
+                    'first_run': day_runs[0].strftime('%m-%d %H:%M') if day_runs else None,
+                    'last_run': day_runs[-1].strftime('%m-%d %H:%M') if day_runs else None,
+                    'publish_latency_s': (after(published) - published).seconds if after(published) else None,
+                    'revise_latency_s': (after(revised) - revised).seconds if after(revised) else None,
+                    'complete': state.is_complete(date),
+                    'saved_trade_num': _saved(date),
+                })
+            requests = sum(handler.hits.values())
+        finally:
+            server.shutdown()
+            storage.DATA_DIR = data_dir
+            otc_daily_rept.API_URL = api_url
+            storage.invalidate()
+    return stats, requests
+
+
+def check_catch_up():
+    """
+    补采：接口无记录（数据尚未发布）时不标记完成，发布后再次补采时标记完成
+    :return: 检查结果
+    """
+    data_dir = storage.DATA_DIR
+    api_url = otc_daily_rept.API_URL
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DATA_DIR = tmp
+        server, otc_daily_rept.API_URL = dce_stub.start(rows=0)
+        handler = server.RequestHandlerClass
+        try:
+            date = _prepare(tmp, 1)[0]
+            handler.date = date
+            poller = scheduler.Poller()
+            # 次日零点补采
+            now = datetime.datetime.strptime(date, '%Y%m%d') + datetime.timedelta(days=1)
+            poller.catch_up(now)
+            unpublished = collect_state.CollectState.load().is_complete(date)
+            handler.default_rows = REVISE_ROWS
+            poller.catch_up(now)
+            published = collect_state.CollectState.load().is_complete(date)
+        finally:
+            server.shutdown()
+            storage.DATA_DIR = data_dir
+            otc_daily_rept.API_URL = api_url
+            storage.invalidate()
+    return {'unpublished_complete': unpublished, 'published_complete': published,
+            'ok': not unpublished and published}
+
+
+def check_manual():
+    """
+    采集状态丢失（首次部署、状态文件损坏）后补采：已有日期重新写入，人工录入的场外期权数据保留原值
+    :return: 检查结果
+    """
+    data_dir = storage.DATA_DIR
+    api_url = otc_daily_rept.API_URL
+    manual = {'turnover': 1234.5, 'trade_num': 3, 'variety_names': '豆粕'}
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DATA_DIR = tmp
+        server, otc_daily_rept.API_URL = dce_stub.start(rows=REVISE_ROWS)
+        try:
+            date = synthetic.generate(tmp, 1, 2022)[-1]
+            storage.invalidate()
+            server.RequestHandlerClass.date = date
+            storage.upsert_records([(date, 'opt', '', '', 0, 0, 0)])
+            storage.update_record(date, 'opt', manual)
+            now = datetime.datetime.strptime(date, '%Y%m%d') + datetime.timedelta(days=1)
+            caught_up = date in scheduler.Poller().catch_up(now)
+            record = storage.get_record(date, 'opt')
+            wbill = storage.get_record(date, 'wbill')
+        finally:
+            server.shutdown()
+            storage.DATA_DIR = data_dir
+            otc_daily_rept.API_URL = api_url
+            storage.invalidate()
+    kept = all(record[field] == value for field, value in manual.items())
+    return {'caught_up': caught_up, 'manual_kept': kept, 'wbill_trade_num': int(wbill['trade_num']),
+            'ok': caught_up and kept and int(wbill['trade_num']) == REVISE_ROWS}
+
+
+def check_leader():
+    """
+    定时任务锁：持有锁时其他实例不运行，释放后接替
+    :return: 检查结果
+    """
+    data_dir = storage.DATA_DIR
+    retry = scheduler.LEADER_RETRY
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DATA_DIR = tmp
+        scheduler.LEADER_RETRY = 0.2
+        ticks = []
+
+        class _Poller:
+            def tick(self):
+                ticks.append(time.monotonic())
+
+        stop = threading.Event()
+        try:
+            with storage.file_lock(os.path.join(tmp, scheduler.LOCK_NAME), timeout=0):
+                thread = threading.Thread(target=scheduler.serve, args=(stop, 1, _Poller()), daemon=True)
+                thread.start()
+                time.sleep(1)
+                standby_ticks = len(ticks)
+            time.sleep(1.5)
+            leader_ticks = len(ticks)
+        finally:
+            stop.set()
+            scheduler.LEADER_RETRY = retry
+            storage.DATA_DIR = data_dir
+        thread.join(5)
+    return {'standby_ticks': standby_ticks, 'leader_ticks': leader_ticks,
+            'ok': standby_ticks == 0 and leader_ticks > 0}
+
+
+def _window_requests(stats):
+    return sum(item['window_requests'] for item in stats)
+
+
+def run(days=8, downtime=3, tick=scheduler.TICK):
+    """
+    :return: 模拟结果及检查项
+    """
+    adaptive, adaptive_requests = simulate(days, downtime, tick)
+    cron, cron_requests = simulate(days, downtime, tick, cron=True)
+    catch_up = check_catch_up()
+    manual = check_manual()
+    leader = check_leader()
+    checks = {
+        'all_complete': all(item['complete'] for item in adaptive),
+        # 保存的是修订后的数据
+        'all_revised': all(item['saved_trade_num'] == REVISE_ROWS for item in adaptive),
+        'caught_up': all(item['runs'] > 0 for item in adaptive if item['down']),
+        # 采集时段内的接口请求数不多于原定时任务（补采为原定时任务没有的请求，另行统计）
+        'requests_not_above_cron': _window_requests(adaptive) <= _window_requests(cron),
+        'catch_up_unpublished': catch_up['ok'],
+        'catch_up_keeps_manual': manual['ok'],
+        'leader_lock': leader['ok'],
+    }
+    return {
+        'params': {'days': days, 'downtime': downtime, 'tick': tick, 'publish': PUBLISH, 'revise': REVISE,
+                   'wait': scheduler.WAIT_INTERVAL, 'fast': scheduler.FAST_INTERVAL, 'backoff': scheduler.BACKOFF_INTERVAL,
+                   'slow': scheduler.SLOW_INTERVAL},
+        'adaptive': {'requests': adaptive_requests, 'window_requests': _window_requests(adaptive),
+                     'runs': sum(item['runs'] for item in adaptive), 'days': adaptive},
+        'cron': {'requests': cron_requests, 'window_requests': _window_requests(cron),
+                 'runs': sum(item['runs'] for item in cron), 'days': cron},
+        'catch_up': catch_up,
+        'manual': manual,
+        'leader': leader,
+        'checks': checks,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='定时采集模拟')
+    parser.add_argument('--days', type=int, default=8)
+    parser.add_argument('--downtime', type=int, default=3)
+    parser.add_argument('--tick', type=int, default=scheduler.TICK)
+    args = parser.parse_args()
+    result = run(args.days, args.downtime, args.tick)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if not all(result['checks'].values()):
+        sys.exit(1)
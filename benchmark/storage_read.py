@@ -0,0 +1,66 @@
+"""
+各存储格式下query_daily_rept读取延迟测试（冷读取：每次调用前清空数据表缓存）
+
+    python -m benchmark.storage_read --years 1 5 10 --repeat 20
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+import service
+import storage
+from benchmark import synthetic
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(samples), 3), 'max_ms': round(max(samples), 3)}
+
+
+def run(year_counts=(1, 5, 10), backends=None, repeat=20, end_year=2022):
+    """
+    :param year_counts: 模拟数据年数列表
+    :param backends: 存储格式名称列表，默认全部
+    :param repeat: 每项重复次数
+    :param end_year: 截止年份
+    :return: 测试结果列表
+    """
+    backends = backends or sorted(storage.BACKENDS)
+    # 年初日期需读取上一年度数据（跨年取前5个交易日）
+    dates = [str(end_year) + '0104', str(end_year) + '0630']
+    results = []
+    data_dir, backend = storage.DATA_DIR, storage.BACKEND
+    try:
+        for years in year_counts:
+            with tempfile.TemporaryDirectory() as tmp:
+                synthetic.generate(tmp, years, end_year)
+                storage.DATA_DIR = tmp
+                for name in backends:
+                    storage.convert('csv', name, verify=False)
+                    storage.BACKEND = name
+                    for date in dates:
+                        def cold():
+                            storage.invalidate()
+                            service.query_daily_rept(date)
+                        results.append(dict(backend=name, years=years, date=date,
+                                            cold=_timed(cold, repeat),
+                                            warm=_timed(lambda: service.query_daily_rept(date), repeat)))
+    finally:
+        storage.DATA_DIR, storage.BACKEND = data_dir, backend
+        storage.invalidate()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='存储格式读取延迟测试')
+    parser.add_argument('--years', type=int, nargs='*', default=[1, 5, 10])
+    parser.add_argument('--backends', nargs='*', choices=sorted(storage.BACKENDS))
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.years, args.backends, args.repeat), indent=2))
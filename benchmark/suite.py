@@ -0,0 +1,231 @@
+"""
+性能测试套件：按不同数据年数生成模拟数据，测试查询、日报接口、数据保存及完整采集任务耗时，输出JSON结果，
+与上一版本的结果比较即可发现性能退化
+
+    python -m benchmark.suite --years 1 5 10 20 --output bench.json
+    python -m benchmark.suite --years 1 5 --baseline bench.json --threshold 0.2
+
+测试项：
+    query_swap_info        单条记录查询
+    query_daily_rept_cold  日报数据查询（每次清空数据表缓存）
+    query_daily_rept_warm  日报数据查询（缓存命中）
+    get_opt_report_miss    /getOptReport（每次重新生成报表）
+    get_opt_report_hit     /getOptReport（报表缓存命中）
+    query_variety_total    品种报表（全部年度、全部品种合计）
+    query_variety_month    品种报表（全部年度按月汇总，单个品种）
+    save_data              单条记录保存（写入年度数据文件）
+    job                    完整采集任务（本地模拟接口，并发采集并保存）
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmark import dce_stub, synthetic
+from benchmark.asgi_load import ASGIClient
+
+END_YEAR = 2022
+
+
+def _timed(fn, repeat):
+    """
+    重复执行并统计耗时
+    :param fn: 被测函数
+    :param repeat: 重复次数
+    :return: 耗时统计 单位：毫秒
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'n': repeat,
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(int(repeat * 0.95), repeat - 1)], 3),
+        'min_ms': round(samples[0], 3),
+    }
+
+
+def environment():
+    """
+    测试环境信息
+    :return: dict
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    import storage
+    return {
+        'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'storage': storage.BACKEND,
+    }
+
+
+def run_years(years, repeat, job_repeat, stub_rows):
+    """
+    在模拟数据目录中执行全部测试项
+    :param years: 模拟数据年数
+    :param repeat: 查询类测试重复次数
+    :param job_repeat: 保存及采集任务重复次数
+    :param stub_rows: 模拟接口每个接口每日记录数
+    :return: 测试项 -> 耗时统计
+    """
+    import report_cache
+    import server
+    import service
+    import storage
+    from schedule_service import otc_daily_rept
+
+    data_dir = os.path.join(os.getcwd(), 'data')
+    dates = synthetic.generate(data_dir, years, END_YEAR)
+    storage.DATA_DIR = data_dir
+    if storage.BACKEND != 'csv':
+        storage.convert('csv', storage.BACKEND, verify=False)
+    storage.invalidate()
+    date =[d for d in dates if d.startswith(str(END_YEAR))][120]
+    client = ASGIClient(server.app)
+    loop = asyncio.new_event_loop()
+
+    def opt_report():
+        status, _ = loop.run_until_complete(client.get('/getOptReport', {'date': date}))
+        assert status == 200
+
+    def cold_daily_rept():
+        storage.invalidate()
+        service.query_daily_rept(date)
+
+    results = {
+        'query_swap_info': _timed(lambda: service.query_swap_info(date), repeat),
+        'query_daily_rept_cold': _timed(cold_daily_rept, repeat),
+        'query_daily_rept_warm': _timed(lambda: service.query_daily_rept(date), repeat),
+    }
+    first, last = dates[0], dates[-1]
+    results['query_variety_total'] = _timed(lambda: service.query_variety_rept(first, last), repeat)
+    results['query_variety_month'] = _timed(
+        lambda: service.query_variety_rept(first, last, ['豆粕'], granularity='month'), repeat)
+    cache_size = report_cache.CACHE_SIZE
+    report_cache.CACHE_SIZE = 0
+    try:
+        results['get_opt_report_miss'] = _timed(opt_report, repeat)
+    finally:
+        report_cache.CACHE_SIZE = cache_size
+    opt_report()
+    results['get_opt_report_hit'] = _timed(opt_report, repeat)
+
+    counter = iter(range(10 ** 9))
+    results['save_data'] = _timed(
+        lambda: otc_daily_rept.save_data(date, 'wbill', 'v01', '豆一', next(counter) % 50 + 1, 100.0, 1e6), job_repeat)
+
+    server_stub, api_url = dce_stub.start(rows=stub_rows, date=date)
+    api_url_orig = otc_daily_rept.API_URL
+    otc_daily_rept.API_URL = api_url
+    try:
+        results['job'] = _timed(lambda: otc_daily_rept.job(date, force=True), job_repeat)
+    finally:
+        otc_daily_rept.API_URL = api_url_orig
+        server_stub.shutdown()
+    loop.close()
+    return results
+
+
+def run(year_counts=(1, 5, 10, 20), repeat=50, job_repeat=5, stub_rows=250):
+    """
+    :param year_counts: 模拟数据年数列表（1~20）
+    :param repeat: 查询类测试重复次数
+    :param job_repeat: 保存及采集任务重复次数
+    :param stub_rows: 模拟接口每个接口每日记录数
+    :return: {'environment': 测试环境, 'params': 测试参数, 'results': 测试结果列表}
+    """
+    import storage
+    cwd = os.getcwd()
+    data_dir = storage.DATA_DIR
+    results = []
+    try:
+        for years in year_counts:
+            with tempfile.TemporaryDirectory() as tmp:
+                # 服务模块按当前目录读取static及logs目录
+                for name in ('static', 'logs'):
+                    os.makedirs(os.path.join(tmp, name))
+                os.chdir(tmp)
+                for case, timing in run_years(years, repeat, job_repeat, stub_rows).items():
+                    results.append(dict(case=case, years=years, **timing))
+                os.chdir(cwd)
+    finally:
+        os.chdir(cwd)
+        storage.DATA_DIR = data_dir
+        storage.invalidate()
+    return {
+        'environment': environment(),
+        'params': {'years': list(year_counts), 'repeat': repeat, 'job_repeat': job_repeat, 'stub_rows': stub_rows},
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=0.2):
+    """
+    与基准结果比较，中位耗时增加超过threshold视为性能退化
+    :param current: 本次结果
+    :param baseline: 基准结果
+    :param threshold: 允许的耗时增加比例
+    :return: 性能退化的测试项列表
+    """
+    base = {(r['case'], r['years']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = base.get((result['case'], result['years']))
+        if old is None or old['median_ms'] <= 0:
+            continue
+        ratio = result['median_ms'] / old['median_ms'] - 1
+        if ratio > threshold:
+            regressions.append({
+                'case': result['case'],
+                'years': result['years'],
+                'baseline_ms': old['median_ms'],
+                'current_ms': result['median_ms'],
+                'change': round(ratio, 3),
+            })
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='性能测试套件')
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 5, 10, 20], choices=range(1, 21),
+                        metavar='YEARS', help='模拟数据年数（1~20）')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--job-repeat', type=int, default=5)
+    parser.add_argument('--stub-rows', type=int, default=250)
+    parser.add_argument('--output', help='结果输出文件，默认输出到标准输出')
+    parser.add_argument('--baseline', help='基准结果文件')
+    parser.add_argument('--threshold', type=float, default=0.2, help='允许的耗时增加比例')
+    args = parser.parse_args()
+    report = run(args.years, args.repeat, args.job_repeat, args.stub_rows)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report['regressions'] = compare(report, json.load(f), args.threshold)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    if report.get('regressions'):
+        sys.exit(1)
@@ -0,0 +1,139 @@
+"""
+模拟年度数据生成，用于性能测试
+
+    python -m benchmark.synthetic --dir /tmp/otc_data --years 5
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import random
+
+import pandas as pd
+
+import storage
+import variety_facts
+from schedule_service.otc_daily_rept import COLLECTORS, sorted_variety, variety_order
+
+VARIETIES = list(variety_order)
+
+# 各业务类型模拟参数：有成交的交易日比例，每日成交笔数范围，单笔成交量（吨）、成交额（元）范围，每日品种数上限
+# 标准仓单成交最活跃，基差交易、非标仓单笔数较少但单笔金额大，场外期权笔数多、单笔名义金额小
+TYPE_MIX = {
+    'wbill': (0.95, (1, 30), (50, 2000), (2e5, 8e6), 6),
+    'nonwbill': (0.6, (1, 8), (500, 10000), (2e6, 5e7), 3),
+    'basis': (0.5, (1, 6), (1000, 20000), (5e6, 1e8), 3),
+    'swap': (0.7, (1, 15), (100, 5000), (1e6, 2e7), 4),
+    'opt': (0.8, (1, 40), (10, 1000), (5e4, 2e6), 5),
+}
+
+
+def trading_days(start_year, end_year):
+    """
+    生成交易日列表（周一至周五）
+    :param start_year: 起始年份
+    :param end_year: 截止年份（含）
+    :return: 日期列表 yyyymmdd
+    """
+    day = datetime.date(start_year, 1, 1)
+    end = datetime.date(end_year, 12, 31)
+    days = []
+    while day <= end:
+        if day.weekday() < 5:
+            days.append(day.strftime('%Y%m%d'))
+        day += datetime.timedelta(days=1)
+    return days
+
+
+def _split(date, ctype, names, trade_num, volume, turnover):
+    """
+    将(日期, 类型)的汇总值拆分为各品种明细，每个品种至少一笔
+    :return: 品种明细行列表
+    """
+    rnd = random.Random(date + ctype)
+    counts = [1] * len(names)
+    for _ in range(trade_num - len(names)):
+        counts[rnd.randrange(len(names))] += 1
+    weights = [rnd.random() + 0.1 for _ in names]
+    total = sum(weights)
+    return [{
+        'date': date,
+        'type': ctype,
+        'variety': variety_order[name],
+        'trade_num': count,
+        'volume': round(volume * weight / total, 2),
+        'turnover': round(turnover * weight / total, 2),
+    } for name, count, weight in zip(names, counts, weights)]
+
+
+def make_year(year, dates, rnd, facts=None):
+    """
+    生成一年的模拟数据
+    :param year: 年份 yyyy
+    :param dates: 交易日列表
+    :param rnd: random.Random
+    :param facts: 传入list时写入品种明细行（与汇总值一致）
+    :return: DataFrame
+    """
+    rows = []
+    for date in dates:
+        if not date.startswith(year):
+            continue
+        for ctype in COLLECTORS:
+            active, trades, volume, turnover, max_varieties = TYPE_MIX[ctype]
+            trade_num = rnd.randint(*trades) if rnd.random() < active else 0
+            names = sorted_variety(set(rnd.sample(VARIETIES, min(trade_num, max_varieties))))
+            row = {
+                'date': date,
+                'type': ctype,
+                'variety_ids': ','.join('v%02d' % variety_order[name] for name in names),
+                'variety_names': '、'.join(names),
+                'trade_num': trade_num,
+                'volume': round(rnd.uniform(*volume) * trade_num, 2),
+                'turnover': round(rnd.uniform(*turnover) * trade_num, 2),
+            }
+            rows.append(row)
+            if facts is not None and names:
+                facts.extend(_split(date, ctype, names, trade_num, row['volume'], row['turnover']))
+    return pd.DataFrame(rows, columns=storage.COLUMNS)
+
+
+def generate(data_dir, years=1, end_year=2022, seed=0):
+    """
+    生成模拟年度数据文件（CSV格式，其他存储格式通过storage.convert导入）、品种明细文件与交易日历文件
+    :param data_dir: 数据目录
+    :param years: 年数
+    :param end_year: 截止年份
+    :param seed: 随机种子
+    :return: 交易日列表
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    rnd = random.Random(seed)
+    start_year = end_year - years + 1
+    dates = trading_days(start_year, end_year)
+    with open(os.path.join(data_dir, 'trade_date.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        for date in dates:
+            writer.writerow([date])
+    fact_dir = os.path.join(data_dir, variety_facts.FACT_DIR)
+    os.makedirs(fact_dir, exist_ok=True)
+    with open(os.path.join(fact_dir, variety_facts.CODES_FILE), 'w', encoding='utf-8') as f:
+        json.dump(variety_order, f, ensure_ascii=False)
+    for year in range(start_year, end_year + 1):
+        facts = []
+        df = make_year(str(year), dates, rnd, facts)
+        df.to_csv(os.path.join(data_dir, '{year}.csv'.format(year=year)), index=False)
+        pd.DataFrame(facts, columns=variety_facts.COLUMNS).to_csv(
+            os.path.join(fact_dir, '{year}.csv'.format(year=year)), index=False)
+    return dates
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='生成模拟年度数据')
+    parser.add_argument('--dir', default='data')
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--end-year', type=int, default=2022)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.dir, args.years, args.end_year, args.seed)
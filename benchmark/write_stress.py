@@ -0,0 +1,129 @@
+"""
+并发写入测试：多个进程（模拟各uvicorn worker、定时任务及手工更新）的多个线程同时更新同一年度数据文件，
+每个线程更新各自的记录（update_record：商品互换笔数；upsert_records：场外期权记录），
+全部结束后检查每条记录是否为该线程最后一次写入的值，有更新丢失时以退出码1结束
+
+    python -m benchmark.write_stress --processes 4 --threads 2 --ops 30
+    python -m benchmark.write_stress --no-lock    不加写锁，对比更新丢失的情况
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import sys
+import tempfile
+import threading
+import time
+
+import storage
+from benchmark import synthetic
+
+
+def _worker(data_dir, backend, jobs, ops, lock):
+    """
+    子进程：每个线程按分配的日期循环写入
+    :param jobs: [(更新日期, 新增日期)] 每个线程一组
+    """
+    storage.DATA_DIR = data_dir
+    storage.BACKEND = backend
+    if not lock:
+        storage.file_lock = lambda path, timeout=None: contextlib.nullcontext()
+
+    def work(update_date, upsert_date):
+        for i in range(ops):
+            if i % 2 == 0:
+                storage.update_record(update_date, 'swap', {'trade_num': i})
+            else:
+                storage.upsert_records([(upsert_date, 'opt', '', '', i, 0.0, 0.0)])
+
+    threads = [threading.Thread(target=work, args=job) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run(processes=4, threads=2, ops=30, lock=True, backend=None):
+    """
+    :param processes: 进程数
+    :param threads: 每个进程的线程数
+    :param ops: 每个线程的写入次数
+    :param lock: 是否使用写锁
+    :param backend: 存储格式，默认取storage.BACKEND
+    :return: 测试结果
+    """
+    backend = backend or storage.BACKEND
+    data_dir, backend_orig = storage.DATA_DIR, storage.BACKEND
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DATA_DIR = tmp
+        storage.BACKEND = backend
+        try:
+            dates = synthetic.generate(tmp, 1, 2022)
+            if backend != 'csv':
+                storage.convert('csv', backend, verify=False)
+            # 更新日期为已有记录，新增日期为数据文件中没有的日期（非交易日）
+            count = processes * threads
+            update_dates = dates[:count]
+            trading = set(dates)
+            days = ((datetime.date(2022, 1, 1) + datetime.timedelta(days=i)).strftime('%Y%m%d') for i in range(365))
+            upsert_dates = [day for day in days if day not in trading][:count]
+            pairs = list(zip(update_dates, upsert_dates))
+
+            ctx = multiprocessing.get_context('spawn')
+            workers = [ctx.Process(target=_worker,
+                                   args=(tmp, backend, pairs[p * threads:(p + 1) * threads], ops, lock))
+                       for p in range(processes)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+
+            storage.invalidate()
+            df = storage.get_backend().read_year('2022').set_index(storage.KEY)
+            last_update = max(i for i in range(ops) if i % 2 == 0)
+            last_upsert = max((i for i in range(ops) if i % 2 == 1), default=None)
+            lost = []
+            for update_date, upsert_date in pairs:
+                value = df.loc[(update_date, 'swap'), 'trade_num']
+                if value != last_update:
+                    lost.append({'date': update_date, 'type': 'swap', 'expected': last_update, 'actual': value})
+                if last_upsert is None:
+                    continue
+                if (upsert_date, 'opt') not in df.index:
+                    lost.append({'date': upsert_date, 'type': 'opt', 'expected': last_upsert, 'actual': None})
+                elif df.loc[(upsert_date, 'opt'), 'trade_num'] != last_upsert:
+                    lost.append({'date': upsert_date, 'type': 'opt', 'expected': last_upsert,
+                                 'actual': df.loc[(upsert_date, 'opt'), 'trade_num']})
+            exit_codes = [worker.exitcode for worker in workers]
+        finally:
+            storage.DATA_DIR, storage.BACKEND = data_dir, backend_orig
+            storage.invalidate()
+    writes = processes * threads * ops
+    return {
+        'backend': backend,
+        'lock': lock,
+        'processes': processes,
+        'threads': threads,
+        'writes': writes,
+        'seconds': round(elapsed, 3),
+        'writes_per_second': round(writes / elapsed, 1),
+        'worker_exit_codes': exit_codes,
+        'lost': [{k: (int(v) if hasattr(v, 'item') else v) for k, v in item.items()} for item in lost],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='并发写入测试')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--ops', type=int, default=30)
+    parser.add_argument('--backend', choices=sorted(storage.BACKENDS))
+    parser.add_argument('--no-lock', action='store_true', help='不加写锁')
+    args = parser.parse_args()
+    result = run(args.processes, args.threads, args.ops, not args.no_lock, args.backend)
+    print(json.dumps(result, indent=2, default=str))
+    if result['lost'] or any(result['worker_exit_codes']):
+        sys.exit(1)
@@ -0,0 +1,157 @@
+"""
+HTTP响应压缩：按请求头Accept-Encoding选择编码；接口返回的JSON、CSV超过MIN_SIZE字节时gzip压缩
+（分块输出的响应逐块压缩并刷新，不影响分块输出），已编码的响应（预压缩的静态文件、报表）不重复压缩
+
+环境变量：
+    OTC_GZIP_MIN_SIZE  压缩的最小响应大小 单位：字节，默认1024
+    OTC_GZIP_LEVEL     接口响应的gzip压缩级别，默认6
+"""
+import gzip
+import os
+import zlib
+
+MIN_SIZE = int(os.environ.get('OTC_GZIP_MIN_SIZE', 1024))
+LEVEL = int(os.environ.get('OTC_GZIP_LEVEL', 6))
+# 接口响应中压缩的内容类型（text/event-stream等推送流不压缩）
+RESPONSE_TYPES = frozenset(['application/json', 'text/csv'])
+# 可压缩的静态文件类型（图片、字体等已压缩格式除外）
+COMPRESSIBLE_TYPES = frozenset(['text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+                                'application/javascript', 'application/json', 'application/xml', 'image/svg+xml'])
+# 编码优先顺序
+PREFERENCE = ('br', 'gzip')
+
+
+def brotli_module():
+    """
+    :return: brotli模块，未安装时返回None
+    """
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def accepted(accept_encoding):
+    """
+    解析Accept-Encoding
+    :param accept_encoding: 请求头Accept-Encoding
+    :return: 客户端接受的编码集合
+    """
+    result = set()
+    rejected = set()
+    for item in (accept_encoding or '').split(','):
+        parts = item.strip().split(';')
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        (result if q > 0 else rejected).add(name)
+    if '*' in result:
+        result |= set(PREFERENCE) - rejected
+    return result
+
+
+def choose(accept_encoding, available):
+    """
+    选择响应编码
+    :param accept_encoding: 请求头Accept-Encoding
+    :param available: 可用的编码
+    :return: 编码，不压缩时返回None
+    """
+    names = accepted(accept_encoding)
+    for name in PREFERENCE:
+        if name in available and name in names:
+            return name
+    return None
+
+
+def gzip_bytes(data, level=9):
+    """
+    gzip压缩（mtime固定为0，相同内容的压缩结果相同）
+    """
+    return gzip.compress(data, level, mtime=0)
+
+
+def weak_etag(etag):
+    """
+    压缩后的响应内容与原ETag对应的内容不同，改为弱ETag
+    """
+    return etag if etag.startswith('W/') else 'W/' + etag
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+
+class GzipMiddleware:
+    """
+    ASGI中间件：客户端接受gzip时压缩RESPONSE_TYPES类型的响应
+    一次输出的响应小于MIN_SIZE字节时不压缩；分块输出的响应每块压缩后刷新，客户端可逐块解析
+    """
+
+    def __init__(self, app, minimum_size=None, level=None):
+        self.app = app
+        self.minimum_size = MIN_SIZE if minimum_size is None else minimum_size
+        self.level = LEVEL if level is None else level
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or 'gzip' not in accepted(_header(scope['headers'], b'accept-encoding')):
+            await self.app(scope, receive, send)
+            return
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if message['type'] != 'http.response.body' or passthrough:
+                await send(message)
+                return
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if compressor is None:
+                headers = [(k, v) for k, v in start['headers']]
+                media_type = (_header(headers, b'content-type') or '').split(';')[0].strip().lower()
+                if media_type not in RESPONSE_TYPES or _header(headers, b'content-encoding') is not None or \
+                        (not more_body and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+                headers = [(k, v) for k, v in headers if k.lower() not in (b'content-length', b'etag')]
+                etag = _header(start['headers'], b'etag')
+                if etag is not None:
+                    headers.append((b'etag', weak_etag(etag).encode('latin-1')))
+                headers.append((b'content-encoding', b'gzip'))
+                headers.append((b'vary', b'Accept-Encoding'))
+                if not more_body:
+                    data = compressor.compress(body) + compressor.flush()
+                    headers.append((b'content-length', str(len(data)).encode('latin-1')))
+                    await send(dict(start, headers=headers))
+                    await send({'type': 'http.response.body', 'body': data})
+                    return
+                await send(dict(start, headers=headers))
+            data = compressor.compress(body)
+            data += compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+            await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,242 @@
+"""
+日志输出：调用方只将日志记录放入内存队列（队列已满时丢弃，不阻塞采集及请求处理），
+后台线程格式化日志消息并批量写入按日期切分的日志文件logs/log_yyyymmdd.log，每批写入后刷新一次
+
+各模块使用logging.getLogger(__name__)，消息参数使用%格式延迟格式化：log.info('### %s 数据无变化', date)，
+extra中的字段作为结构化字段输出：log.info('...', extra={'date': date})
+入口（服务启动、定时任务、命令行工具）调用setup()后日志才写入文件，导入模块时不打开日志文件
+
+环境变量：
+    OTC_LOG_DIR      日志目录，默认logs
+    OTC_LOG_LEVEL    默认日志级别，默认INFO
+    OTC_LOG_LEVELS   各模块日志级别，如 schedule_service=DEBUG,storage=WARNING
+    OTC_LOG_FORMAT   json（每行一条JSON记录，默认）或 text
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+import metrics
+
+LOG_DIR = os.environ.get('OTC_LOG_DIR', 'logs')
+LOG_LEVEL = os.environ.get('OTC_LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.environ.get('OTC_LOG_LEVELS', '')
+LOG_FORMAT = os.environ.get('OTC_LOG_FORMAT', 'json')
+# 日志文件保留天数
+BACKUP_DAYS = 30
+# 日志队列长度上限
+QUEUE_SIZE = 10000
+# 后台线程每批写入的记录数上限
+BATCH_SIZE = 512
+
+TEXT_FORMAT = '%(asctime)s  %(filename)s : %(levelname)s  %(message)s'
+TEXT_DATEFMT = '%Y-%m-%d %A %H:%M:%S'
+
+# LogRecord自带属性，其余属性为extra传入的结构化字段
+_RECORD_ATTRS = frozenset(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+_STOP = object()
+
+_lock = threading.Lock()
+_queue_handler = None
+_writer = None
+
+LOG_DROPPED = metrics.Counter('otc_log_dropped_total', '日志队列已满丢弃的记录数')
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志记录输出为一行JSON：time level logger file line thread msg，extra字段，异常信息exc
+    """
+
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'file': record.filename,
+            'line': record.lineno,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DailyFileHandler(logging.Handler):
+    """
+    按日期切分的日志文件：{directory}/{prefix}_yyyymmdd.log，按记录时间切换文件，删除超过backup_days天的文件
+    仅由后台写入线程调用
+    """
+
+    def __init__(self, directory, prefix='log', backup_days=BACKUP_DAYS):
+        super().__init__()
+        self.directory = directory
+        self.prefix = prefix
+        self.backup_days = backup_days
+        self.day = None
+        self.stream = None
+
+    def _open(self, day):
+        if self.stream is not None:
+            self.stream.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self.stream = open(os.path.join(self.directory, '%s_%s.log' % (self.prefix, day)), 'a', encoding='utf-8')
+        self.day = day
+        self._remove_expired(day)
+
+    def _remove_expired(self, day):
+        earliest = (datetime.datetime.strptime(day, '%Y%m%d') -
+                    datetime.timedelta(days=self.backup_days)).strftime('%Y%m%d')
+        head = self.prefix + '_'
+        for name in os.listdir(self.directory):
+            file_day = name[len(head):-len('.log')]
+            if name.startswith(head) and name.endswith('.log') and len(file_day) == 8 and file_day < earliest:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def emit(self, record):
+        try:
+            day = time.strftime('%Y%m%d', time.localtime(record.created))
+            if day != self.day:
+                self._open(day)
+            self.stream.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if self.stream is not None:
+            self.stream.flush()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        super().close()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    非阻塞入队：队列已满时丢弃记录；不在调用线程格式化消息（仅将异常信息转为文本，避免引用调用栈）
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+class _Writer(threading.Thread):
+    """
+    后台写入线程：逐批取出日志记录写入各输出，每批刷新一次
+    """
+
+    def __init__(self, records, handlers):
+        super().__init__(name='log-writer', daemon=True)
+        self.records = records
+        self.handlers = handlers
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.records.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is _STOP:
+                    stopping = True
+                    continue
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            for handler in self.handlers:
+                handler.flush()
+
+
+def _parse_levels(levels):
+    """
+    :param levels: 各模块日志级别 如 schedule_service=DEBUG,storage=WARNING
+    :return: 模块名称 -> 日志级别
+    """
+    result = {}
+    for item in levels.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            result[name.strip()] = level.strip().upper()
+    return result
+
+
+def setup(log_dir=None, level=None, levels=None, fmt=None, stream=False):
+    """
+    启用日志输出（重复调用无效）
+    :param log_dir: 日志目录，默认LOG_DIR
+    :param level: 默认日志级别，默认LOG_LEVEL
+    :param levels: 各模块日志级别 dict 或 'name=LEVEL,...'，默认LOG_LEVELS
+    :param fmt: json 或 text，默认LOG_FORMAT
+    :param stream: 是否同时输出到标准错误
+    :return:
+    """
+    global _queue_handler, _writer
+    with _lock:
+        if _queue_handler is not None:
+            return
+        formatter = logging.Formatter(TEXT_FORMAT, TEXT_DATEFMT) if (fmt or LOG_FORMAT) == 'text' else JsonFormatter()
+        handlers = [DailyFileHandler(log_dir or LOG_DIR)]
+        if stream:
+            handlers.append(logging.StreamHandler())
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        records = queue.Queue(QUEUE_SIZE)
+        _writer = _Writer(records, handlers)
+        _writer.start()
+        _queue_handler = _QueueHandler(records)
+        root = logging.getLogger()
+        root.addHandler(_queue_handler)
+        root.setLevel(level or LOG_LEVEL)
+        levels = _parse_levels(LOG_LEVELS if levels is None else levels) if not isinstance(levels, dict) else levels
+        for name, module_level in levels.items():
+            logging.getLogger(name).setLevel(module_level)
+        atexit.register(shutdown)
+
+
+def shutdown(timeout=5):
+    """
+    停止日志输出：写入队列中剩余的记录后关闭日志文件
+    :param timeout: 等待写入的最长时间 单位：秒
+    :return:
+    """
+    global _queue_handler, _writer
+    with _lock:
+        if _queue_handler is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler.queue.put(_STOP)
+        _writer.join(timeout)
+        for handler in _writer.handlers:
+            handler.close()
+        _queue_handler = _writer = None
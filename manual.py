@@ -1,3 +1,7 @@
+import logger
+import metrics
 from schedule_service import otc_daily_rept as pc
 
-pc.job('20220720')
+logger.setup()
+metrics.setup()
+pc.job('20220720', force=True)
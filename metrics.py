@@ -0,0 +1,382 @@
+"""
+进程内监控指标（Prometheus文本格式），计数器、仪表及直方图，/metrics接口输出
+
+多进程部署（uvicorn多个worker及定时任务进程）时设置环境变量OTC_METRICS_DIR，
+各进程每隔FLUSH_INTERVAL秒及退出时将本进程指标写入该目录下的{pid}.json，输出时合并全部进程的指标
+（入口调用setup()后启用）
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from atomic_file import atomic_write
+
+_now = time.perf_counter
+
+# 多进程指标目录，未设置时仅输出本进程指标
+METRICS_DIR = os.environ.get('OTC_METRICS_DIR')
+# 多进程指标写入间隔 单位：秒
+FLUSH_INTERVAL = 5
+# 默认直方图分桶上界 单位：秒
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+# 指标名称 -> 指标
+_registry = {}
+_flusher = None
+
+
+class _Timer:
+    """
+    计时上下文：退出时将耗时计入直方图
+    """
+    __slots__ = ('child', 'start')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = _now()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        value = _now() - self.start
+        child = self.child
+        i = bisect_left(child.bounds, value)
+        with child.lock:
+            child.counts[i] += 1
+            child.sum += value
+        return False
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self, metric):
+        self.value = 0.0
+        self.lock = metric.lock
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, metric):
+        self.bounds = metric.buckets
+        # 各分桶计数（非累计），最后一个为+Inf
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.lock = metric.lock
+
+    def observe(self, value):
+        i = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        with self.lock:
+            return [list(self.counts), self.sum]
+
+
+class _Metric:
+    kind = ''
+    child_class = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self._children = {}
+        with _lock:
+            _registry[name] = self
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """
+        获得指定标签值的子指标，热点路径可预先取得子指标避免重复查找
+        :param values: 标签值，顺序同labelnames
+        :return: 子指标
+        """
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self.lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self.child_class(self)
+                    self._children[values] = child
+        return child
+
+    def snapshot(self):
+        return [[list(values), child.snapshot()] for values, child in list(self._children.items())]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+    child_class = _CounterChild
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """
+    仪表，多进程合并时取最大值（用于时间戳等）
+    """
+    kind = 'gauge'
+    child_class = _CounterChild
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    child_class = _HistogramChild
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+def timed(child):
+    """
+    函数计时装饰器
+    :param child: 直方图或直方图子指标
+    :return: 装饰器
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with child.time():
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    本进程全部指标
+    :return: 指标名称 -> {type, help, labelnames, buckets, values}
+    """
+    with _lock:
+        metrics = list(_registry.values())
+    result = {}
+    for metric in metrics:
+        result[metric.name] = {
+            'type': metric.kind,
+            'help': metric.documentation,
+            'labelnames': list(metric.labelnames),
+            'buckets': list(getattr(metric, 'buckets', [])),
+            'values': metric.snapshot(),
+        }
+    return result
+
+
+def flush():
+    """
+    将本进程指标写入多进程指标目录
+    :return:
+    """
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with atomic_write(os.path.join(METRICS_DIR, '%d.json' % os.getpid())) as tmp, \
+            open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def enable_multiprocess(path):
+    """
+    启用多进程指标：定期及退出时写入本进程指标
+    :param path: 多进程指标目录
+    :return:
+    """
+    global METRICS_DIR, _flusher
+    METRICS_DIR = path
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+
+def setup():
+    """
+    按环境变量OTC_METRICS_DIR启用多进程指标（入口处调用，导入模块时不启动写入线程）
+    :return:
+    """
+    if METRICS_DIR:
+        enable_multiprocess(METRICS_DIR)
+
+
+def clear_multiprocess(path):
+    """
+    清空多进程指标目录（服务启动前调用）
+    :param path: 多进程指标目录
+    :return:
+    """
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            if name.endswith('.json'):
+                os.remove(os.path.join(path, name))
+
+
+def _collect():
+    """
+    合并全部进程的指标，本进程使用当前值
+    :return: 指标名称 -> 指标数据
+    """
+    snapshots = [snapshot()]
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        own = '%d.json' % os.getpid()
+        for name in sorted(os.listdir(METRICS_DIR)):
+            if not name.endswith('.json') or name == own:
+                continue
+            try:
+                with open(os.path.join(METRICS_DIR, name), 'r', encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    merged = {}
+    for data in snapshots:
+        for name, metric in data.items():
+            target = merged.setdefault(name, dict(metric, values={}))
+            for values, value in metric['values']:
+                key = tuple(values)
+                current = target['values'].get(key)
+                if current is None:
+                    target['values'][key] = value
+                elif metric['type'] == 'histogram':
+                    target['values'][key] = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+                elif metric['type'] == 'gauge':
+                    target['values'][key] = max(current, value)
+                else:
+                    target['values'][key] = current + value
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append('%s="%s"' % extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render():
+    """
+    输出Prometheus文本格式指标
+    :return: str
+    """
+    lines = []
+    for name, metric in sorted(_collect().items()):
+        lines.append('# HELP %s %s' % (name, metric['help']))
+        lines.append('# TYPE %s %s' % (name, metric['type']))
+        names = metric['labelnames']
+        for values, value in sorted(metric['values'].items()):
+            if metric['type'] == 'histogram':
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(metric['buckets'] + [float('inf')], counts):
+                    cumulative += count
+                    lines.append('%s_bucket%s %d' % (name, _labels(names, values, ('le', _number(bound))), cumulative))
+                lines.append('%s_sum%s %s' % (name, _labels(names, values), repr(float(total))))
+                lines.append('%s_count%s %d' % (name, _labels(names, values), cumulative))
+            else:
+                lines.append('%s%s %s' % (name, _labels(names, values), _number(value)))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    ASGI中间件：统计HTTP接口响应时间及请求数，paths以外的路径统一记为other
+    streams中的长连接路径（SSE订阅）不计入响应时间，连接时长累计到HTTP_STREAM_SECONDS
+    """
+
+    def __init__(self, app, paths=(), streams=()):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.streams = frozenset(streams)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        stream = scope['path'] in self.streams
+        path = scope['path'] if stream or scope['path'] in self.paths else 'other'
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if stream:
+                HTTP_STREAM_SECONDS.labels(path).inc(time.perf_counter() - start)
+            else:
+                HTTP_REQUEST_SECONDS.labels(path).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(path, status[0]).inc()
+
+
+# 各模块共用的指标
+HTTP_REQUEST_SECONDS = Histogram('otc_http_request_seconds', 'HTTP接口响应时间', ['path'])
+HTTP_REQUESTS = Counter('otc_http_requests_total', 'HTTP接口请求数', ['path', 'status'])
+HTTP_STREAM_SECONDS = Counter('otc_http_stream_seconds_total', 'SSE等长连接累计连接时长', ['path'])
+STORAGE_SECONDS = Histogram('otc_storage_seconds', '数据读取、解析及写入耗时', ['op'])
+CACHE_REQUESTS = Counter('otc_cache_requests_total', '缓存查询次数', ['cache', 'result'])
+SERVICE_SECONDS = Histogram('otc_service_seconds', '查询服务耗时', ['fn'])
+DCE_REQUEST_SECONDS = Histogram('otc_dce_request_seconds', '采集接口请求耗时', ['api'])
+DCE_ERRORS = Counter('otc_dce_errors_total', '采集接口异常次数', ['api'])
+COLLECTOR_SECONDS = Histogram('otc_collector_seconds', '业务类型采集汇总耗时', ['type'])
+COLLECTOR_ROWS = Counter('otc_collector_rows_total', '采集接口结果记录数', ['api'])
+JOB_SECONDS = Histogram('otc_job_seconds', '定时采集任务耗时', ['result'])
+JOB_LAST_SUCCESS = Gauge('otc_job_last_success_timestamp_seconds', '定时采集任务最后一次成功时间')
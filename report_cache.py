@@ -0,0 +1,169 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import compression
+import metrics
+import storage
+import trade_calendar
+
+# 缓存报表上限（按日期计）
+CACHE_SIZE = 512
+
+_lock = threading.Lock()
+# 日期 -> ReportEntry
+_entries = OrderedDict()
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'not_modified': 0}
+
+_CACHE_HIT = metrics.CACHE_REQUESTS.labels('report', 'hit')
+_CACHE_MISS = metrics.CACHE_REQUESTS.labels('report', 'miss')
+
+
+class ReportEntry:
+    """
+    已序列化的报表及其依赖的数据范围
+    """
+
+    def __init__(self, date, body, tokens, prev_min, calendar):
+        self.date = date
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self._gzip = None
+        # 依赖的年度数据标识 年份 -> 数据标识
+        self.tokens = tokens
+        # 前5日跨年取数时依赖的上一年度最早日期，未跨年时为None
+        self.prev_min = prev_min
+        # 交易日历文件标识，日历修改后前5日可能变化
+        self.calendar = calendar
+
+    @property
+    def gzip_body(self):
+        """
+        gzip压缩的报表（首次使用时压缩，同一报表的后续请求直接返回）
+        """
+        if self._gzip is None:
+            self._gzip = compression.gzip_bytes(self.body, compression.LEVEL)
+        return self._gzip
+
+
+def dumps(payload):
+    """
+    序列化为JSON字节串（与FastAPI JSONResponse格式一致）
+    :param payload: 报表数据
+    :return: bytes
+    """
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+
+
+def _dependencies(date):
+    """
+    报表依赖的年度数据标识：当年数据；前5个交易日跨年时还依赖上一年度最后几个交易日
+    :param date: 报表日期
+    :return: (tokens, prev_min, calendar)
+    """
+    year = date[:4]
+    tokens = {year: storage.year_token(year)}
+    calendar = trade_calendar.token()
+    prev_dates = [d for d in trade_calendar.get().previous(date, 5) if d[:4] < year]
+    for prev_year in sorted(set(d[:4] for d in prev_dates)):
+        if storage.year_exists(prev_year):
+            tokens[prev_year] = storage.year_token(prev_year)
+    prev_min = min(prev_dates) if prev_dates else None
+    return tokens, prev_min, calendar
+
+
+def _valid(entry):
+    """
+    校验缓存报表依赖的数据及交易日历是否被修改（包括其他进程写入）
+    """
+    return entry.calendar == trade_calendar.token() and all(storage.year_token(year) == token for year, token in entry.tokens.items())
+
+
+def get(date, build):
+    """
+    获取已序列化的报表，未命中或数据已修改时调用build重新生成
+    :param date: 报表日期
+    :param build: 报表生成函数 build(date) -> 报表数据
+    :return: ReportEntry
+    """
+    with _lock:
+        entry = _entries.get(date)
+    if entry is not None and _valid(entry):
+        with _lock:
+            _stats['hits'] += 1
+            if date in _entries:
+                _entries.move_to_end(date)
+        _CACHE_HIT.inc()
+        return entry
+    # 先取数据标识再生成报表，生成期间数据被修改时下次请求可识别并重新生成
+    with _lock:
+        _stats['misses'] += 1
+    _CACHE_MISS.inc()
+    tokens, prev_min, calendar = _dependencies(date)
+    entry = ReportEntry(date, dumps(build(date)), tokens, prev_min, calendar)
+    with _lock:
+        _entries[date] = entry
+        _entries.move_to_end(date)
+        while len(_entries) > CACHE_SIZE:
+            _entries.popitem(last=False)
+    return entry
+
+
+def not_modified(entry, if_none_match):
+    """
+    判断客户端缓存是否仍有效（If-None-Match）
+    :param entry: ReportEntry
+    :param if_none_match: 请求头If-None-Match
+    :return: True 返回304
+    """
+    if not if_none_match:
+        return False
+    # 弱比较：压缩后的响应为弱ETag
+    tags = [compression.strip_weak(tag.strip()) for tag in if_none_match.split(',')]
+    if entry.etag in tags or '*' in tags:
+        with _lock:
+            _stats['not_modified'] += 1
+        return True
+    return False
+
+
+def _on_change(year, dates):
+    """
+    本进程写入数据后，仅使受影响日期的报表失效：
+    同年且不早于变更日期的报表（日、月、年合计及前5日），前5日跨年取到变更日期的以后年度报表
+    其余报表依赖的数据标识与本次写入前的标识相同时更新为写入后的标识，继续有效；
+    不同时（其他进程在此之前修改了数据）同样失效
+    :param year: 年份
+    :param dates: 变更的日期集合
+    :return:
+    """
+    first, last = min(dates), max(dates)
+    before, token = storage.written_tokens(year)
+    with _lock:
+        for date, entry in list(_entries.items()):
+            if year not in entry.tokens:
+                continue
+            if (date[:4] == year and first <= date) or \
+                    (date[:4] != year and entry.prev_min is not None and last >= entry.prev_min) or \
+                    before is None or entry.tokens[year] != before:
+                del _entries[date]
+                _stats['invalidations'] += 1
+            else:
+                entry.tokens[year] = token
+
+
+def stats():
+    """
+    缓存统计
+    :return: 命中、未命中、失效、304次数及当前缓存数
+    """
+    with _lock:
+        result = dict(_stats)
+        result['size'] = len(_entries)
+    total = result['hits'] + result['misses']
+    result['hit_ratio'] = round(result['hits'] / total, 4) if total else 0
+    return result
+
+
+storage.add_listener(_on_change)
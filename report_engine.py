@@ -0,0 +1,185 @@
+import json
+from collections import namedtuple
+
+import numpy as np
+
+import service as sv
+
+# 成交量单位：万吨
+VOLUME_UNIT = 10000
+# 成交额单位：亿元
+TURNOVER_UNIT = 100000000
+
+METRICS = ['trade_num', 'volume', 'turnover']
+UNITS = np.array([1, VOLUME_UNIT, TURNOVER_UNIT], dtype=float)
+
+# 报表业务类型
+# ctype：数据类型，key：报表字段名，volume：是否统计成交量，daily：是否列入当日数据，weekly：是否列入近5日数据
+ReportType = namedtuple('ReportType', ['ctype', 'key', 'volume', 'daily', 'weekly'])
+
+REPORT_TYPES = [
+    ReportType('wbill', 'wbill', True, True, True),
+    ReportType('nonwbill', 'non_wbill', True, True, True),
+    ReportType('basis', 'index_basis', True, True, True),
+    # 根据业务部门要求，商品互换、场外期权暂不列入当日及近5日数据，仅统计全年数据
+    ReportType('swap', 'swap', False, False, False),
+    ReportType('opt', 'opt', False, False, False),
+]
+
+
+def _matrix(frame, types):
+    """
+    按类型取出指标矩阵
+    :param frame: DataFrame index：type，columns：METRICS
+    :param types: 类型列表
+    :return: 指标矩阵 [类型, 指标]
+    """
+    missing = [ctype for ctype in types if ctype not in frame.index]
+    if missing:
+        raise KeyError(missing)
+    return frame.loc[types, METRICS].to_numpy(dtype=float)
+
+
+def _scale(matrix):
+    """
+    统一换算单位并保留两位小数
+    :param matrix: 指标矩阵 [..., 指标]
+    :return: 换算后的指标矩阵，trade_num不换算
+    """
+    scaled = np.round(matrix / UNITS, 2)
+    scaled[..., 0] = matrix[..., 0]
+    return scaled
+
+
+def _fmt(value):
+    return '%.2f' % value
+
+
+def _section(report_type, row, varietys=None):
+    """
+    单一业务类型的报表数据
+    :param report_type: ReportType
+    :param row: 换算后的指标 [trade_num, volume, turnover]
+    :param varietys: 品种列表，为None时不输出
+    :return: dict
+    """
+    section = {"num": int(row[0])}
+    if varietys is not None:
+        section["varietys"] = varietys
+    if report_type.volume:
+        section["volume"] = _fmt(row[1])
+    section["turnover"] = _fmt(row[2])
+    return section
+
+
+def build_opt_report(date, report_types=None):
+    """
+    生成日报数据：当日、近5日、当月及全年数据各自转换为[类型, 指标]矩阵，统一换算单位后输出
+    :param date: 报表日期 yyyymmdd
+    :param report_types: 报表业务类型列表，默认REPORT_TYPES
+    :return: 日报数据，当日无数据时Status为100
+    """
+    report_types = report_types or REPORT_TYPES
+    data = sv.query_daily_rept(date)
+    if data['daily_data'].shape[0] == 0:
+        return {
+            "Status": 100
+        }
+    day_types = [t for t in report_types if t.daily]
+    week_types = [t for t in report_types if t.weekly]
+    volume_mask = np.array([t.volume for t in report_types])
+    day_volume_mask = np.array([t.volume for t in day_types])
+
+    # 日数据计算
+    daily_frame = data['daily_data'].set_index('type')
+    day = _scale(_matrix(daily_frame, [t.ctype for t in day_types]))
+    day_varietys = daily_frame['variety_names'].fillna('')
+    daily_sum_turnover = np.round(day[:, 2].sum(), 2)
+    daily_sum_volume = np.round(day[day_volume_mask, 1].sum(), 2)
+    month_sum_turnover = np.round(data['month_data']['turnover'].sum() / TURNOVER_UNIT, 2)
+
+    # 年数据计算
+    year_data = data['year_data']
+    year = _scale(_matrix(year_data, [t.ctype for t in report_types]))
+    year_sum_volume = np.round(year[volume_mask, 1].sum(), 2)
+    year_sum_turnover = np.round(year[:, 2].sum(), 2)
+
+    # last5数据计算 [日期, 类型]
+    last5 = data['last5_data'].unstack('type').reindex(index=data['last5_date'], columns=[t.ctype for t in week_types],
+                                                       fill_value=0).fillna(0)
+    week = np.round(last5.to_numpy(dtype=float) / TURNOVER_UNIT, 2)
+    week_sum = np.round(week.sum(axis=1), 2)
+
+    daily = {
+        "daily_sum": _fmt(daily_sum_turnover),
+        "daily_volume_sum": _fmt(daily_sum_volume),
+        "month_sum": _fmt(month_sum_turnover),
+        "year_sum": _fmt(year_sum_turnover),
+    }
+    for i, t in enumerate(day_types):
+        daily[t.key] = _section(t, day[i], str(day_varietys[t.ctype]))
+
+    weekly = {
+        "dates": [str(int(d[4:6])) + '月' + str(int(d[6:8])) + '日' for d in last5.index],
+    }
+    for i, t in enumerate(week_types):
+        weekly[t.key] = week[:, i].tolist()
+    weekly["sum"] = [_fmt(s) for s in week_sum.tolist()]
+
+    yearly = {}
+    for i, t in enumerate(report_types):
+        yearly[t.key] = _section(t, year[i])
+    yearly["sum"] = {
+        "num": int(year_data['trade_num'].sum()),
+        "volume": _fmt(year_sum_volume),
+        "turnover": _fmt(year_sum_turnover),
+    }
+
+    return {
+        "Status": 200,
+        "daily": daily,
+        "weekly": weekly,
+        "yearly": yearly,
+    }
+
+
+def iter_range_json(data, start, end, granularity):
+    """
+    区间报表JSON分块输出：先输出统计周期，再逐类型输出数据序列，无数据的周期补0
+    成交量单位：吨，成交额单位：元
+    :param data: service.query_range_rept结果
+    :param start: 起始日期
+    :param end: 截止日期
+    :param granularity: 统计周期
+    :return: 生成器 bytes
+    """
+    table = data.pivot(index='period', columns='type', values=METRICS).fillna(0)
+    head = {
+        "Status": 200,
+        "start": start,
+        "end": end,
+        "granularity": granularity,
+        "periods": table.index.tolist(),
+    }
+    yield (json.dumps(head, ensure_ascii=False)[:-1] + ', "series": {').encode('utf-8')
+    for i, ctype in enumerate(table.columns.get_level_values('type').unique()):
+        series = {
+            "trade_num": table[('trade_num', ctype)].astype('int64').tolist(),
+            "volume": table[('volume', ctype)].round(2).tolist(),
+            "turnover": table[('turnover', ctype)].round(2).tolist(),
+        }
+        yield ((', ' if i else '') + json.dumps(ctype) + ': ' + json.dumps(series)).encode('utf-8')
+    yield b'}}'
+
+
+def iter_range_csv(data, chunk_size=1000):
+    """
+    区间报表CSV分块输出，每行一个(统计周期, 类型)
+    :param data: service.query_range_rept结果
+    :param chunk_size: 每块行数
+    :return: 生成器 bytes
+    """
+    data = data.round({'volume': 2, 'turnover': 2})
+    yield data.iloc[:0].to_csv(index=False).encode('utf-8')
+    for i in range(0, len(data), chunk_size):
+        yield data.iloc[i:i + chunk_size].to_csv(index=False, header=False).encode('utf-8')
@@ -0,0 +1,247 @@
+"""
+报表推送（Server-Sent Events）：客户端订阅日期 GET /subscribe?date=yyyymmdd 后，
+先收到当前的日报（report事件，内容同/getOptReport）及交易信息（tradeInfo事件，内容同/tradeInfo），
+之后仅在该日期的数据变更时收到新的推送，不再需要轮询
+
+每个进程一个后台任务检查已订阅日期的数据标识（包括定时任务等其他进程的写入），数据变更后
+报表只生成一次（report_cache），序列化后的同一消息放入全部订阅者队列；本进程写入数据时立即检查
+
+    const source = new EventSource('/subscribe?date=20220720');
+    source.addEventListener('report', e => render(JSON.parse(e.data)));
+
+环境变量：
+    OTC_PUSH_INTERVAL         检查数据变更的间隔 单位：秒，默认2
+    OTC_PUSH_MAX_SUBSCRIBERS  每个进程的订阅连接数上限，默认1000
+"""
+import asyncio
+import logging
+import os
+
+import metrics
+import report_cache
+import report_engine
+import service as sv
+import storage
+import trade_calendar
+
+POLL_INTERVAL = float(os.environ.get('OTC_PUSH_INTERVAL', 2))
+MAX_SUBSCRIBERS = int(os.environ.get('OTC_PUSH_MAX_SUBSCRIBERS', 1000))
+# 无推送时发送注释行的间隔 单位：秒，防止代理断开空闲连接
+HEARTBEAT = 15
+# 每个订阅者待发送消息数上限，客户端读取过慢时丢弃最早的消息（每条消息均为完整数据，只需最新的）
+QUEUE_SIZE = 4
+# 客户端断线重连间隔 单位：毫秒
+RETRY_MS = 5000
+
+log = logging.getLogger(__name__)
+
+PUSH_EVENTS = metrics.Counter('otc_push_events_total', '推送的数据变更次数（每次变更计一次）', ['event'])
+PUSH_MESSAGES = metrics.Counter('otc_push_messages_total', '推送给订阅者的消息数', ['event'])
+PUSH_DROPPED = metrics.Counter('otc_push_dropped_total', '订阅者读取过慢丢弃的消息数')
+
+
+def format_event(event, data, event_id=None):
+    """
+    SSE消息
+    :param event: 事件名称
+    :param data: 消息内容 bytes（单行JSON）
+    :param event_id: 消息标识，客户端重连时以Last-Event-ID请求头带回
+    :return: bytes
+    """
+    head = 'event: ' + event + '\n'
+    if event_id is not None:
+        head = 'id: ' + event_id + '\n' + head
+    return head.encode('utf-8') + b'data: ' + data + b'\n\n'
+
+
+def _build_trade_info(date):
+    """
+    交易信息，当日无记录时同/tradeInfo返回Status 100
+    """
+    try:
+        return sv.query_trade_info(date)
+    except Exception:
+        return {"Status": 100}
+
+
+def _snapshot(date):
+    """
+    生成日期的推送消息（在查询线程池中执行）
+    :param date: 日期
+    :return: (报表ETag, report消息, tradeInfo消息)
+    """
+    entry = report_cache.get(date, report_engine.build_opt_report)
+    trade_info = report_cache.dumps(_build_trade_info(date))
+    return entry.etag, format_event('report', entry.body, entry.etag), format_event('tradeInfo', trade_info)
+
+
+def _tokens(date):
+    """
+    日期的报表依赖的数据标识：当年及上一年度数据（前5日可能跨年）、交易日历
+    """
+    year = date[:4]
+    prev_year = str(int(year) - 1)
+    return storage.year_token(year), storage.year_token(prev_year), trade_calendar.token()
+
+
+class _Topic:
+    """
+    一个日期的订阅者及最近推送的消息
+    """
+
+    def __init__(self):
+        self.queues = set()
+        self.tokens = None
+        self.etag = None
+        self.messages = {}
+
+
+class Hub:
+    """
+    订阅管理及变更检查，每个进程（事件循环）一个实例
+    """
+
+    def __init__(self, interval=None):
+        self.interval = POLL_INTERVAL if interval is None else interval
+        # 日期 -> _Topic
+        self.topics = {}
+        self.loop = None
+        self.wake = None
+        self.task = None
+
+    @property
+    def subscribers(self):
+        return sum(len(topic.queues) for topic in self.topics.values())
+
+    async def subscribe(self, date):
+        """
+        订阅日期，返回的队列中首先放入当前数据
+        :param date: 日期 yyyymmdd
+        :return: asyncio.Queue，内容为SSE消息 bytes
+        """
+        if self.subscribers >= MAX_SUBSCRIBERS:
+            raise OverflowError('订阅连接数超过上限' + str(MAX_SUBSCRIBERS))
+        self._start()
+        topic = self.topics.setdefault(date, _Topic())
+        queue = asyncio.Queue(QUEUE_SIZE)
+        topic.queues.add(queue)
+        if not topic.messages:
+            try:
+                await self._check(date, topic)
+            except BaseException:
+                # 生成当前数据失败（如年度数据不存在）时取消订阅，不占用连接数，后台任务也不再检查该日期
+                self.unsubscribe(date, queue)
+                raise
+        for message in topic.messages.values():
+            self._offer(queue, message)
+        return queue
+
+    def unsubscribe(self, date, queue):
+        topic = self.topics.get(date)
+        if topic is None:
+            return
+        topic.queues.discard(queue)
+        if not topic.queues:
+            del self.topics[date]
+
+    def notify(self, year=None, dates=None):
+        """
+        本进程写入数据后立即检查（storage监听，可在任意线程调用）
+        """
+        if self.loop is not None and self.wake is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.wake.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self.task is not None and not self.task.done() and self.loop is loop:
+            return
+        self.loop = loop
+        self.wake = asyncio.Event()
+        self.task = self.loop.create_task(self._run())
+
+    @staticmethod
+    def _offer(queue, message):
+        if queue.full():
+            queue.get_nowait()
+            PUSH_DROPPED.inc()
+        queue.put_nowait(message)
+
+    async def _check(self, date, topic):
+        """
+        数据标识变化时重新生成消息，内容有变化的消息放入全部订阅者队列
+        """
+        tokens = await sv.run_blocking(_tokens, date)
+        if tokens == topic.tokens:
+            return
+        etag, report, trade_info = await sv.run_blocking(_snapshot, date)
+        topic.tokens = tokens
+        changed = {}
+        if etag != topic.etag:
+            topic.etag = etag
+            changed['report'] = report
+        if trade_info != topic.messages.get('tradeInfo'):
+            changed['tradeInfo'] = trade_info
+        if not changed:
+            return
+        first = not topic.messages
+        topic.messages.update(changed)
+        if first:
+            return
+        for event, message in changed.items():
+            PUSH_EVENTS.labels(event).inc()
+            for queue in list(topic.queues):
+                self._offer(queue, message)
+            PUSH_MESSAGES.labels(event).inc(len(topic.queues))
+        log.info('### 推送%s数据变更 %s 订阅者%d', date, ','.join(changed), len(topic.queues))
+
+    async def _run(self):
+        """
+        后台任务：每interval秒（或本进程写入数据后）检查已订阅日期，没有订阅者时结束
+        """
+        while self.topics:
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            for date, topic in list(self.topics.items()):
+                try:
+                    await self._check(date, topic)
+                except Exception:
+                    log.exception('### 推送数据检查异常 %s', date)
+
+
+hub = Hub()
+storage.add_listener(hub.notify)
+
+
+async def stream(date, last_event_id=None):
+    """
+    订阅日期的SSE消息流，客户端断开（任务取消）时取消订阅
+    :param date: 日期 yyyymmdd
+    :param last_event_id: 客户端重连时的Last-Event-ID，与当前报表ETag相同时不重复发送报表
+    :return: 异步迭代器 bytes
+    """
+    queue = None
+    try:
+        queue = await hub.subscribe(date)
+        yield ('retry: %d\n\n' % RETRY_MS).encode('utf-8')
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b': ping\n\n'
+                continue
+            if last_event_id is not None:
+                if message.startswith(('id: ' + last_event_id + '\n').encode('utf-8')):
+                    last_event_id = None
+                    continue
+                last_event_id = None
+            yield message
+    finally:
+        if queue is not None:
+            hub.unsubscribe(date, queue)
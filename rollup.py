@@ -0,0 +1,187 @@
+import copy
+import threading
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import storage
+
+# 汇总指标
+METRICS = ['trade_num', 'volume', 'turnover']
+
+_lock = threading.Lock()
+# 年份 -> (数据标识, YearRollup)
+_rollups = {}
+
+_CACHE_HIT = metrics.CACHE_REQUESTS.labels('rollup', 'hit')
+_CACHE_MISS = metrics.CACHE_REQUESTS.labels('rollup', 'miss')
+
+
+class YearRollup:
+    """
+    年度累计汇总表：按交易日期升序保存各类型每日汇总值及其累计值
+    任意日期区间的各类型合计为两个累计行之差，日期由有序日期索引二分查找得到
+    """
+
+    def __init__(self, df):
+        grouped = df.groupby(['date', 'type'])[METRICS].sum()
+        self.dates = sorted(grouped.index.get_level_values('date').unique())
+        self.types = sorted(grouped.index.get_level_values('type').unique())
+        full = grouped.reindex(pd.MultiIndex.from_product([self.dates, self.types], names=['date', 'type']))
+        shape = (len(self.dates), len(self.types))
+        # present：(日期, 类型)是否有记录，daily：每日汇总值 [日期, 类型, 指标]
+        self.present = full['trade_num'].notna().values.reshape(shape)
+        self.daily = full.fillna(0).values.reshape(shape + (len(METRICS),))
+        self._accumulate(0)
+
+    def _accumulate(self, start):
+        """
+        从第start个日期起重新计算累计值
+        :param start: 日期序号
+        :return:
+        """
+        if start == 0:
+            self.cum = np.cumsum(self.daily, axis=0)
+            self.present_cum = np.cumsum(self.present, axis=0)
+        else:
+            self.cum[start:] = self.cum[start - 1] + np.cumsum(self.daily[start:], axis=0)
+            self.present_cum[start:] = self.present_cum[start - 1] + np.cumsum(self.present[start:], axis=0)
+
+    def update(self, df, dates):
+        """
+        增量更新指定日期的汇总值
+        :param df: 年度数据表（变更后）
+        :param dates: 变更的日期集合
+        :return: True 更新成功，False 出现新类型需重建
+        """
+        rows = df[df['date'].isin(dates)]
+        if not set(rows['type']).issubset(self.types):
+            return False
+        grouped = rows.groupby(['date', 'type'])[METRICS].sum()
+        start = None
+        for date in sorted(dates):
+            i = bisect_left(self.dates, date)
+            if i == len(self.dates) or self.dates[i] != date:
+                self.dates.insert(i, date)
+                self.present = np.insert(self.present, i, False, axis=0)
+                self.daily = np.insert(self.daily, i, 0, axis=0)
+                self.cum = np.insert(self.cum, i, 0, axis=0)
+                self.present_cum = np.insert(self.present_cum, i, 0, axis=0)
+            self.present[i] = False
+            self.daily[i] = 0
+            if date in grouped.index:
+                day = grouped.loc[date]
+                j = [self.types.index(ctype) for ctype in day.index]
+                self.present[i, j] = True
+                self.daily[i, j] = day.fillna(0).values
+            start = i if start is None else min(start, i)
+        if start is not None:
+            self._accumulate(start)
+        return True
+
+    def _index(self, date):
+        """
+        不晚于date的最后一个日期序号，没有时返回-1
+        """
+        return bisect_right(self.dates, date) - 1
+
+    def totals(self, end, start=None):
+        """
+        日期区间[start, end]内各类型合计
+        :param end: 截止日期 yyyymmdd（含）
+        :param start: 起始日期 yyyymmdd（含），为None时从年初开始
+        :return: DataFrame index：type，columns：METRICS，仅包含区间内有记录的类型
+        """
+        e = self._index(end)
+        s = -1 if start is None else bisect_left(self.dates, start) - 1
+        if e < 0 or e <= s:
+            values = np.zeros((len(self.types), len(METRICS)))
+            present = np.zeros(len(self.types), dtype=bool)
+        else:
+            values = self.cum[e] - (self.cum[s] if s >= 0 else 0)
+            present = self.present_cum[e] - (self.present_cum[s] if s >= 0 else 0) > 0
+        result = pd.DataFrame(values, index=pd.Index(self.types, name='type'), columns=METRICS)[present]
+        result['trade_num'] = result['trade_num'].round().astype('int64')
+        return result
+
+    def frame(self, start=None, end=None):
+        """
+        日期区间[start, end]内各类型每日汇总值
+        :param start: 起始日期 yyyymmdd（含），为None时从年初开始
+        :param end: 截止日期 yyyymmdd（含），为None时至年末
+        :return: DataFrame columns：date, type, METRICS，按(date, type)升序，仅包含有记录的(日期, 类型)
+        """
+        s = 0 if start is None else bisect_left(self.dates, start)
+        e = len(self.dates) if end is None else bisect_right(self.dates, end)
+        e = max(e, s)
+        n = len(self.types)
+        present = self.present[s:e].reshape(-1)
+        result = pd.DataFrame(self.daily[s:e].reshape(-1, len(METRICS))[present], columns=METRICS)
+        result.insert(0, 'type', np.tile(self.types, e - s)[present] if n else [])
+        result.insert(0, 'date', np.repeat(self.dates[s:e], n)[present] if n else [])
+        result['trade_num'] = result['trade_num'].round().astype('int64')
+        return result
+
+    def turnover(self, dates):
+        """
+        指定日期各类型成交额
+        :param dates: 日期列表，没有记录的日期不输出
+        :return: Series index：(date, type)（升序），仅包含有记录的(日期, 类型)
+        """
+        index = []
+        values = []
+        k = METRICS.index('turnover')
+        for date in sorted(dates):
+            i = bisect_left(self.dates, date)
+            if i == len(self.dates) or self.dates[i] != date:
+                continue
+            for j, ctype in enumerate(self.types):
+                if self.present[i, j]:
+                    index.append((date, ctype))
+                    values.append(self.daily[i, j, k])
+        return pd.Series(values, index=pd.MultiIndex.from_tuples(index, names=['date', 'type']),
+                         name='turnover', dtype=float)
+
+
+def get(year):
+    """
+    获得年度累计汇总表，数据被其他进程修改后重建
+    :param year: 年份 yyyy
+    :return: YearRollup
+    """
+    year = str(year)
+    token = storage.year_token(year)
+    with _lock:
+        cached = _rollups.get(year)
+        if cached is not None and cached[0] == token:
+            _CACHE_HIT.inc()
+            return cached[1]
+    _CACHE_MISS.inc()
+    rollup = YearRollup(storage.load_year(year))
+    with _lock:
+        _rollups[year] = (token, rollup)
+    return rollup
+
+
+def _on_change(year, dates):
+    """
+    本进程写入数据后增量更新对应年度的累计汇总表
+    :param year: 年份
+    :param dates: 变更的日期集合
+    :return:
+    """
+    with _lock:
+        cached = _rollups.pop(year, None)
+    if cached is None:
+        return
+    # 在副本上更新，不影响正在读取的请求
+    rollup = copy.deepcopy(cached[1])
+    token = storage.year_token(year)
+    if rollup.update(storage.load_year(year), dates):
+        with _lock:
+            _rollups[year] = (token, rollup)
+
+
+storage.add_listener(_on_change)
@@ -0,0 +1,164 @@
+"""
+采集原始记录归档：各接口返回的原始结果记录按月份追加写入gzip压缩的JSONL分段文件，
+每次归档为一个独立的gzip成员（每行一条结果记录），索引文件记录(日期, 接口)对应的分段文件、偏移量及记录数
+同一(日期, 接口)多次归档时以最后一次为准，原始记录与上次归档相同时不重复写入
+
+    archive/
+        202207.jsonl.gz    分段文件
+        index.jsonl        索引：{"date", "api", "segment", "offset", "length", "rows", "digest", "fetched_at"}
+"""
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import storage
+
+# 是否归档原始记录
+ENABLED = os.environ.get('OTC_ARCHIVE', '1') != '0'
+# 归档目录名（数据目录下）
+ARCHIVE_DIR = 'archive'
+INDEX_FILE = 'index.jsonl'
+# 归档暂存的压缩数据超过该大小时写入临时文件 单位：字节
+SPOOL_SIZE = 1 << 20
+
+_lock = threading.Lock()
+# 索引缓存：归档目录 -> (索引文件大小, {(date, api): 索引记录})
+_indexes = {}
+
+
+def archive_dir():
+    return os.path.join(storage.DATA_DIR, ARCHIVE_DIR)
+
+
+def _load_index(path):
+    """
+    读取索引文件（仅读取上次读取后追加的部分）
+    :param path: 归档目录
+    :return: {(date, api): 索引记录}
+    """
+    index_path = os.path.join(path, INDEX_FILE)
+    size, entries = _indexes.get(path, (0, {}))
+    try:
+        current = os.path.getsize(index_path)
+    except FileNotFoundError:
+        current = 0
+    if current < size:
+        size, entries = 0, {}
+    if current > size:
+        with open(index_path, 'rb') as f:
+            f.seek(size)
+            for line in f.read(current - size).splitlines():
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[(entry['date'], entry['api'])] = entry
+    _indexes[path] = (current, entries)
+    return entries
+
+
+def entries():
+    """
+    全部(日期, 接口)的最新归档索引
+    :return: {(date, api): 索引记录}
+    """
+    with _lock:
+        return dict(_load_index(archive_dir()))
+
+
+class Writer:
+    """
+    一次归档的原始结果记录：采集时逐条压缩为一个gzip成员，暂存在内存（超过SPOOL_SIZE时写入临时文件），
+    不保留记录本身；采集完成后由append写入分段文件
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.length = None
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        self._gzip = gzip.GzipFile(fileobj=self._file, mode='wb')
+
+    def write(self, row):
+        """
+        压缩写入一条结果记录
+        :param row: 结果记录
+        :return:
+        """
+        self._gzip.write((json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.rows += 1
+
+    def finish(self):
+        """
+        结束压缩
+        :return: 压缩后的字节数
+        """
+        if self.length is None:
+            self._gzip.close()
+            self.length = self._file.tell()
+        return self.length
+
+    def copy_to(self, f):
+        """
+        将压缩数据写入文件
+        :param f: 二进制文件对象
+        :return:
+        """
+        self.finish()
+        self._file.seek(0)
+        shutil.copyfileobj(self._file, f)
+
+    def close(self):
+        self._gzip.close()
+        self._file.close()
+
+
+def append(date, api, writer, digest=None):
+    """
+    归档一次采集的原始结果记录
+    :param date: 采集信息日期 yyyymmdd
+    :param api: 接口名称
+    :param writer: 已写入结果记录的Writer
+    :param digest: 原始记录摘要，与上次归档相同时不写入
+    :return: True 已写入，False 与上次归档相同
+    """
+    path = archive_dir()
+    length = writer.finish()
+    # 定时任务与手工采集、补采进程可能同时归档，分段文件偏移量与索引须在写锁内确定
+    with _lock, storage.file_lock(os.path.join(path, INDEX_FILE)):
+        last = _load_index(path).get((date, api))
+        if digest is not None and last is not None and last.get('digest') == digest:
+            return False
+        segment = date[:6] + '.jsonl.gz'
+        with open(os.path.join(path, segment), 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            writer.copy_to(f)
+        entry = {
+            'date': date,
+            'api': api,
+            'segment': segment,
+            'offset': offset,
+            'length': length,
+            'rows': writer.rows,
+            'digest': digest,
+            'fetched_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with open(os.path.join(path, INDEX_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    return True
+
+
+def iter_rows(date, api):
+    """
+    逐条读取(日期, 接口)最后一次归档的原始结果记录，流式解压，不整体读入内存
+    :param date: 采集信息日期 yyyymmdd
+    :param api: 接口名称
+    :return: 结果记录生成器，未归档时抛出KeyError
+    """
+    entry = entries()[(date, api)]
+    with open(os.path.join(archive_dir(), entry['segment']), 'rb') as f:
+        f.seek(entry['offset'])
+        with gzip.GzipFile(fileobj=f, mode='rb') as member:
+            for _ in range(entry['rows']):
+                yield json.loads(member.readline())
@@ -0,0 +1,244 @@
+"""
+历史数据补采：按交易日历过滤日期区间，多个日期并发采集，全部采集接口共享请求频率限制，
+采集结果按年度缓存后合并写入，进度记录在断点文件中，中断后重新执行同一命令从断点继续
+
+    python -m schedule_service.backfill --start 20220101 --end 20220720 --workers 4 --rate 10
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+import logger
+import metrics
+import storage
+import trade_calendar
+import variety_facts
+from schedule_service import dce_client, otc_daily_rept
+
+log = logging.getLogger(__name__)
+
+# 同时采集的日期数
+WORKERS = 4
+# 全部采集接口每秒请求数上限
+RATE = 10
+# 断点文件名（数据目录下）
+CHECKPOINT_FILE = 'backfill_checkpoint.json'
+
+
+class RateLimiter:
+    """
+    令牌桶限流：每秒补充rate个令牌，最多积累burst个，多线程共享
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        取得一个令牌，令牌不足时等待
+        :return:
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimitedSession(requests.Session):
+    """
+    发送请求前先取得限流令牌的HTTP会话
+    """
+
+    def __init__(self, limiter):
+        super().__init__()
+        self.limiter = limiter
+        dce_client.new_session(self)
+
+    def request(self, *args, **kwargs):
+        self.limiter.acquire()
+        return super().request(*args, **kwargs)
+
+
+class Checkpoint:
+    """
+    补采断点：已保存的日期及失败日期，每次保存后原子替换断点文件
+    """
+
+    def __init__(self, path, start, end):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.done = set()
+        self.failed = {}
+
+    @classmethod
+    def load(cls, path, start, end):
+        """
+        读取断点文件，文件不存在或日期区间不同时重新开始
+        :param path: 断点文件路径
+        :param start: 起始日期
+        :param end: 截止日期
+        :return: Checkpoint
+        """
+        checkpoint = cls(path, start, end)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('start') == start and data.get('end') == end:
+                checkpoint.done = set(data.get('done', []))
+                checkpoint.failed = data.get('failed', {})
+        return checkpoint
+
+    def save(self):
+        data = {
+            'start': self.start,
+            'end': self.end,
+            'done': sorted(self.done),
+            'failed': self.failed,
+        }
+        with storage.atomic_write(self.path) as tmp, open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+
+    def mark(self, dates, errors):
+        """
+        记录已保存的日期
+        :param dates: 已保存的日期列表
+        :param errors: 日期 -> 异常信息，有异常的日期下次继续补采
+        :return:
+        """
+        for date in dates:
+            if date in errors:
+                self.failed[date] = errors[date]
+            else:
+                self.done.add(date)
+                self.failed.pop(date, None)
+        self.save()
+
+
+def stored_dates(dates):
+    """
+    已有数据的日期
+    :param dates: 日期列表
+    :return: 其中已有记录的日期集合
+    """
+    stored = set()
+    for year in sorted({date[:4] for date in dates}):
+        if storage.year_exists(year):
+            stored.update(storage.load_year(year)['date'])
+    return stored.intersection(dates)
+
+
+def pending_dates(start, end, done=(), overwrite=False):
+    """
+    日期区间内待补采的交易日
+    :param start: 起始日期 yyyymmdd（含）
+    :param end: 截止日期 yyyymmdd（含）
+    :param done: 已完成的日期
+    :param overwrite: True 重新采集已有数据的日期，False 跳过已有数据的日期
+    :return: 日期列表（升序）
+    """
+    done = set(done)
+    dates = [date for date in trade_calendar.get().between(start, end) if date not in done]
+    if not overwrite:
+        stored = stored_dates(dates)
+        dates = [date for date in dates if date not in stored]
+    return dates
+
+
+def _collect(date, session):
+    """
+    采集一个日期的全部业务类型数据（在线程池中执行）
+    :return: (date, records, facts, errors) facts：品种明细 [(日期, 业务类型, 品种明细)]
+    """
+    breakdowns = {}
+    records, errors = otc_daily_rept.collect(date, session, breakdowns=breakdowns)
+    ctypes = [ctype for ctype in otc_daily_rept.COLLECTORS if ctype in records]
+    return date, [records[ctype] for ctype in ctypes], [(date, ctype, breakdowns[ctype]) for ctype in ctypes], \
+        {ctype: repr(e) for ctype, e in errors.items()}
+
+
+def run(start, end, workers=WORKERS, rate=RATE, checkpoint_path=None, restart=False, flush_every=0,
+        overwrite=False):
+    """
+    补采日期区间内的交易日数据
+    按年度分组采集，同一年度的结果合并后写入一次（flush_every大于0时每采集flush_every个日期写入一次）
+    默认跳过已有数据的日期；overwrite时重新采集并更新，人工维护的字段（otc_daily_rept.MANUAL_FIELDS）保留原值
+
+    :param start: 起始日期 yyyymmdd（含）
+    :param end: 截止日期 yyyymmdd（含）
+    :param workers: 同时采集的日期数
+    :param rate: 全部采集接口每秒请求数上限
+    :param checkpoint_path: 断点文件路径，默认数据目录下CHECKPOINT_FILE
+    :param restart: True 忽略已有断点重新补采
+    :param flush_every: 每采集多少个日期写入一次，0为每个年度写入一次
+    :param overwrite: True 重新采集已有数据的日期
+    :return: Checkpoint
+    """
+    checkpoint_path = checkpoint_path or os.path.join(storage.DATA_DIR, CHECKPOINT_FILE)
+    if restart:
+        checkpoint = Checkpoint(checkpoint_path, start, end)
+    else:
+        checkpoint = Checkpoint.load(checkpoint_path, start, end)
+    dates = pending_dates(start, end, checkpoint.done, overwrite)
+    log.info('### 历史数据补采 %s-%s 待补采%d个交易日（已完成%d个）', start, end, len(dates), len(checkpoint.done))
+    session = RateLimitedSession(RateLimiter(rate))
+
+    years = {}
+    for date in dates:
+        years.setdefault(date[:4], []).append(date)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for year, year_dates in sorted(years.items()):
+            size = flush_every or len(year_dates)
+            for i in range(0, len(year_dates), size):
+                batch = year_dates[i:i + size]
+                records = []
+                facts = []
+                errors = {}
+                futures = [pool.submit(_collect, date, session) for date in batch]
+                for future in as_completed(futures):
+                    date, date_records, date_facts, date_errors = future.result()
+                    records.extend(date_records)
+                    facts.extend(date_facts)
+                    if date_errors:
+                        errors[date] = date_errors
+                        log.error('### 历史数据补采 %s 采集异常：%s', date, date_errors, extra={'date': date})
+                otc_daily_rept.save_records(records, otc_daily_rept.MANUAL_FIELDS)
+                variety_facts.save(facts)
+                checkpoint.mark(batch, errors)
+                log.info('### 历史数据补采 %s 已保存%d个交易日', year, len(batch))
+    session.close()
+    return checkpoint
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='OTC日报历史数据补采')
+    parser.add_argument('--start', required=True, help='起始日期 yyyymmdd')
+    parser.add_argument('--end', required=True, help='截止日期 yyyymmdd')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='同时采集的日期数')
+    parser.add_argument('--rate', type=float, default=RATE, help='每秒请求数上限')
+    parser.add_argument('--checkpoint', default=None, help='断点文件路径')
+    parser.add_argument('--restart', action='store_true', help='忽略已有断点重新补采')
+    parser.add_argument('--flush-every', type=int, default=0, help='每采集多少个日期写入一次，默认每个年度一次')
+    parser.add_argument('--overwrite', action='store_true', help='重新采集已有数据的日期（保留人工维护的字段）')
+    args = parser.parse_args()
+    logger.setup(stream=True)
+    metrics.setup()
+    result = run(args.start, args.end, args.workers, args.rate, args.checkpoint, args.restart, args.flush_every,
+                 args.overwrite)
+    print('done: %d, failed: %s' % (len(result.done), sorted(result.failed)))
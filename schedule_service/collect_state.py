@@ -0,0 +1,139 @@
+"""
+采集状态：记录各日期各业务类型上次保存的汇总记录指纹与原始记录摘要，
+定时采集时仅在数据变化时写入，连续多次采集结果不变后标记当日数据已完成，不再重复采集
+修改采集状态时使用CollectState.locked()（文件锁data/.collect_state.json.lock）
+"""
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+import storage
+
+# 采集状态文件名（数据目录下）
+STATE_FILE = 'collect_state.json'
+# 连续多少次采集结果不变视为当日数据已完成
+STABLE_TICKS = int(os.environ.get('OTC_STABLE_TICKS', 3))
+# 保留最近多少个日期的采集状态
+KEEP_DATES = 30
+
+
+def fingerprint(record):
+    """
+    汇总记录指纹（品种ID、品种名称、交易笔数、成交量、成交额）
+    :param record: save_data参数元组 (date, type, variety_ids, variety_names, trade_num, volume, turnover)
+    :return: 指纹字符串
+    """
+    date, ctype, variety_ids, variety_names, trade_num, volume, turnover = record
+    values = [variety_ids, variety_names] + [None if value is None else round(float(value), 4)
+                                             for value in (trade_num, volume, turnover)]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def published(records):
+    """
+    当日数据是否已发布：任一业务类型有成交
+    :param records: 业务类型 -> save_data参数元组
+    :return: bool
+    """
+    return any(record[4] for record in records.values())
+
+
+class CollectState:
+    """
+    采集状态文件
+    {日期: {"complete": 是否已完成, "published": 是否已发布, "types": {类型: {"fingerprint": 汇总记录指纹, "rows": 原始记录摘要, "stable": 连续未变化次数}}}}
+    """
+
+    def __init__(self, path, dates=None):
+        self.path = path
+        self.dates = dates or {}
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        读取采集状态文件，文件不存在时为空状态
+        :param path: 文件路径，默认数据目录下STATE_FILE
+        :return: CollectState
+        """
+        path = path or os.path.join(storage.DATA_DIR, STATE_FILE)
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(path, json.load(f))
+
+    @classmethod
+    @contextmanager
+    def locked(cls, path=None):
+        """
+        持有采集状态文件锁读取采集状态，with块正常结束时保存（异常时不保存）；
+        定时任务、手工采集等进程的读取、修改、保存依次执行，更新不会互相覆盖
+
+            with CollectState.locked() as state:
+                state.mark_complete(date)
+
+        :param path: 文件路径，默认数据目录下STATE_FILE
+        :return: CollectState
+        """
+        path = path or os.path.join(storage.DATA_DIR, STATE_FILE)
+        with storage.file_lock(path):
+            state = cls.load(path)
+            yield state
+            state.save()
+
+    def save(self):
+        """
+        原子替换采集状态文件，仅保留最近KEEP_DATES个日期
+        :return:
+        """
+        for date in sorted(self.dates)[:-KEEP_DATES]:
+            del self.dates[date]
+        with storage.atomic_write(self.path) as tmp, open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.dates, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    def is_complete(self, date):
+        """
+        :param date: 日期 yyyymmdd
+        :return: True 当日数据已完成
+        """
+        return self.dates.get(date, {}).get('complete', False)
+
+    def update(self, date, records, digests, errors):
+        """
+        比较本次采集结果与上次状态，更新连续未变化次数
+        :param date: 日期 yyyymmdd
+        :param records: 业务类型 -> save_data参数元组
+        :param digests: 业务类型 -> 原始记录摘要
+        :param errors: 业务类型 -> 异常
+        :return: 汇总记录有变化、需要写入的业务类型列表
+        """
+        day = self.dates.setdefault(date, {'complete': False, 'types': {}})
+        changed = []
+        for ctype, record in records.items():
+            current = {'fingerprint': fingerprint(record), 'rows': digests.get(ctype)}
+            last = day['types'].get(ctype)
+            if last is None or last['fingerprint'] != current['fingerprint']:
+                changed.append(ctype)
+                current['stable'] = 0
+            elif last['rows'] != current['rows']:
+                # 原始记录变化但汇总结果不变，无需写入
+                current['stable'] = 0
+            else:
+                current['stable'] = last['stable'] + 1
+            day['types'][ctype] = current
+        for ctype in errors:
+            if ctype in day['types']:
+                day['types'][ctype]['stable'] = 0
+        # 数据尚未发布（全部业务类型均无成交）时不视为已完成，继续采集
+        day['published'] = day.get('published', False) or published(records)
+        day['complete'] = day['published'] and not errors and \
+            all(day['types'][ctype]['stable'] >= STABLE_TICKS for ctype in records)
+        return changed
+
+    def mark_complete(self, date):
+        """
+        标记日期数据已完成（交易日采集时段结束后补采成功的日期，数据不再变化）
+        :param date: 日期 yyyymmdd
+        :return:
+        """
+        self.dates.setdefault(date, {'complete': False, 'types': {}})['complete'] = True
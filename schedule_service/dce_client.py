@@ -0,0 +1,238 @@
+"""
+大商所OTC门户接口客户端：共享keep-alive连接池、连接/读取超时、带随机抖动的指数退避重试、
+按接口熔断（连续失败达到阈值后一段时间内直接失败，不再请求该接口），以及按接口统计请求延迟与异常次数
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+
+import metrics
+
+HEADERS = {
+    'Content-Type': 'application/json;charset=UTF-8',
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.105 Safari/537.36DCE@jcb202207otc",
+}
+
+# 连接超时、读取超时 单位：秒
+CONNECT_TIMEOUT = float(os.environ.get('OTC_DCE_CONNECT_TIMEOUT', 3))
+READ_TIMEOUT = float(os.environ.get('OTC_DCE_READ_TIMEOUT', 5))
+# 失败后重试次数
+RETRIES = int(os.environ.get('OTC_DCE_RETRIES', 2))
+# 退避时间：第n次重试前等待 [0, min(BACKOFF_MAX, BACKOFF_BASE * 2^n)] 内的随机时间 单位：秒
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+# 连续失败次数达到阈值后熔断，熔断期间直接失败，RESET_TIMEOUT秒后放行一次试探请求
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 60
+# 连接池大小，不小于并发请求数
+POOL_SIZE = 32
+# 延迟统计保留最近的请求数
+LATENCY_WINDOW = 200
+
+_session = None
+_session_lock = threading.Lock()
+_lock = threading.Lock()
+# 接口名称 -> CircuitBreaker
+_breakers = {}
+# 接口名称 -> EndpointStats
+_stats = {}
+
+
+class CircuitOpenError(Exception):
+    """
+    接口已熔断
+    """
+
+
+class CircuitBreaker:
+    """
+    接口熔断器 closed：正常请求；open：直接失败；half_open：放行一次试探请求，成功后恢复，失败后重新熔断
+    """
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = 'closed'
+        self.opened_at = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        :return: True 可以请求
+        """
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # 试探请求期间其他请求仍直接失败
+                self.state = 'half_open'
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = 'closed'
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class EndpointStats:
+    """
+    单个接口的请求统计
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.last_error = None
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        result = {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'last_error': self.last_error,
+        }
+        if latencies:
+            result['p50_ms'] = round(latencies[len(latencies) // 2] * 1000, 1)
+            result['p95_ms'] = round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000, 1)
+            result['max_ms'] = round(latencies[-1] * 1000, 1)
+        return result
+
+
+def get_session():
+    """
+    获取共享HTTP会话，各采集接口复用连接池中的keep-alive连接
+    :return: requests.Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = new_session()
+    return _session
+
+
+def new_session(session=None):
+    """
+    创建使用连接池的HTTP会话
+    :param session: 已创建的会话（如限流会话），为None时新建requests.Session
+    :return: requests.Session
+    """
+    session = session or requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def breaker(api):
+    with _lock:
+        if api not in _breakers:
+            _breakers[api] = CircuitBreaker()
+        return _breakers[api]
+
+
+def _endpoint_stats(api):
+    with _lock:
+        if api not in _stats:
+            _stats[api] = EndpointStats()
+        return _stats[api]
+
+
+def _backoff(attempt):
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def post_json(api, url, body, session=None, retries=None):
+    """
+    请求接口并解析JSON结果，网络异常、超时、5xx/429响应及无法解析的结果按指数退避重试
+    :param api: 接口名称（熔断及统计按接口名称区分）
+    :param url: 接口地址
+    :param body: 请求体字符串
+    :param session: HTTP会话，默认使用共享会话
+    :param retries: 重试次数，默认RETRIES
+    :return: 解析后的JSON结果
+    """
+    if session is None:
+        session = get_session()
+    retries = RETRIES if retries is None else retries
+    circuit = breaker(api)
+    stats = _endpoint_stats(api)
+    latency = metrics.DCE_REQUEST_SECONDS.labels(api)
+    attempt = 0
+    while True:
+        if not circuit.allow():
+            with _lock:
+                stats.rejected += 1
+            raise CircuitOpenError(api)
+        start = time.perf_counter()
+        try:
+            resp = session.post(url, data=body, headers=HEADERS, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            if resp.status_code >= 500 or resp.status_code == 429:
+                raise requests.HTTPError('%d %s' % (resp.status_code, resp.reason), response=resp)
+            resp.raise_for_status()
+            result = resp.json()
+        except (requests.RequestException, ValueError) as e:
+            retryable = not isinstance(e, requests.HTTPError) or e.response is None or \
+                e.response.status_code >= 500 or e.response.status_code == 429
+            circuit.failure()
+            elapsed = time.perf_counter() - start
+            latency.observe(elapsed)
+            metrics.DCE_ERRORS.labels(api).inc()
+            with _lock:
+                stats.requests += 1
+                stats.errors += 1
+                stats.latencies.append(elapsed)
+                stats.last_error = repr(e)
+            if not retryable or attempt >= retries:
+                raise
+            attempt += 1
+            with _lock:
+                stats.retries += 1
+            time.sleep(_backoff(attempt))
+            continue
+        circuit.success()
+        elapsed = time.perf_counter() - start
+        latency.observe(elapsed)
+        with _lock:
+            stats.requests += 1
+            stats.latencies.append(elapsed)
+        return result
+
+
+def stats():
+    """
+    各接口请求统计及熔断状态
+    :return: 接口名称 -> 统计数据
+    """
+    with _lock:
+        result = {api: endpoint.summary() for api, endpoint in _stats.items()}
+        for api, circuit in _breakers.items():
+            result.setdefault(api, {})['circuit'] = circuit.state
+    return result
+
+
+def reset():
+    """
+    清空熔断状态及请求统计
+    :return:
+    """
+    with _lock:
+        _breakers.clear()
+        _stats.clear()
@@ -1,19 +1,42 @@
+import hashlib
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
 import datetime
 import json
-import pandas as pd
-import csv
-import os
-import utils
-
-log = utils.get_log()
-HEADERS = {
-    'Content-Type': 'application/json;charset=UTF-8',
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.105 Safari/537.36DCE@jcb202207otc",
+import time
+import metrics
+import storage
+import trade_calendar
+import variety_facts
+from schedule_service import archive, collect_state, dce_client
+
+log = logging.getLogger(__name__)
+API_URL = 'http://otc.dce.com.cn/portal/data/app/{api}'
+# 单个接口并发请求分页数上限
+PAGE_WORKERS = 4
+# 返回结果总记录数字段
+TOTAL_KEY = 'total'
+# 不按日期查询的接口：接口名称 -> 日期字段，结果按该字段倒序，分页请求至出现早于采集日期的记录为止
+DATE_FIELDS = {'wbillApplyList': 'opDate'}
+
+# 接口名称 -> 返回结果数据字段
+RESULT_KEYS = {
+    'wbillMatchList': 'wbillMatchResultData',
+    'wbillApplyList': 'wbillMatchResultData',
+    'nonWbillMatchList': 'spotResultData',
+    'indexBasis': 'basisResultData',
+    'swapMatch': 'swapResultData',
+    'optMatch': 'optResultData',
 }
 
+# 更新已有记录时保留原值的字段 类型 -> 字段列表
+PRESERVE_ON_UPDATE = {'swap': ['turnover']}
+# 人工维护的字段（商品互换名义本金，场外期权成交额、成交笔数、品种，见service.update_opt_turnover）
+# 补采、补录等重新写入已有日期时保留原值，期权采集结果恒为空，覆盖会清除人工录入的数据
+MANUAL_FIELDS = {'swap': ['turnover'], 'opt': ['variety_names', 'trade_num', 'turnover']}
+
 # 品种排序
 variety_order = {
     '豆一': 1,
@@ -43,34 +66,281 @@ def sorted_variety(l):
     return sorted(l, key=lambda x: variety_order[x] if x in variety_order else 999)
 
 
-def job(date=None):
+def _add_variety(breakdown, name, trade_num, volume, turnover):
+    """
+    累加品种明细
+    :param breakdown: 品种名称 -> [交易笔数, 成交量, 成交额]，为None时不统计
+    :param name: 品种名称
+    :param trade_num: 交易笔数
+    :param volume: 成交量，未知时为None
+    :param turnover: 成交额，未知时为None
+    :return:
+    """
+    if breakdown is None or not name:
+        return
+    item = breakdown.get(name)
+    if item is None:
+        breakdown[name] = [trade_num, volume, turnover]
+        return
+    item[0] += trade_num
+    if volume is not None:
+        item[1] = (item[1] or 0) + volume
+    if turnover is not None:
+        item[2] = (item[2] or 0) + turnover
+
+
+def job(date=None, concurrent=True, force=False, preserve=None):
     """
     采集当日期权各报表基础数据（标准仓单 非标仓单 基差交易 商品互换 场外期权）
+    并发采集时仅保存汇总结果有变化的业务类型，连续STABLE_TICKS次采集结果不变后当日数据标记为已完成，不再采集
+    :param date: 采集信息日期，默认当日
+    :param concurrent: True 各接口并发采集，全部完成后统一保存；False 按业务类型依次采集保存
+    :param force: True 忽略采集状态，重新采集并保存全部业务类型
+    :param preserve: 并发采集更新已有记录时保留原值的字段 类型 -> 字段列表，默认PRESERVE_ON_UPDATE
     :return: flag：True 成功，False 失败
     """
+    start = time.perf_counter()
+    result = 'error'
+    try:
+        flag = _job(date, concurrent, force, preserve)
+        result = 'ok' if flag else 'failed'
+        if flag:
+            metrics.JOB_LAST_SUCCESS.set(time.time())
+        return flag
+    finally:
+        metrics.JOB_SECONDS.labels(result).observe(time.perf_counter() - start)
+
+
+def _job(date, concurrent, force, preserve):
     # date = '20220225'
     if date is None:
         date = datetime.datetime.now().strftime('%Y%m%d')
-    trade_dates = []
-    with open('data/trade_date.csv', 'r') as f:
-        reader = csv.reader(f)
-        for line in reader:
-            trade_dates.append(line[0])
-    if date in trade_dates:
+    if trade_calendar.get().is_trading_day(date):
+        if concurrent:
+            if collect_state.CollectState.load().is_complete(date) and not force:
+                log.info('### %s 数据已完成，跳过采集', date, extra={'date': date})
+                return True
+            digests = {}
+            breakdowns = {}
+            records, errors = collect(date, digests=digests, breakdowns=breakdowns)
+            # 采集完成后加锁比较并保存，与同时运行的手工采集等其他进程的更新不会互相覆盖
+            with collect_state.CollectState.locked() as state:
+                changed = state.update(date, records, digests, errors)
+                if force:
+                    changed = list(records)
+                if changed:
+                    save_records([records[ctype] for ctype in COLLECTORS if ctype in changed], preserve)
+                else:
+                    log.info('### %s 数据无变化', date, extra={'date': date})
+                # 品种明细与已保存的相同时不写入
+                variety_facts.save((date, ctype, breakdowns[ctype]) for ctype in COLLECTORS if ctype in records)
+            if state.is_complete(date):
+                log.info('### %s 连续%d次采集结果不变，数据已完成', date, collect_state.STABLE_TICKS, extra={'date': date})
+            return len(errors) == 0
         wbill_match(date)
         non_wbill_match(date)
         index_basis(date)
         swap_match(date)
         opt_match(date)
+        return True
+    return False
 
 
-def wbill_match(date):
+def fetch_page(api, payload, page, session=None):
     """
-    标准仓单信息采集服务
-    标准仓单采集交易笔数、品种列表、成交量、成交额
+    请求采集接口的某一页
+    :param api: 接口名称
+    :param payload: 请求参数
+    :param page: 页码，从1开始
+    :param session: HTTP会话，默认使用共享会话
+    :return: (rows, total) 本页结果记录列表，总记录数（接口未返回时为None）
+    """
+    data = dict(payload, page=page)
+    result = dce_client.post_json(api, API_URL.format(api=api), json.dumps(data), session)['data'][RESULT_KEYS[api]]
+    total = result.get(TOTAL_KEY)
+    return result['rows'], None if total is None else int(total)
+
 
+def stop_condition(api, date):
+    """
+    不按日期查询的接口（DATE_FIELDS）停止分页的条件：记录日期早于采集日期
+    :param api: 接口名称
     :param date: 采集信息日期
-    :return:
+    :return: stop(row) -> bool，其他接口返回None
+    """
+    field = DATE_FIELDS.get(api)
+    if field is None or date is None:
+        return None
+    return lambda row: str(row.get(field) or '') < date
+
+
+def iter_rows(api, payload, session=None, first_page=None, max_workers=PAGE_WORKERS, stop=None):
+    """
+    分页请求采集接口，逐条返回全部结果记录
+    首页返回总记录数后，其余分页并发请求（同时请求的分页数不超过max_workers），按页码顺序输出
+
+    :param api: 接口名称
+    :param payload: 请求参数，limit为每页记录数
+    :param session: HTTP会话，默认使用共享会话
+    :param first_page: 已发起的首页请求（Future），为None时在此请求首页
+    :param max_workers: 并发请求分页数上限
+    :param stop: stop(row)为True时该记录及之后的记录均不需要（结果有序），逐页请求至本页最后一条记录满足条件为止
+    :return: 结果记录生成器
+    """
+    limit = payload['limit']
+    if first_page is None:
+        rows, total = fetch_page(api, payload, 1, session)
+    else:
+        rows, total = first_page.result()
+    yield from rows
+    if stop is not None:
+        pages = None if total is None else -(-total // limit)
+        page = 1
+        while len(rows) >= limit and not stop(rows[-1]) and (pages is None or page < pages):
+            page += 1
+            rows, _ = fetch_page(api, payload, page, session)
+            yield from rows
+        return
+    if total is None:
+        # 接口未返回总记录数，逐页请求直至不足一页
+        page = 1
+        while len(rows) >= limit:
+            page += 1
+            rows, _ = fetch_page(api, payload, page, session)
+            yield from rows
+        return
+    pages = -(-total // limit)
+    if pages <= 1:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, pages - 1)) as pool:
+        pending = deque()
+        next_page = 2
+        while pending or next_page <= pages:
+            while next_page <= pages and len(pending) < max_workers:
+                pending.append(pool.submit(fetch_page, api, payload, next_page, session))
+                next_page += 1
+            rows, _ = pending.popleft().result()
+            yield from rows
+
+
+def fetch_all(name, requests_map, session=None, date=None):
+    """
+    打开某一业务类型全部采集接口的结果记录流
+    :param name: 采集服务名称
+    :param requests_map: 接口名称 -> 请求参数
+    :param session: HTTP会话
+    :param date: 采集信息日期，不按日期查询的接口请求至早于该日期的记录为止
+    :return: 接口名称 -> 结果记录生成器
+    """
+    rows_map = {}
+    for api, payload in requests_map.items():
+        log.info('### %s API:%s', name, API_URL.format(api=api))
+        rows_map[api] = iter_rows(api, payload, session, stop=stop_condition(api, date))
+    return rows_map
+
+
+def _hashed(api, rows, digest, writer=None):
+    """
+    逐条输出结果记录，同时计入原始记录摘要及结果记录数
+    :param api: 接口名称
+    :param rows: 结果记录迭代器
+    :param digest: hashlib摘要对象
+    :param writer: 传入archive.Writer时逐条压缩写入归档（不保留记录）
+    :return: 结果记录生成器
+    """
+    count = 0
+    try:
+        for row in rows:
+            digest.update(json.dumps(row, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+            if writer is not None:
+                writer.write(row)
+            count += 1
+            yield row
+    finally:
+        metrics.COLLECTOR_ROWS.labels(api).inc(count)
+
+
+def _aggregate(date, ctype, requests_map, first_pages, session):
+    """
+    汇总某一业务类型的采集结果（在线程池中执行）
+    :param date: 采集信息日期
+    :param ctype: 业务类型
+    :param requests_map: 接口名称 -> 请求参数
+    :param first_pages: 接口名称 -> 首页请求Future
+    :param session: HTTP会话
+    :return: (save_data参数元组, 原始记录摘要, 品种明细)
+    """
+    digests = {api: hashlib.sha1(api.encode('utf-8')) for api in requests_map}
+    writers = {api: archive.Writer() for api in requests_map} if archive.ENABLED else {}
+    try:
+        rows_map = {}
+        for api, payload in requests_map.items():
+            rows = iter_rows(api, payload, session, first_pages[api], stop=stop_condition(api, date))
+            rows_map[api] = _hashed(api, rows, digests[api], writers.get(api))
+        breakdown = {}
+        with metrics.COLLECTOR_SECONDS.labels(ctype).time():
+            record = COLLECTORS[ctype][2](date, rows_map, breakdown)
+        for api, writer in writers.items():
+            # 汇总时未读取完的结果记录也全部归档，重新汇总时可完整回放
+            for _ in rows_map[api]:
+                pass
+            archive.append(date, api, writer, digests[api].hexdigest())
+    finally:
+        for writer in writers.values():
+            writer.close()
+    digest = hashlib.sha1()
+    for api in sorted(digests):
+        digest.update(digests[api].digest())
+    return record, digest.hexdigest(), breakdown
+
+
+def collect(date, session=None, digests=None, breakdowns=None):
+    """
+    并发采集当日各业务类型数据，全部接口的首页请求同时发出，其余分页由各业务类型并发请求并逐页汇总
+    整体耗时取决于最慢的接口；各业务类型的采集结果与异常分别记录，任一接口异常不影响其他业务类型
+
+    :param date: 采集信息日期
+    :param session: HTTP会话，默认使用共享会话
+    :param digests: 传入dict时写入 业务类型 -> 原始记录摘要
+    :param breakdowns: 传入dict时写入 业务类型 -> 品种明细 {品种名称: [交易笔数, 成交量, 成交额]}
+    :return: (records, errors) records：业务类型 -> save_data参数元组；errors：业务类型 -> 异常
+    """
+    if session is None:
+        session = dce_client.get_session()
+    plans = {ctype: build(date) for ctype, (name, build, aggregate) in COLLECTORS.items()}
+    workers = sum(len(requests_map) for requests_map in plans.values()) + len(plans)
+    futures = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        first_pages = {}
+        for ctype, requests_map in plans.items():
+            name = COLLECTORS[ctype][0]
+            first_pages[ctype] = {}
+            for api, payload in requests_map.items():
+                log.info('### %s API:%s', name, API_URL.format(api=api))
+                first_pages[ctype][api] = pool.submit(fetch_page, api, payload, 1, session)
+        for ctype, requests_map in plans.items():
+            futures[ctype] = pool.submit(_aggregate, date, ctype, requests_map, first_pages[ctype], session)
+
+    records = {}
+    errors = {}
+    for ctype, future in futures.items():
+        try:
+            records[ctype], digest, breakdown = future.result()
+            if digests is not None:
+                digests[ctype] = digest
+            if breakdowns is not None:
+                breakdowns[ctype] = breakdown
+        except Exception as e:
+            log.error('### %s 接口异常：%r', COLLECTORS[ctype][0], e, extra={'date': date, 'type': ctype})
+            errors[ctype] = e
+    return records, errors
+
+
+def wbill_requests(date):
+    """
+    标准仓单采集接口请求参数
+    :param date: 采集信息日期
+    :return: 接口名称 -> 请求参数
     """
     data = {
         "wbillMatchQryData": {
@@ -87,47 +357,66 @@ def wbill_match(date):
         },
         "page": 1,
         "limit": 1000}
+    return {'wbillMatchList': data, 'wbillApplyList': data2}
 
-    try:
-        api_url = 'http://otc.dce.com.cn/portal/data/app/wbillMatchList'
-        log.info('### 标准仓单信息采集服务 API:' + api_url)
-        api2_url = 'http://otc.dce.com.cn/portal/data/app/wbillApplyList'
-        resp = requests.post(api_url, data=json.dumps(data), headers=HEADERS, timeout=5)
-        resp2 = requests.post(api2_url, data=json.dumps(data2), headers=HEADERS, timeout=5)
-        result = json.loads(resp.text)
-        result2 = json.loads(resp2.text)
-    except Exception as e:
-        log.error('### 标准仓单信息采集服务 API:' + api_url + ' 接口异常：' + e)
-
-    rows = result['data']['wbillMatchResultData']['rows']
-    rows2 = result2['data']['wbillMatchResultData']['rows']
-    log.info('### 标准仓单信息采集服务 采集' + str(len(rows)) + '条结果')
-    if len(rows) > 0:
+
+def wbill_record(date, rows_map, breakdown=None):
+    """
+    标准仓单采集交易笔数、品种列表、成交量、成交额
+
+    :param date: 采集信息日期
+    :param rows_map: 接口名称 -> 结果记录（可迭代对象，仅遍历一次）
+    :param breakdown: 传入dict时写入品种明细 品种名称 -> [交易笔数, 成交量, 成交额]
+    :return: save_data参数元组
+    """
+    count = 0
+    variety_id_set = set()
+    variety_name_set = set()
+    volume = 0
+    turnover = 0
+    for row in rows_map['wbillMatchList']:
+        count += 1
+        variety_id_set.add(row['varietyId'])
+        variety_name_set.add(row['varietyName'])
+        # 成交量 单位：吨
+        volume += float(row['matchTotWeight'])
+        # 成交额 单位：元
+        turnover += float(row['turnover'])
+        _add_variety(breakdown, row['varietyName'], 0, float(row['matchTotWeight']), float(row['turnover']))
+    log.info('### 标准仓单信息采集服务 采集%d条结果', count, extra={'date': date, 'type': 'wbill'})
+    if count > 0:
         log.info('### 标准仓单信息采集服务 处理流程 start')
         # 交易品种
-        variety_ids = ','.join(set([row['varietyId'] for row in rows]))
-        variety_names = '、'.join(sorted_variety(set([row['varietyName'] for row in rows])))
+        variety_ids = ','.join(variety_id_set)
+        variety_names = '、'.join(sorted_variety(variety_name_set))
         # 交易笔数
-        trade_num = len([row for row in rows2 if row['opDate'] == date])
-        # 成交量 单位：吨
-        volume = sum([float(row['matchTotWeight']) for row in rows])
-        # 成交额 单位：元
-        turnover = sum([float(row['turnover']) for row in rows])
-
-        save_data(date, 'wbill', variety_ids, variety_names, trade_num, volume, turnover)
+        trade_num = 0
+        for row in rows_map['wbillApplyList']:
+            if row['opDate'] == date:
+                trade_num += 1
+                _add_variety(breakdown, row.get('varietyName'), 1, 0, 0)
         log.info('### 标准仓单信息采集服务 处理流程 end')
-    else:
-        save_data(date, 'wbill', '', '', 0, 0, 0)
+        return date, 'wbill', variety_ids, variety_names, trade_num, volume, turnover
+    return date, 'wbill', '', '', 0, 0, 0
 
 
-def non_wbill_match(date):
+def wbill_match(date):
     """
-    非标准仓单信息采集服务
-    非标准仓单采集交易笔数、品种列表、成交量、成交额
+    标准仓单信息采集服务
+    标准仓单采集交易笔数、品种列表、成交量、成交额
 
     :param date: 采集信息日期
     :return:
     """
+    save_data(*wbill_record(date, fetch_all('标准仓单信息采集服务', wbill_requests(date), date=date)))
+
+
+def non_wbill_requests(date):
+    """
+    非标准仓单采集接口请求参数
+    :param date: 采集信息日期
+    :return: 接口名称 -> 请求参数
+    """
     data = {
         "spotQryData": {
             "startDate": date,
@@ -136,43 +425,62 @@ def non_wbill_match(date):
         "page": 1,
         "limit": 100
     }
+    return {'nonWbillMatchList': data}
 
-    try:
-        api_url = 'http://otc.dce.com.cn/portal/data/app/nonWbillMatchList'
-        log.info('### 非标准仓单信息采集服务 API:' + api_url)
-        resp = requests.post(api_url, data=json.dumps(data), headers=HEADERS, timeout=5)
-        result = json.loads(resp.text)
-    except Exception as e:
-        log.error('### 非标准仓单信息采集服务 API:' + api_url + ' 接口异常：' + e)
-
-    rows = result['data']['spotResultData']['rows']
-    log.info('### 非标准仓单信息采集服务 采集' + str(len(rows)) + '条结果')
-    if len(rows) > 0:
-        log.info('### 非标准仓单信息采集服务 处理流程 start')
-        # 交易品种
-        variety_ids = ','.join(set([row['varietyId'] for row in rows]))
-        variety_names = '、'.join(sorted_variety(set([row['varietyName'] for row in rows])))
+
+def non_wbill_record(date, rows_map, breakdown=None):
+    """
+    非标准仓单采集交易笔数、品种列表、成交量、成交额
+
+    :param date: 采集信息日期
+    :param rows_map: 接口名称 -> 结果记录（可迭代对象，仅遍历一次）
+    :param breakdown: 传入dict时写入品种明细 品种名称 -> [交易笔数, 成交量, 成交额]
+    :return: save_data参数元组
+    """
+    trade_num = 0
+    variety_id_set = set()
+    variety_name_set = set()
+    volume = 0
+    turnover = 0
+    for row in rows_map['nonWbillMatchList']:
         # 交易笔数
-        trade_num = len(rows)
+        trade_num += 1
+        variety_id_set.add(row['varietyId'])
+        variety_name_set.add(row['varietyName'])
         # 成交量 单位：吨
-        volume = sum([float(row['applyWeight']) for row in rows])
+        volume += float(row['applyWeight'])
         # 成交额 单位：元
-        turnover = sum([float(row['applyWeight']) * float(row['price']) for row in rows])
-
-        save_data(date, 'nonwbill', variety_ids, variety_names, trade_num, volume, turnover)
+        turnover += float(row['applyWeight']) * float(row['price'])
+        _add_variety(breakdown, row['varietyName'], 1, float(row['applyWeight']),
+                     float(row['applyWeight']) * float(row['price']))
+    log.info('### 非标准仓单信息采集服务 采集%d条结果', trade_num, extra={'date': date, 'type': 'nonwbill'})
+    if trade_num > 0:
+        log.info('### 非标准仓单信息采集服务 处理流程 start')
+        # 交易品种
+        variety_ids = ','.join(variety_id_set)
+        variety_names = '、'.join(sorted_variety(variety_name_set))
         log.info('### 非标准仓单信息采集服务 处理流程 end')
-    else:
-        save_data(date, 'nonwbill', '', '', 0, 0, 0)
+        return date, 'nonwbill', variety_ids, variety_names, trade_num, volume, turnover
+    return date, 'nonwbill', '', '', 0, 0, 0
 
 
-def index_basis(date):
+def non_wbill_match(date):
     """
-        基差交易信息采集服务
-        基差交易采集交易笔数、品种列表、成交量、成交额
+    非标准仓单信息采集服务
+    非标准仓单采集交易笔数、品种列表、成交量、成交额
 
-        :param date: 采集信息日期
-        :return:
-        """
+    :param date: 采集信息日期
+    :return:
+    """
+    save_data(*non_wbill_record(date, fetch_all('非标准仓单信息采集服务', non_wbill_requests(date))))
+
+
+def index_basis_requests(date):
+    """
+    基差交易采集接口请求参数
+    :param date: 采集信息日期
+    :return: 接口名称 -> 请求参数
+    """
     data = {
         "basisQryData": {
             "orderStatus": "c",
@@ -183,43 +491,64 @@ def index_basis(date):
         "page": 1,
         "limit": 100
     }
+    return {'indexBasis': data}
 
-    try:
-        api_url = 'http://otc.dce.com.cn/portal/data/app/indexBasis'
-        log.info('### 基差交易信息采集服务 API:' + api_url)
-        resp = requests.post(api_url, data=json.dumps(data), headers=HEADERS, timeout=5)
-        result = json.loads(resp.text)
-    except Exception as e:
-        log.error('### 基差交易信息采集服务 API:' + api_url + ' 接口异常：' + e)
-
-    rows = result['data']['basisResultData']['rows']
-    log.info('### 基差交易信息采集服务 采集' + str(len(rows)) + '条结果')
-    if len(rows) > 0:
-        log.info('### 基差交易信息采集服务 处理流程 start')
-        # 交易品种
-        variety_ids = ','.join(set([row['varietyId'] for row in rows]))
-        variety_names = '、'.join(sorted_variety(set([row['varietyName'] for row in rows])))
+
+def index_basis_record(date, rows_map, breakdown=None):
+    """
+    基差交易采集交易笔数、品种列表、成交量、成交额
+
+    :param date: 采集信息日期
+    :param rows_map: 接口名称 -> 结果记录（可迭代对象，仅遍历一次）
+    :param breakdown: 传入dict时写入品种明细 品种名称 -> [交易笔数, 成交量, 成交额]
+    :return: save_data参数元组
+    """
+    trade_num = 0
+    variety_id_set = set()
+    variety_name_set = set()
+    volume = 0
+    nominal_amt = 0
+    for row in rows_map['indexBasis']:
         # 交易笔数
-        trade_num = len(rows)
+        trade_num += 1
+        variety_id_set.add(row['varietyId'])
+        variety_name_set.add(row['varietyName'])
         # 成交量 单位：吨
-        volume = sum([float(row['qty']) for row in rows])
+        volume += float(row['qty'])
+        nominal_amt += float(row['nominalMatchAmt'])
+        _add_variety(breakdown, row['varietyName'], 1, float(row['qty']), float(row['nominalMatchAmt']))
+    log.info('### 基差交易信息采集服务 采集%d条结果', trade_num, extra={'date': date, 'type': 'basis'})
+    if trade_num > 0:
+        log.info('### 基差交易信息采集服务 处理流程 start')
+        # 交易品种
+        variety_ids = ','.join(variety_id_set)
+        variety_names = '、'.join(sorted_variety(variety_name_set))
         # 成交额 单位：元
-        turnover = round(sum([float(row['nominalMatchAmt']) for row in rows]) * 10000, 0)
-
-        save_data(date, 'basis', variety_ids, variety_names, trade_num, volume, turnover)
+        turnover = round(nominal_amt * 10000, 0)
+        for item in (breakdown or {}).values():
+            item[2] = round(item[2] * 10000, 0)
         log.info('### 基差交易信息采集服务 处理流程 end')
-    else:
-        save_data(date, 'basis', '', '', 0, 0, 0)
+        return date, 'basis', variety_ids, variety_names, trade_num, volume, turnover
+    return date, 'basis', '', '', 0, 0, 0
 
 
-def swap_match(date):
+def index_basis(date):
     """
-        商品互换信息采集服务
-        商品互换采集交易笔数、品种列表、成交量、成交额
+        基差交易信息采集服务
+        基差交易采集交易笔数、品种列表、成交量、成交额
 
         :param date: 采集信息日期
         :return:
         """
+    save_data(*index_basis_record(date, fetch_all('基差交易信息采集服务', index_basis_requests(date))))
+
+
+def swap_requests(date):
+    """
+    商品互换采集接口请求参数
+    :param date: 采集信息日期
+    :return: 接口名称 -> 请求参数
+    """
     data = {
         "swapQryData": {
             "startDate": date,
@@ -230,54 +559,68 @@ def swap_match(date):
         "page": 1,
         "limit": 100
     }
+    return {'swapMatch': data}
 
-    try:
-        api_url = 'http://otc.dce.com.cn/portal/data/app/swapMatch'
-        log.info('### 商品互换信息采集服务 API:' + api_url)
-        resp = requests.post(api_url, data=json.dumps(data), headers=HEADERS, timeout=5)
-        result = json.loads(resp.text)
-    except Exception as e:
-        log.error('### 商品互换信息采集服务 API:' + api_url + ' 接口异常：' + e)
-
-    rows = result['data']['swapResultData']['rows']
-    log.info('### 商品互换信息采集服务 采集' + str(len(rows)) + '条结果')
-    if len(rows) > 0:
+
+def swap_record(date, rows_map, breakdown=None):
+    """
+    商品互换采集交易笔数、品种列表、成交量、成交额
+
+    :param date: 采集信息日期
+    :param rows_map: 接口名称 -> 结果记录（可迭代对象，仅遍历一次）
+    :param breakdown: 传入dict时写入品种明细 品种名称 -> [交易笔数, 成交量, 成交额]
+    :return: save_data参数元组
+    """
+    trade_num = 0
+    variety_name_set = set()
+    for row in rows_map['swapMatch']:
+        # 交易笔数
+        trade_num += 1
+        # 1 单商品互换 2 指数交换 3 价差互换
+        contract_type = row['contractType']
+        variety_name = None
+        if contract_type == '1':
+            variety_name = row['subjectContractId'][0:-4]
+        elif contract_type == '2':
+            variety_name = row['subjectContractId'][7:].split('期货')[0]
+        elif contract_type == '3':
+            variety_name = row['subjectContractId'].split('-')[0][2:-4]
+        if variety_name is not None:
+            variety_name_set.add(variety_name)
+            # 名义本金由人工维护，品种明细仅记录交易笔数
+            _add_variety(breakdown, variety_name, 1, None, None)
+    log.info('### 商品互换信息采集服务 采集%d条结果', trade_num, extra={'date': date, 'type': 'swap'})
+    if trade_num > 0:
         log.info('### 商品互换信息采集服务 处理流程 start')
         # 交易品种
         variety_ids = None
-        variety_name_set = set()
-        for row in rows:
-            # 1 单商品互换 2 指数交换 3 价差互换
-            contract_type = row['contractType']
-            if contract_type == '1':
-                variety_name_set.add(row['subjectContractId'][0:-4])
-            elif contract_type == '2':
-                variety_name_set.add(row['subjectContractId'][7:].split('期货')[0])
-            elif contract_type == '3':
-                variety_name_set.add(row['subjectContractId'].split('-')[0][2:-4])
-
         variety_names = '、'.join(sorted_variety(variety_name_set))
-        # 交易笔数
-        trade_num = len(rows)
         # 成交量 单位：吨
         volume = None
         # 成交额 单位：万元
         turnover = None
-
-        save_data(date, 'swap', variety_ids, variety_names, trade_num, volume, turnover)
         log.info('### 商品互换信息采集服务 处理流程 end')
-    else:
-        save_data(date, 'swap', '', '', 0, 0, 0)
+        return date, 'swap', variety_ids, variety_names, trade_num, volume, turnover
+    return date, 'swap', '', '', 0, 0, 0
 
 
-def opt_match(date):
+def swap_match(date):
     """
-            场外期权信息采集服务
-            场外期权采集交易笔数、品种列表、成交量、成交额
+        商品互换信息采集服务
+        商品互换采集交易笔数、品种列表、成交量、成交额
 
-            :param date: 采集信息日期
-            :return:
-            """
+        :param date: 采集信息日期
+        :return:
+        """
+    save_data(*swap_record(date, fetch_all('商品互换信息采集服务', swap_requests(date))))
+
+
+def opt_requests(date):
+    """
+    场外期权采集接口请求参数
+    :param date: 采集信息日期
+    :return: 接口名称 -> 请求参数
+    """
     data = {
         "optQryData": {
             "startDate": date,
@@ -287,35 +630,74 @@ def opt_match(date):
         },
         "page": 1,
         "limit": 100}
+    return {'optMatch': data}
 
-    try:
-        api_url = 'http://otc.dce.com.cn/portal/data/app/optMatch'
-        log.info('### 场外期权信息采集服务 API:' + api_url)
-        resp = requests.post(api_url, data=json.dumps(data), headers=HEADERS, timeout=5)
-        result = json.loads(resp.text)
-    except Exception as e:
-        log.error('### 场外期权信息采集服务 API:' + api_url + ' 接口异常：' + e)
-
-    rows = result['data']['optResultData']['rows']
-    log.info('### 场外期权信息采集服务 采集' + str(len(rows)) + '条结果')
-    if len(rows) > 0:
+
+def opt_record(date, rows_map, breakdown=None):
+    """
+    场外期权采集交易笔数、品种列表、成交量、成交额
+
+    :param date: 采集信息日期
+    :param rows_map: 接口名称 -> 结果记录（可迭代对象，仅遍历一次）
+    :param breakdown: 传入dict时写入品种明细 品种名称 -> [交易笔数, 成交量, 成交额]
+    :return: save_data参数元组
+    """
+    trade_num = 0
+    variety_name_set = set()
+    for row in rows_map['optMatch']:
+        # 交易笔数
+        trade_num += 1
+        variety_name_set.add(row['subjectContractId'][0:-4])
+    log.info('### 场外期权信息采集服务 采集%d条结果', trade_num, extra={'date': date, 'type': 'opt'})
+    if trade_num > 0:
         log.info('### 场外期权信息采集服务 处理流程 start')
         # 交易品种
         variety_ids = None
-        variety_names = '、'.join(sorted_variety(set([row['subjectContractId'][0:-4] for row in rows])))
-        # 交易笔数
-        trade_num = len(rows)
+        variety_names = '、'.join(sorted_variety(variety_name_set))
         # 成交量 单位：吨
         volume = None
         # 成交额 单位：万元
         turnover = None
 
-        # save_data(date, 'opt', variety_ids, variety_names, trade_num, volume, turnover)
+        # return date, 'opt', variety_ids, variety_names, trade_num, volume, turnover
         # 根据业务部门要求，暂时不记录场外期权数据
-        save_data(date, 'opt', '', '', 0, 0, 0)
         log.info('### 场外期权信息采集服务 处理流程 end')
-    else:
-        save_data(date, 'opt', '', '', 0, 0, 0)
+    return date, 'opt', '', '', 0, 0, 0
+
+
+def opt_match(date):
+    """
+            场外期权信息采集服务
+            场外期权采集交易笔数、品种列表、成交量、成交额
+
+            :param date: 采集信息日期
+            :return:
+            """
+    save_data(*opt_record(date, fetch_all('场外期权信息采集服务', opt_requests(date))))
+
+
+# 业务类型 -> (采集服务名称, 接口请求参数, 采集结果汇总)
+COLLECTORS = {
+    'wbill': ('标准仓单信息采集服务', wbill_requests, wbill_record),
+    'nonwbill': ('非标准仓单信息采集服务', non_wbill_requests, non_wbill_record),
+    'basis': ('基差交易信息采集服务', index_basis_requests, index_basis_record),
+    'swap': ('商品互换信息采集服务', swap_requests, swap_record),
+    'opt': ('场外期权信息采集服务', opt_requests, opt_record),
+}
+
+
+def save_records(records, preserve=None):
+    """
+    批量保存采集数据，同一年度的记录合并后一次写入数据文件
+    已有记录按(日期, 类型)更新，商品互换名义本金由人工维护，更新时保留原值
+
+    :param records: save_data参数元组列表
+    :param preserve: 更新已有记录时保留原值的字段 类型 -> 字段列表，默认PRESERVE_ON_UPDATE
+    :return:
+    """
+    log.info('### 批量保存 start %d条', len(records))
+    storage.upsert_records(records, PRESERVE_ON_UPDATE if preserve is None else preserve)
+    log.info('### 批量保存 end')
 
 
 def save_data(date, ctype, variety_ids, variety_names, trade_num, volume, turnover):
@@ -331,49 +713,4 @@ def save_data(date, ctype, variety_ids, variety_names, trade_num, volume, turnov
     :param turnover: 成交金额
     :return:
     """
-    data_path = 'data/{year}.csv'.format(year=date[:4])
-    if os.path.exists(data_path):
-        df = pd.read_csv(data_path)
-        # 修改date数据类型
-        df['date'] = df['date'].astype('str')
-
-        if len(df[(df['date'] == date) & (df['type'] == ctype)]) == 0:
-            log.info('### 新增 start')
-            df = df.append({
-                'date': date,
-                'type': ctype,
-                'variety_ids': variety_ids,
-                'variety_names': variety_names,
-                'trade_num': trade_num,
-                'volume': volume,
-                'turnover': turnover,
-            }, ignore_index=True)
-            df.to_csv(data_path, index=False)
-            log.info('### 新增 end')
-        else:
-            # 对比文件进行更新操作
-            log.info('### 更新 start')
-            df = df.set_index(['date', 'type'])
-            df.loc[(date, ctype), 'variety_ids'] = variety_ids
-            df.loc[(date, ctype), 'variety_names'] = variety_names
-            df.loc[(date, ctype), 'trade_num'] = trade_num
-            df.loc[(date, ctype), 'volume'] = volume
-            if ctype != 'swap':
-                df.loc[(date, ctype), 'turnover'] = turnover
-            log.info('### 更新 end')
-            df.to_csv(data_path)
-
-    else:
-        log.info('### 新建 start')
-        df = pd.DataFrame([{
-            'date': date,
-            'type': ctype,
-            'variety_ids': variety_ids,
-            'variety_names': variety_names,
-            'trade_num': trade_num,
-            'volume': volume,
-            'turnover': turnover,
-        }])
-        df.set_index(['date', 'type'])
-        df.to_csv(data_path, index=False)
-        log.info('### 新建 end')
\ No newline at end of file
+    save_records([(date, ctype, variety_ids, variety_names, trade_num, volume, turnover)])
@@ -0,0 +1,71 @@
+"""
+由原始记录归档重新汇总年度数据及品种明细，不请求接口
+修正汇总逻辑（如非标仓单成交额、商品互换品种名称解析）后，回放归档的原始记录重新计算各业务类型汇总值，
+同一年度的结果合并后写入一次
+
+    python -m schedule_service.reaggregate --start 20220101 --end 20221231 --types nonwbill swap
+"""
+import argparse
+import logging
+
+import logger
+import metrics
+import variety_facts
+from schedule_service import archive, otc_daily_rept
+
+log = logging.getLogger(__name__)
+
+
+def rebuild(start, end, types=None, dry_run=False):
+    """
+    重新汇总日期区间内已归档的数据（年度数据与品种明细）
+    :param start: 起始日期 yyyymmdd（含）
+    :param end: 截止日期 yyyymmdd（含）
+    :param types: 业务类型列表，默认全部
+    :param dry_run: True 仅汇总不写入
+    :return: (records, missing) records：save_data参数元组列表；missing：(日期, 业务类型) -> 未归档的接口列表
+    """
+    types = types or list(otc_daily_rept.COLLECTORS)
+    index = archive.entries()
+    dates = sorted(set(date for date, api in index if start <= date <= end))
+    records = []
+    missing = {}
+    year_records = []
+    year_facts = []
+    for i, date in enumerate(dates):
+        for ctype in types:
+            name, build, aggregate = otc_daily_rept.COLLECTORS[ctype]
+            apis = list(build(date))
+            absent = [api for api in apis if (date, api) not in index]
+            if absent:
+                missing[(date, ctype)] = absent
+                continue
+            breakdown = {}
+            year_records.append(aggregate(date, {api: archive.iter_rows(date, api) for api in apis}, breakdown))
+            year_facts.append((date, ctype, breakdown))
+        # 每个年度写入一次
+        if i == len(dates) - 1 or dates[i + 1][:4] != date[:4]:
+            if year_records and not dry_run:
+                otc_daily_rept.save_records(year_records)
+                variety_facts.save(year_facts)
+            log.info('### 重新汇总 %s 共%d条', date[:4], len(year_records))
+            records.extend(year_records)
+            year_records = []
+            year_facts = []
+    return records, missing
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='由原始记录归档重新汇总年度数据')
+    parser.add_argument('--start', required=True, help='起始日期 yyyymmdd')
+    parser.add_argument('--end', required=True, help='截止日期 yyyymmdd')
+    parser.add_argument('--types', nargs='+', choices=list(otc_daily_rept.COLLECTORS), help='业务类型，默认全部')
+    parser.add_argument('--dry-run', action='store_true', help='仅汇总不写入')
+    args = parser.parse_args()
+    logger.setup(stream=True)
+    metrics.setup()
+    result, absent_map = rebuild(args.start, args.end, args.types, args.dry_run)
+    for record in result:
+        print(','.join(str(value) for value in record))
+    for (date, ctype), apis in sorted(absent_map.items()):
+        print('missing: %s %s %s' % (date, ctype, ','.join(apis)))
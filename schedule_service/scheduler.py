@@ -0,0 +1,220 @@
+"""
+定时采集服务：独立进程运行，取得定时任务锁（data/.scheduler.lock）的实例执行采集，其他实例等待接替，
+同一时间只有一个实例采集；每个任务最多同时运行一次，错过的执行合并为一次
+
+    python -m schedule_service.scheduler
+
+交易日采集时段内自适应轮询：数据发布前每WAIT_INTERVAL秒采集一次，数据发布及变化后每FAST_INTERVAL秒采集一次，
+数据不变时采集间隔从BACKOFF_INTERVAL起逐次加倍至SLOW_INTERVAL，连续STABLE_TICKS次不变后当日数据完成，不再采集；
+启动及每日零点补采最近CATCHUP_DAYS个交易日中未完成的日期（服务停止期间错过的交易日及采集时段内未完成的日期）
+
+环境变量：
+    OTC_SCHEDULER_START        采集时段开始时间，默认18:00
+    OTC_SCHEDULER_END          采集时段结束时间，默认21:00
+    OTC_SCHEDULER_WAIT         数据发布前的采集间隔 单位：秒，默认600
+    OTC_SCHEDULER_FAST         最短采集间隔 单位：秒，默认120
+    OTC_SCHEDULER_BACKOFF      数据发布后不变时的采集间隔 单位：秒，默认600
+    OTC_SCHEDULER_SLOW         最长采集间隔 单位：秒，默认1800
+    OTC_SCHEDULER_CATCHUP_DAYS 补采的交易日数，默认10
+"""
+import argparse
+import datetime
+import functools
+import logging
+import os
+import threading
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+import logger
+import metrics
+import storage
+import trade_calendar
+from schedule_service import collect_state, otc_daily_rept
+
+log = logging.getLogger(__name__)
+
+WINDOW_START = os.environ.get('OTC_SCHEDULER_START', '18:00')
+WINDOW_END = os.environ.get('OTC_SCHEDULER_END', '21:00')
+WAIT_INTERVAL = int(os.environ.get('OTC_SCHEDULER_WAIT', 600))
+FAST_INTERVAL = int(os.environ.get('OTC_SCHEDULER_FAST', 120))
+BACKOFF_INTERVAL = int(os.environ.get('OTC_SCHEDULER_BACKOFF', 600))
+SLOW_INTERVAL = int(os.environ.get('OTC_SCHEDULER_SLOW', 1800))
+CATCHUP_DAYS = int(os.environ.get('OTC_SCHEDULER_CATCHUP_DAYS', 10))
+# 检查是否需要采集的间隔 单位：秒
+TICK = 30
+# 未取得定时任务锁时重试的间隔 单位：秒
+LEADER_RETRY = 30
+# 定时任务锁（数据目录下的锁文件.scheduler.lock）
+LOCK_NAME = 'scheduler'
+TIMEZONE = 'Asia/Shanghai'
+JOB_DEFAULTS = {'max_instances': 1, 'coalesce': True, 'misfire_grace_time': TICK}
+
+
+def _at(date, hhmm):
+    return datetime.datetime.strptime(date + hhmm.replace(':', ''), '%Y%m%d%H%M')
+
+
+class Poller:
+    """
+    自适应轮询：tick(now)判断当前是否需要采集，需要时调用run_job采集
+    时间由调用方传入（定时任务传入当前时间，测试传入模拟时间）
+    """
+
+    def __init__(self, run_job=None, start=WINDOW_START, end=WINDOW_END, wait=WAIT_INTERVAL, fast=FAST_INTERVAL,
+                 backoff=BACKOFF_INTERVAL, slow=SLOW_INTERVAL, catchup_days=CATCHUP_DAYS, catch_up_job=None):
+        """
+        :param run_job: 采集函数 run_job(date) -> 是否成功，默认otc_daily_rept.job
+        :param start: 采集时段开始时间 HH:MM
+        :param end: 采集时段结束时间 HH:MM
+        :param wait: 数据发布前的采集间隔 单位：秒
+        :param fast: 最短采集间隔 单位：秒（数据发布及变化后）
+        :param backoff: 数据发布后不变时的采集间隔 单位：秒（此后逐次加倍）
+        :param slow: 最长采集间隔 单位：秒
+        :param catchup_days: 补采的交易日数
+        :param catch_up_job: 补采函数 catch_up_job(date) -> 是否成功，默认run_job；
+            均未指定时为保留人工维护字段（otc_daily_rept.MANUAL_FIELDS）的otc_daily_rept.job
+        """
+        self.run_job = run_job or otc_daily_rept.job
+        if catch_up_job is None and run_job is None:
+            # 采集状态丢失（首次部署、状态文件损坏）时补采日期均视为有变化而重新写入，不能覆盖人工录入的数据
+            catch_up_job = functools.partial(otc_daily_rept.job, preserve=otc_daily_rept.MANUAL_FIELDS)
+        self.catch_up_job = catch_up_job or self.run_job
+        self.start = start
+        self.end = end
+        self.wait = datetime.timedelta(seconds=wait)
+        self.fast = datetime.timedelta(seconds=fast)
+        self.backoff = datetime.timedelta(seconds=backoff)
+        self.slow = datetime.timedelta(seconds=slow)
+        self.catchup_days = catchup_days
+        self.date = None
+        self.interval = self.wait
+        self.next_due = None
+
+    def tick(self, now=None):
+        """
+        :param now: 当前时间，默认datetime.now()
+        :return: 本次采集的日期列表（含补采）
+        """
+        now = now or datetime.datetime.now()
+        date = now.strftime('%Y%m%d')
+        collected = []
+        if date != self.date:
+            self.date = date
+            self.interval = self.wait
+            self.next_due = None
+            collected.extend(self.catch_up(now))
+        if not trade_calendar.get().is_trading_day(date):
+            return collected
+        if now < _at(date, self.start) or now >= _at(date, self.end):
+            return collected
+        if self.next_due is not None and now < self.next_due:
+            return collected
+        if collect_state.CollectState.load().is_complete(date):
+            return collected
+        ok = self.run_job(date)
+        collected.append(date)
+        day = collect_state.CollectState.load().dates.get(date, {})
+        changed = any(item.get('stable', 0) == 0 for item in day.get('types', {}).values())
+        if not day.get('published'):
+            # 数据发布前按原定时任务的频率采集，不增加接口请求
+            self.interval = self.wait
+        elif not ok or changed:
+            self.interval = self.fast
+        else:
+            # 连续不变的间隔不短于原定时任务（每10分钟），数据完成前仍可发现发布后的修订
+            self.interval = min(max(self.interval * 2, self.backoff), self.slow)
+        self.next_due = now + self.interval
+        log.info('### %s 采集%s，下次采集%s', date, '完成' if ok else '异常', self.next_due.strftime('%H:%M:%S'),
+                 extra={'date': date})
+        return collected
+
+    def missed(self, now):
+        """
+        需要补采的日期：最近catchup_days个交易日（当日采集时段已结束时包括当日）中未完成的日期
+        :param now: 当前时间
+        :return: 日期列表（升序）
+        """
+        date = now.strftime('%Y%m%d')
+        calendar = trade_calendar.get()
+        dates = calendar.previous(date, self.catchup_days, inclusive=now >= _at(date, self.end))
+        state = collect_state.CollectState.load()
+        return [d for d in dates if not state.is_complete(d)]
+
+    def catch_up(self, now):
+        """
+        补采错过的交易日，采集成功且数据已发布的日期标记为已完成（采集时段已过，数据不再变化）；
+        数据尚未发布（全部业务类型均无成交）的日期不标记，下次补采时重新采集；
+        更新已有记录时保留人工维护的字段（见catch_up_job）
+        :param now: 当前时间
+        :return: 补采的日期列表
+        """
+        dates = self.missed(now)
+        if dates:
+            log.info('### 补采%d个交易日：%s', len(dates), ','.join(dates))
+        for date in dates:
+            if self.catch_up_job(date):
+                with collect_state.CollectState.locked() as state:
+                    published = state.dates.get(date, {}).get('published')
+                    if published:
+                        state.mark_complete(date)
+                if not published:
+                    log.warning('### %s 补采数据尚未发布，不标记完成', date, extra={'date': date})
+            else:
+                log.error('### %s 补采异常', date, extra={'date': date})
+        return dates
+
+
+def serve(stop, tick=TICK, poller=None):
+    """
+    取得定时任务锁后运行定时任务，直至stop被设置；其他实例持有锁时每LEADER_RETRY秒重试
+    :param stop: threading.Event
+    :param tick: 检查间隔 单位：秒
+    :param poller: Poller，默认按环境变量配置
+    :return:
+    """
+    path = os.path.join(storage.DATA_DIR, LOCK_NAME)
+    while not stop.is_set():
+        acquired = False
+        try:
+            with storage.file_lock(path, timeout=0):
+                acquired = True
+                log.info('######### 取得定时任务锁，启动OTC日报采集自动任务 #########')
+                scheduler = BackgroundScheduler(timezone=TIMEZONE, job_defaults=JOB_DEFAULTS)
+                scheduler.add_job((poller or Poller()).tick, 'interval', seconds=tick, id='otc_daily_rept',
+                                  next_run_time=datetime.datetime.now())
+                scheduler.start()
+                try:
+                    stop.wait()
+                finally:
+                    scheduler.shutdown()
+                    log.info('######### 停止OTC日报采集自动任务 #########')
+        except TimeoutError:
+            if acquired:
+                raise
+            log.info('### 其他实例正在运行定时任务，%d秒后重试', LEADER_RETRY)
+            stop.wait(LEADER_RETRY)
+
+
+def start_background(tick=TICK):
+    """
+    在后台线程运行定时任务（与服务同一进程时使用）
+    :param tick: 检查间隔 单位：秒
+    :return: threading.Event，设置后停止
+    """
+    stop = threading.Event()
+    threading.Thread(target=serve, args=(stop, tick), name='scheduler', daemon=True).start()
+    return stop
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='OTC日报定时采集服务')
+    parser.add_argument('--tick', type=int, default=TICK, help='检查间隔（秒）')
+    args = parser.parse_args()
+    logger.setup(stream=True)
+    metrics.setup()
+    stop = threading.Event()
+    try:
+        serve(stop, args.tick)
+    except KeyboardInterrupt:
+        stop.set()
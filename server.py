@@ -1,16 +1,31 @@
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.openapi.docs import get_swagger_ui_html
 
-from apscheduler.schedulers.background import BackgroundScheduler
 import json
 import datetime
-import uvicorn
-import utils
+import logging
+import threading
+import os
 
-from schedule_service import otc_daily_rept
-import service as sv
+import compression
+import logger
+import metrics
+import static_assets
+from utils import lazy_import
+
+# 数据查询相关模块（依赖pandas）延迟导入，worker启动及重新加载时不必等待；
+# 定时任务（apscheduler、采集模块）只在运行定时任务的进程中导入
+report_cache = lazy_import('report_cache')
+report_engine = lazy_import('report_engine')
+report_push = lazy_import('report_push')
+sv = lazy_import('service')
+trade_calendar = lazy_import('trade_calendar')
+
+# worker启动后是否在后台线程预先导入数据查询模块（0：首次请求时导入）
+PRELOAD = os.environ.get('OTC_PRELOAD', '1') != '0'
+
+log = logging.getLogger(__name__)
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -19,7 +34,8 @@ origins = [
 ]
 
 app = FastAPI(docs_url=None, redoc_url=None)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# 静态文件在内存中预压缩，按Accept-Encoding返回
+app.mount("/static", static_assets.store, name="static")
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -27,12 +43,34 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 接口返回的JSON、CSV超过一定大小时gzip压缩
+app.add_middleware(compression.GzipMiddleware)
+app.add_middleware(metrics.MetricsMiddleware,
+                   paths=['/tradeInfo', '/getOptReport', '/getRangeReport', '/varietyReport', '/calendar'],
+                   # 订阅连接持续到客户端断开，不计入接口响应时间
+                   streams=['/subscribe'])
+
+
+def _preload():
+    static_assets.store.load()
+    for module in (sv, report_cache, report_engine, report_push, trade_calendar):
+        module.load()
+
+
+@app.on_event("startup")
+def setup_logging():
+    # 各worker进程启动时启用日志输出及多进程指标
+    logger.setup()
+    metrics.setup()
+    if PRELOAD:
+        # 后台预压缩静态文件并导入数据查询模块，不推迟worker开始接收请求
+        threading.Thread(target=_preload, name='preload', daemon=True).start()
+
 
 @app.get('/', response_class=HTMLResponse)
-def index():
-    with open('static/index.html', 'r') as fp:
-        data = fp.read()
-    return data
+async def index(request: Request):
+    # 页面在内存中缓存及预压缩，每次以ETag校验
+    return await static_assets.store.response('index.html', request.headers, static_assets.INDEX_CACHE_CONTROL)
 
 # @app.get("/docs")
 def get_documentation():
@@ -43,23 +81,11 @@ def get_documentation():
 
 
 @app.get("/tradeInfo")
-async def get_trade_info(date=datetime.datetime.now().strftime('%Y%m%d')):
+async def get_trade_info(date=None):
+    if date is None:
+        date = datetime.datetime.now().strftime('%Y%m%d')
     try:
-        swap_info = sv.query_swap_info(date)
-        opt_info = sv.query_opt_info(date)
-        if opt_info[2] == 0:
-            # 判断场外期权品种是否为空
-            opt_varieties = ''
-        else:
-            opt_varieties = opt_info[2]
-        return {
-            "Status": 200,
-            "swap_num": swap_info[0],
-            "swap_turnover": swap_info[1],
-            "opt_num": opt_info[0],
-            "opt_turnover": opt_info[1],
-            "opt_varieties": opt_varieties,
-        }
+        return await sv.query_trade_info_async(date)
     except Exception as e:
         return json.loads(json.dumps({
             "Status": 100
@@ -67,184 +93,189 @@ async def get_trade_info(date=datetime.datetime.now().strftime('%Y%m%d')):
 
 
 @app.get("/getOptReport")
-async def get_opt_report(date=datetime.datetime.now().strftime('%Y%m%d')):
+async def get_opt_report(request: Request, date=None):
+    if date is None:
+        date = datetime.datetime.now().strftime('%Y%m%d')
     try:
-        volume_unit = 10000
-        turnover_unit = 100000000
-        data = sv.query_daily_rept(date)
-        if data['daily_data'].shape[0] == 0:
-            return json.loads(json.dumps({
+        # 报表生成（读取数据文件及pandas计算）在查询线程池中执行，不阻塞事件循环
+        entry = await sv.run_blocking(report_cache.get, date, report_engine.build_opt_report)
+    except Exception as e:
+        log.exception('日报查询异常 date=%s', date, extra={'date': date})
+        return json.loads(json.dumps({
             "Status": 100
         }))
-        data['daily_data']['date'] = data['daily_data']['date'].astype('str')
-        daily_data = data['daily_data'].set_index(['date', 'type'])
-        last5_data_type = data['last5_data'].reset_index().set_index('type')
-        last5_data = data['last5_data'].reset_index()
-        month_data = data['month_data']
-        year_data = data['year_data']
-
-        # 日数据计算
-        day_wbill_num = int(daily_data['trade_num'][(date, 'wbill')])
-        day_wbill_varietys = str(daily_data['variety_names'][(date, 'wbill')])
-        day_wbill_volume = round(daily_data['volume'][(date, 'wbill')] / volume_unit, 2)
-        day_wbill_turnover = round(daily_data['turnover'][(date, 'wbill')] / turnover_unit, 2)
-
-        day_nonwbill_num = int(daily_data['trade_num'][(date, 'nonwbill')])
-        day_nonwbill_varietys = daily_data['variety_names'].fillna('')[(date, 'nonwbill')]
-        day_nonwbill_volume = round(daily_data['volume'][(date, 'nonwbill')] / volume_unit, 2)
-        day_nonwbill_turnover = round(daily_data['turnover'][(date, 'nonwbill')] / turnover_unit, 2)
-
-        day_basis_num = int(daily_data['trade_num'][(date, 'basis')])
-        day_basis_varietys = daily_data['variety_names'].fillna('')[(date, 'basis')]
-        day_basis_volume = round(daily_data['volume'][(date, 'basis')] / volume_unit, 2)
-        day_basis_turnover = round(daily_data['turnover'][(date, 'basis')] / turnover_unit, 2)
-
-        # day_swap_num = int(daily_data['trade_num'][(date, 'swap')])
-        # day_swap_varietys = daily_data['variety_names'].fillna('')[(date, 'swap')]
-        # day_swap_turnover = round(daily_data['turnover'][(date, 'swap')] / turnover_unit, 2)
-        #
-        # day_opt_num = int(daily_data['trade_num'][(date, 'opt')])
-        # day_opt_varietys = daily_data['variety_names'].fillna('')[(date, 'opt')]
-        # day_opt_turnover = round(daily_data['turnover'][(date, 'opt')] / turnover_unit, 2)
-
-        daily_sum_turnover = round(
-            day_wbill_turnover + day_nonwbill_turnover + day_basis_turnover, 2)
-        daily_sum_volume = round(
-            day_wbill_volume + day_nonwbill_volume + day_basis_volume, 2)
-        month_sum_turnover = round(month_data['turnover'].sum() / turnover_unit, 2)
-
-        # last5数据计算
-        last5_wbill = (last5_data_type['turnover']['wbill'] / turnover_unit).round(2).values
-        last5_nonwbill = (last5_data_type['turnover']['nonwbill'] / turnover_unit).round(2).values
-        last5_basis = (last5_data_type['turnover']['basis'] / turnover_unit).round(2).values
-        # last5_swap = (last5_data_type['turnover']['swap'] / turnover_unit).round(2).values
-        # last5_opt = (last5_data_type['turnover']['opt'] / turnover_unit).round(2).values
-        last5_sum = (last5_wbill + last5_nonwbill + last5_basis).round(2)
-
-        # 年数据计算
-        year_wbill_num = int(year_data['trade_num']['wbill'])
-        year_wbill_volume = (year_data['volume']['wbill'] / volume_unit).round(2)
-        year_wbill_turnover = (year_data['turnover']['wbill'] / turnover_unit).round(2)
-
-        year_nonwbill_num = int(year_data['trade_num']['nonwbill'])
-        year_nonwbill_volume = (year_data['volume']['nonwbill'] / volume_unit).round(2)
-        year_nonwbill_turnover = (year_data['turnover']['nonwbill'] / turnover_unit).round(2)
-
-        year_basis_num = int(year_data['trade_num']['basis'])
-        year_basis_volume = (year_data['volume']['basis'] / volume_unit).round(2)
-        year_basis_turnover = (year_data['turnover']['basis'] / turnover_unit).round(2)
-
-        year_swap_num = int(year_data['trade_num']['swap'])
-        year_swap_turnover = (year_data['turnover']['swap'] / turnover_unit).round(2)
-
-        year_opt_num = int(year_data['trade_num']['opt'])
-        year_opt_turnover = (year_data['turnover']['opt'] / turnover_unit).round(2)
-
-        year_sum_volume = (year_wbill_volume + year_nonwbill_volume + year_basis_volume).round(2)
-        year_sum_turnover = (year_wbill_turnover + year_nonwbill_turnover + year_basis_turnover + year_swap_turnover + year_opt_turnover).round(2)
-
-        daily = {
-            "daily_sum": '%.2f' % daily_sum_turnover,
-            "daily_volume_sum": '%.2f' % daily_sum_volume,
-            "month_sum": '%.2f' % month_sum_turnover,
-            "year_sum": '%.2f' % year_sum_turnover,
-            "wbill": {
-                "num": day_wbill_num,
-                "varietys": day_wbill_varietys,
-                "volume": '%.2f' % day_wbill_volume,
-                "turnover": '%.2f' % day_wbill_turnover
-            },
-            "non_wbill": {
-                "num": day_nonwbill_num,
-                "varietys": day_nonwbill_varietys,
-                "volume": '%.2f' % day_nonwbill_volume,
-                "turnover": '%.2f' % day_nonwbill_turnover
-            },
-            "index_basis": {
-                "num": day_basis_num,
-                "varietys": day_basis_varietys,
-                "volume": '%.2f' % day_basis_volume,
-                "turnover": '%.2f' % day_basis_turnover
-            },
-            # "swap": {
-            #     "num": day_swap_num,
-            #     "varietys": day_swap_varietys,
-            #     "turnover": '%.2f' % day_swap_turnover
-            # },
-            # "opt": {
-            #     "num": day_opt_num,
-            #     "varietys": day_opt_varietys,
-            #     "turnover": '%.2f' % day_opt_turnover
-            # }
-        }
+    headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if report_cache.not_modified(entry, request.headers.get('if-none-match')):
+        return Response(status_code=304, headers=headers)
+    if len(entry.body) >= compression.MIN_SIZE and 'gzip' in compression.accepted(request.headers.get('accept-encoding')):
+        # 使用缓存的压缩结果，同一报表只压缩一次
+        headers.update({'ETag': compression.weak_etag(entry.etag), 'Content-Encoding': 'gzip'})
+        return Response(content=entry.gzip_body, media_type='application/json', headers=headers)
+    return Response(content=entry.body, media_type='application/json', headers=headers)
 
-        weekly = {
-            "dates": [str(int(date[4:6])) + '月' + str(int(date[6:8])) + '日' for date in
-                      last5_data['date'].drop_duplicates().values.tolist()],
-            "wbill": last5_wbill.tolist(),
-            "non_wbill": last5_nonwbill.tolist(),
-            "index_basis": last5_basis.tolist(),
-            # "swap": last5_swap.tolist(),
-            # "opt": last5_opt.tolist(),
-            # "sum": ['%.2f' % s for s in last5_sum.tolist()]
-            "sum": ['%.2f' % s for s in last5_sum.tolist()]
-        }
 
-        yearly = {
-            "wbill": {
-                "num": year_wbill_num,
-                "volume": '%.2f' % year_wbill_volume,
-                "turnover": '%.2f' % year_wbill_turnover
-            },
-            "non_wbill": {
-                "num": year_nonwbill_num,
-                "volume": '%.2f' % year_nonwbill_volume,
-                "turnover": '%.2f' % year_nonwbill_turnover
-            },
-            "index_basis": {
-                "num": year_basis_num,
-                "volume": '%.2f' % year_basis_volume,
-                "turnover": '%.2f' % year_basis_turnover
-            },
-            "swap": {
-                "num": year_swap_num,
-                "turnover": '%.2f' % year_swap_turnover
-            },
-            "opt": {
-                "num": year_opt_num,
-                "turnover": '%.2f' % year_opt_turnover
-            },
-            "sum": {
-                "num": int(year_data['trade_num'].sum()),
-                "volume": '%.2f' % year_sum_volume,
-                "turnover": '%.2f' % year_sum_turnover
-            }
-        }
+@app.get("/getRangeReport")
+async def get_range_report(start, end, granularity='day', format='json'):
+    """
+    区间报表：各类型按日/周/月汇总的数据序列，大区间分块输出
+    :param start: 起始日期 yyyymmdd
+    :param end: 截止日期 yyyymmdd
+    :param granularity: 统计周期 day/week/month
+    :param format: 输出格式 json/csv
+    """
+    try:
+        data = await sv.run_blocking(sv.query_range_rept, start, end, granularity)
+    except ValueError as e:
+        # 日期、统计周期参数错误，不输出异常堆栈
+        log.debug('区间报表参数错误 start=%s end=%s granularity=%s：%s', start, end, granularity, e)
+        return json.loads(json.dumps({
+            "Status": 100
+        }))
+    except Exception as e:
+        log.exception('区间报表查询异常 start=%s end=%s granularity=%s', start, end, granularity,
+                      extra={'date': start})
+        return json.loads(json.dumps({
+            "Status": 100
+        }))
+    if format == 'csv':
+        filename = 'otc_{start}_{end}_{granularity}.csv'.format(start=start, end=end, granularity=granularity)
+        return StreamingResponse(report_engine.iter_range_csv(data), media_type='text/csv',
+                                 headers={'Content-Disposition': 'attachment; filename=' + filename})
+    return StreamingResponse(report_engine.iter_range_json(data, start, end, granularity),
+                             media_type='application/json')
+
 
+@app.get("/varietyReport")
+async def get_variety_report(start, end, variety=None, type=None, granularity='total', format='json'):
+    """
+    品种报表：各品种、各类型按统计周期汇总的交易笔数、成交量（吨）与成交额（元）
+    :param start: 起始日期 yyyymmdd
+    :param end: 截止日期 yyyymmdd
+    :param variety: 品种名称，多个以逗号分隔，默认全部
+    :param type: 类型，多个以逗号分隔，默认全部
+    :param granularity: 统计周期 day/week/month/year/total
+    :param format: 输出格式 json/csv
+    """
+    try:
+        data = await sv.run_blocking(sv.query_variety_rept, start, end,
+                                     variety.split(',') if variety else None,
+                                     type.split(',') if type else None, granularity)
+    except ValueError as e:
+        # 日期、统计周期参数错误，不输出异常堆栈
+        log.debug('品种报表参数错误 start=%s end=%s granularity=%s：%s', start, end, granularity, e)
         return json.loads(json.dumps({
-            "Status": 200,
-            "daily": daily,
-            "weekly": weekly,
-            "yearly": yearly,
+            "Status": 100
+        }))
+    except Exception as e:
+        log.exception('品种报表查询异常 start=%s end=%s granularity=%s', start, end, granularity,
+                      extra={'date': start})
+        return json.loads(json.dumps({
+            "Status": 100
+        }))
+    if format == 'csv':
+        filename = 'otc_variety_{start}_{end}_{granularity}.csv'.format(start=start, end=end, granularity=granularity)
+        return StreamingResponse(report_engine.iter_range_csv(data), media_type='text/csv',
+                                 headers={'Content-Disposition': 'attachment; filename=' + filename})
+    return {
+        "Status": 200,
+        "start": start,
+        "end": end,
+        "granularity": granularity,
+        "rows": data.round({'volume': 2, 'turnover': 2}).to_dict('records'),
+    }
+
+
+@app.get("/subscribe")
+async def subscribe(request: Request, date=None):
+    """
+    订阅日期的数据推送（Server-Sent Events）：先发送当前日报（report事件）及交易信息（tradeInfo事件），
+    数据变更后推送新的数据
+    :param date: 日期 yyyymmdd，默认当日
+    """
+    if date is None:
+        date = datetime.datetime.now().strftime('%Y%m%d')
+    try:
+        events = report_push.stream(date, request.headers.get('last-event-id'))
+        # 取得首条消息（订阅并生成当前数据）后再返回响应，订阅失败时返回错误
+        first = await events.__anext__()
+    except OverflowError:
+        return Response(status_code=503, headers={'Retry-After': '30'})
+    except Exception as e:
+        log.exception('订阅异常 date=%s', date, extra={'date': date})
+        return json.loads(json.dumps({
+            "Status": 100
         }))
+
+    async def body():
+        try:
+            yield first
+            async for message in events:
+                yield message
+        finally:
+            await events.aclose()
+    return StreamingResponse(body(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.get("/calendar")
+async def get_calendar(date=None, n: int = 5, start=None, end=None):
+    """
+    交易日历查询
+    指定start、end时返回区间内的交易日，否则返回date是否为交易日及其前后n个交易日
+    :param date: 日期 yyyymmdd，默认当日
+    :param n: 前后交易日数
+    :param start: 起始日期 yyyymmdd
+    :param end: 截止日期 yyyymmdd
+    """
+    try:
+        calendar = trade_calendar.get()
+        if start is not None and end is not None:
+            return {
+                "Status": 200,
+                "start": start,
+                "end": end,
+                "dates": calendar.between(start, end),
+            }
+        if date is None:
+            date = datetime.datetime.now().strftime('%Y%m%d')
+        return {
+            "Status": 200,
+            "date": date,
+            "is_trading_day": calendar.is_trading_day(date),
+            "previous": calendar.previous(date, n, inclusive=False),
+            "next": calendar.next(date, n),
+        }
     except Exception as e:
-        print(e.with_traceback())
+        log.exception('交易日历查询异常 date=%s start=%s end=%s', date, start, end, extra={'date': date})
         return json.loads(json.dumps({
             "Status": 100
         }))
 
 
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.get("/reportCacheStats")
+async def get_report_cache_stats():
+    return report_cache.stats()
+
+
 if __name__ == '__main__':
-    log = utils.get_log()
-    # 启动定时任务
-    log.info('######### 启动自动任务 #########')
-    scheduler = BackgroundScheduler(timezone='Asia/Shanghai')
-    log.info('######### 启动OTC日报采集自动任务 #########')
-    # 自动服务时间设置 周一至周五 16点至18点 每隔10分钟
-    scheduler.add_job(otc_daily_rept.job, 'cron', day_of_week='0-4', hour='18-20', minute='*/10')
-    # scheduler.add_job(otc_daily_rept.job, 'cron', day_of_week='0-4', hour='8-22', minute='*/1')
-    scheduler.start()
-    log.info('######### 启动自动任务完成 #########')
+    import uvicorn
+
+    logger.setup()
+    # 多进程指标：定时任务进程与各worker进程的指标写入同一目录，/metrics合并输出
+    metrics_dir = os.environ.setdefault('OTC_METRICS_DIR', os.path.join('logs', 'metrics'))
+    metrics.clear_multiprocess(metrics_dir)
+    metrics.enable_multiprocess(metrics_dir)
+    # 启动定时任务（推荐以python -m schedule_service.scheduler单独运行并设置OTC_SCHEDULER=0；
+    # 定时任务锁保证多个实例中只有一个采集）
+    if os.environ.get('OTC_SCHEDULER', '1') != '0':
+        from schedule_service import scheduler
+        log.info('######### 启动自动任务 #########')
+        scheduler.start_background()
 
     # 启动fastapi服务
     log.info('######### 启动fastapi服务 #########')
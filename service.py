@@ -1,8 +1,59 @@
-import pandas as pd
+import asyncio
+import datetime
+import functools
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import rollup
+import storage
+import trade_calendar
+import variety_facts
 
 turnover_unit = 10000
 
+# 查询线程池大小（每个进程），读取数据文件及pandas计算均在线程池中执行，不阻塞事件循环
+QUERY_WORKERS = int(os.environ.get('OTC_QUERY_WORKERS', 4))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _fillna(value):
+    """
+    空值替换为0
+    :param value: 字段值
+    :return: 字段值
+    """
+    return 0 if pd.isna(value) else value
+
+
+def _get_executor():
+    """
+    获得查询线程池（首次使用时创建，多进程部署时每个进程各自创建）
+    :return: ThreadPoolExecutor
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix='otc-query')
+        return _executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    在查询线程池中执行阻塞调用（文件读取、pandas计算），供异步接口await
+    线程池大小固定，并发请求超出时排队等待，不会无限制创建线程
+    :param fn: 同步函数
+    :return: fn返回值
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
 
 def query_swap_info(date):
     """
@@ -10,15 +61,10 @@ def query_swap_info(date):
     :param date: 当日日期
     :return: float swap数据[交易笔数, 名义本金]，若没有记录，则返回[0, 0]
     """
-    data_path = 'data/{year}.csv'.format(year=date[:4])
-    df = pd.read_csv(data_path)
-    df['date'] = df['date'].astype('str')
-    swap_info = df[(df['date'] == date) & (df['type'] == 'swap')][['trade_num', 'turnover']].fillna(0)
-    swap_info['turnover'] = swap_info['turnover'] / turnover_unit
-    if len(swap_info.values) == 0:
+    record = storage.get_record(date, 'swap')
+    if record is None:
         raise Exception('no data')
-    else:
-        return swap_info.values[0]
+    return [float(_fillna(record['trade_num'])), _fillna(record['turnover']) / turnover_unit]
 
 
 def update_swap_turnover(date, turnover):
@@ -28,17 +74,7 @@ def update_swap_turnover(date, turnover):
     :param turnover: turnover数据
     :return: 更新标志 True：更新成功，False：更新失败
     """
-    data_path = 'data/{year}.csv'.format(year=date[:4])
-    df = pd.read_csv(data_path)
-    df['date'] = df['date'].astype('str')
-    if not df[(df['date'] == date) & (df['type'] == 'swap')].empty:
-        # 判断该条记录是否存在
-        df = df.set_index(['date', 'type'])
-        df.loc[(date, 'swap'), 'turnover'] = float(turnover) * turnover_unit
-        df.to_csv(data_path)
-        return True
-    else:
-        return False
+    return storage.update_record(date, 'swap', {'turnover': float(turnover) * turnover_unit})
 
 
 def query_opt_info(date):
@@ -47,15 +83,11 @@ def query_opt_info(date):
     :param date: 当日日期
     :return: float opt数据[交易笔数, 名义本金]，若没有记录，则返回[0, 0]
     """
-    data_path = 'data/{year}.csv'.format(year=date[:4])
-    df = pd.read_csv(data_path)
-    df['date'] = df['date'].astype('str')
-    opt_info = df[(df['date'] == date) & (df['type'] == 'opt')][['trade_num', 'turnover', 'variety_names']].fillna(0)
-    opt_info['turnover'] = opt_info['turnover'] / turnover_unit
-    if len(opt_info.values) == 0:
+    record = storage.get_record(date, 'opt')
+    if record is None:
         raise Exception('no data')
-    else:
-        return opt_info.values[0]
+    return [int(_fillna(record['trade_num'])), _fillna(record['turnover']) / turnover_unit,
+            _fillna(record['variety_names'])]
 
 
 def update_opt_turnover(date, turnover, opt_num, opt_varieties):
@@ -65,66 +97,239 @@ def update_opt_turnover(date, turnover, opt_num, opt_varieties):
     :param turnover: turnover数据
     :return: 更新标志 True：更新成功，False：更新失败
     """
-    data_path = 'data/{year}.csv'.format(year=date[:4])
-    df = pd.read_csv(data_path)
-    df['date'] = df['date'].astype('str')
-    if not df[(df['date'] == date) & (df['type'] == 'opt')].empty:
-        # 判断该条记录是否存在
-        df = df.set_index(['date', 'type'])
-        if opt_num == '' or opt_num == '0':
-            turnover = 0
-            opt_num = 0
-        df.loc[(date, 'opt'), 'turnover'] = float(turnover) * turnover_unit
-        df.loc[(date, 'opt'), 'trade_num'] = int(opt_num)
-        df.loc[(date, 'opt'), 'variety_names'] = opt_varieties.strip()
-        df.to_csv(data_path)
-        return True
-    else:
-        return False
+    if opt_num == '' or opt_num == '0':
+        turnover = 0
+        opt_num = 0
+    return storage.update_record(date, 'opt', {
+        'turnover': float(turnover) * turnover_unit,
+        'trade_num': int(opt_num),
+        'variety_names': opt_varieties.strip(),
+    })
+
+
+@metrics.timed(metrics.SERVICE_SECONDS.labels('query_trade_info'))
+def query_trade_info(date):
+    """
+    查询当日商品互换及场外期权数据
+    :param date: 当日日期
+    :return: dict 交易笔数、名义本金及场外期权品种，没有记录时抛出异常
+    """
+    swap_info = query_swap_info(date)
+    opt_info = query_opt_info(date)
+    return {
+        "Status": 200,
+        "swap_num": swap_info[0],
+        "swap_turnover": swap_info[1],
+        "opt_num": opt_info[0],
+        "opt_turnover": opt_info[1],
+        # 场外期权品种为空时返回空字符串
+        "opt_varieties": '' if opt_info[2] == 0 else opt_info[2],
+    }
+
+
+async def query_trade_info_async(date):
+    """
+    query_trade_info的异步版本，在查询线程池中执行
+    """
+    return await run_blocking(query_trade_info, date)
 
 
+@metrics.timed(metrics.SERVICE_SECONDS.labels('query_daily_rept'))
 def query_daily_rept(date):
     """
     获得当日整体查询数据
+    当月、全年合计及前5日数据取自年度累计汇总表（rollup），无需扫描全年数据
+    前5日为交易日历中截至当日的5个交易日（可跨年度），无成交的交易日成交额为0
     :param date:
     :return:
     """
-    data_path = 'data/{year}.csv'.format(year=date[:4])
-    df = pd.read_csv(data_path)
+    year = date[:4]
+    df = storage.load_year(year)
     # 获得当日数据
-    df['date'] = df['date'].astype('str')
     daily_data = df[(df['date'] == date)]
+    year_rollup = rollup.get(year)
     # 获得前5日数据
-    last5_date = df[(df['date'] <= date) & (df['trade_num'] > 0)]['date'].drop_duplicates().sort_values(ascending=False).head(5).values
-    if len(last5_date) < 5:
-        last_year = int(date[:4]) - 1
-        last_data_path = 'data/{last_year}.csv'.format(last_year=last_year)
-        if os.path.exists(last_data_path):
-            last_top = 5 - len(last5_date)
-            last_df = pd.read_csv(last_data_path)
-            last_df['date'] = last_df['date'].astype('str')
-            last_year_date = last_df[last_df['trade_num'] > 0]['date'].drop_duplicates().sort_values(ascending=False).head(last_top).values
-            last_year_data = last_df[last_df['date'].isin(last_year_date)].groupby(['date', 'type']).sum()['turnover'].sort_index(ascending=True)
-            
-            year_data = df[df['date'].isin(last5_date)].groupby(['date', 'type']).sum()['turnover'].sort_index(ascending=True)
-            last5_data = pd.concat([last_year_data, year_data], axis=0 )
+    last5_date = trade_calendar.get().previous(date, 5)
+    frames = []
+    for last_year in sorted(set(d[:4] for d in last5_date)):
+        if last_year == year:
+            last_rollup = year_rollup
+        elif storage.year_exists(last_year):
+            last_rollup = rollup.get(last_year)
         else:
-            last5_data = df[df['date'].isin(last5_date)].groupby(['date', 'type']).sum()['turnover'].sort_index(ascending=True)
-    else:
-        last5_data = df[df['date'].isin(last5_date)].groupby(['date', 'type']).sum()['turnover'].sort_index(ascending=True)
+            continue
+        frames.append(last_rollup.turnover([d for d in last5_date if d[:4] == last_year]))
+    last5_data = pd.concat(frames, axis=0) if frames else year_rollup.turnover([])
     # 获得当月数据
-    month_data = df[(df['date'] <= date) & (df['date'] >= (date[:6]+'01'))].groupby('type').sum()
+    month_data = year_rollup.totals(date, start=date[:6] + '01')
     # 获得全年汇总数据
-    year_data = df[df['date'] <= date].groupby('type').sum()
+    year_data = year_rollup.totals(date)
 
     return {
         'daily_data': daily_data,
+        'last5_date': last5_date,
         'last5_data': last5_data,
         'month_data': month_data,
         'year_data': year_data
     }
 
 
+# 区间报表统计周期
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def _period(dates, granularity):
+    """
+    日期所属统计周期
+    :param dates: 日期Series yyyymmdd
+    :param granularity: day：当日 yyyymmdd，week：所在周的周一 yyyymmdd，month：所在月 yyyymm
+    :return: 统计周期Series
+    """
+    if granularity == 'day':
+        return dates
+    if granularity == 'month':
+        return dates.str[:6]
+    # 仅对不重复的日期做日期换算
+    unique = pd.Series(dates.unique())
+    days = pd.to_datetime(unique, format='%Y%m%d')
+    mondays = (days - pd.to_timedelta(days.dt.weekday, unit='D')).dt.strftime('%Y%m%d')
+    return dates.map(dict(zip(unique, mondays)))
+
+
+@metrics.timed(metrics.SERVICE_SECONDS.labels('query_range_rept'))
+def query_range_rept(start, end, granularity='day'):
+    """
+    获得日期区间内各类型按统计周期汇总的数据，可跨年度
+    每个年度只读取一次（取自年度累计汇总表的每日汇总值），不逐日查询
+    :param start: 起始日期 yyyymmdd（含）
+    :param end: 截止日期 yyyymmdd（含）
+    :param granularity: 统计周期 day/week/month
+    :return: DataFrame columns：period, type, trade_num, volume, turnover，按(period, type)升序
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError('granularity must be one of %s' % (GRANULARITIES,))
+    if start > end:
+        raise ValueError('start after end')
+    frames = []
+    for year in range(int(start[:4]), int(end[:4]) + 1):
+        year = str(year)
+        if not storage.year_exists(year):
+            continue
+        frames.append(rollup.get(year).frame(max(start, year + '0101'), min(end, year + '1231')))
+    columns = ['period', 'type'] + rollup.METRICS
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    data = pd.concat(frames, ignore_index=True)
+    data['period'] = _period(data['date'], granularity)
+    return data.groupby(['period', 'type'], as_index=False)[rollup.METRICS].sum()[columns]
+
+
+# 品种报表统计周期，total为区间合计
+VARIETY_GRANULARITIES = GRANULARITIES + ('year', 'total')
+
+
+def _period_starts(start, end, granularity):
+    """
+    日期区间内各统计周期的起始日期及统计周期标识（统计周期标识同_period）
+    :param start: 起始日期 yyyymmdd
+    :param end: 截止日期 yyyymmdd
+    :param granularity: week/month/year/total
+    :return: (起始日期列表, 统计周期标识列表)
+    """
+    if granularity in ('year', 'total'):
+        return [start], [start[:4]]
+    first = datetime.datetime.strptime(start, '%Y%m%d').date()
+    last = datetime.datetime.strptime(end, '%Y%m%d').date()
+    if granularity == 'month':
+        starts = [start]
+        year, month = first.year, first.month
+        while True:
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+            day = '%04d%02d01' % (year, month)
+            if day > end:
+                break
+            starts.append(day)
+        return starts, [day[:6] for day in starts]
+    monday = first - datetime.timedelta(days=first.weekday())
+    starts, labels = [start], [monday.strftime('%Y%m%d')]
+    monday += datetime.timedelta(days=7)
+    while monday <= last:
+        starts.append(monday.strftime('%Y%m%d'))
+        labels.append(starts[-1])
+        monday += datetime.timedelta(days=7)
+    return starts, labels
+
+
+def _reduce(periods, variety_codes, ctypes, values, names):
+    """
+    按(统计周期, 品种编码, 类型)合并汇总值并排序（跨年度的周及区间合计由各年度的部分合并）
+    :param periods: 统计周期数组
+    :param variety_codes: 品种编码数组
+    :param ctypes: 类型数组
+    :param values: 汇总值数组[行, METRICS]
+    :param names: 品种编码 -> 品种名称
+    :return: DataFrame columns：period, variety, type, METRICS
+    """
+    period_keys, period_idx = np.unique(periods, return_inverse=True)
+    code_keys, code_idx = np.unique(variety_codes, return_inverse=True)
+    type_keys, type_idx = np.unique(ctypes, return_inverse=True)
+    key = (period_idx * len(code_keys) + code_idx) * len(type_keys) + type_idx
+    keys, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    sums = [np.bincount(inverse, weights=values[:, i], minlength=len(keys)) for i in range(values.shape[1])]
+    data = {
+        'period': period_keys[period_idx[first]],
+        'variety': [names.get(code) for code in code_keys[code_idx[first]].tolist()],
+        'type': type_keys[type_idx[first]],
+    }
+    for metric, column in zip(variety_facts.METRICS, sums):
+        data[metric] = column
+    result = pd.DataFrame(data)
+    result['trade_num'] = result['trade_num'].round().astype('int64')
+    return result
+
+
+@metrics.timed(metrics.SERVICE_SECONDS.labels('query_variety_rept'))
+def query_variety_rept(start, end, varieties=None, types=None, granularity='total'):
+    """
+    获得日期区间内各品种、各类型按统计周期汇总的数据，可跨年度，取自品种明细索引，不请求接口
+    各统计周期合计由索引累计值相减得到，不逐日汇总
+    :param start: 起始日期 yyyymmdd（含）
+    :param end: 截止日期 yyyymmdd（含）
+    :param varieties: 品种名称列表，默认全部
+    :param types: 类型列表，默认全部
+    :param granularity: 统计周期 day/week/month/year/total
+    :return: DataFrame columns：period, variety, type, trade_num, volume, turnover，按(period, 品种编码, type)升序；
+             total时period为 start-end
+    """
+    if granularity not in VARIETY_GRANULARITIES:
+        raise ValueError('granularity must be one of %s' % (VARIETY_GRANULARITIES,))
+    if start > end:
+        raise ValueError('start after end')
+    code_map = variety_facts.codes()
+    codes = None if varieties is None else set(code_map[name] for name in varieties if name in code_map)
+    types = None if types is None else set(types)
+    parts = []
+    for year in range(int(start[:4]), int(end[:4]) + 1):
+        index = variety_facts.get(year)
+        if index is None:
+            continue
+        year_start, year_end = max(start, str(year) + '0101'), min(end, str(year) + '1231')
+        if granularity == 'day':
+            parts.append(index.days(year_start, year_end, codes, types))
+            continue
+        starts, labels = _period_starts(year_start, year_end, granularity)
+        variety_codes, ctypes, periods, values = index.buckets(starts, year_end, codes, types)
+        parts.append((variety_codes, ctypes, np.asarray(labels, dtype=object)[periods], values))
+    names = {code: name for name, code in code_map.items()}
+    if not parts:
+        return pd.DataFrame(columns=['period', 'variety', 'type'] + variety_facts.METRICS)
+    variety_codes = np.concatenate([part[0] for part in parts])
+    periods = np.full(len(variety_codes), start + '-' + end, dtype=object) if granularity == 'total' else \
+        np.concatenate([part[2] for part in parts])
+    return _reduce(periods, variety_codes, np.concatenate([part[1] for part in parts]),
+                   np.concatenate([part[3] for part in parts]), names)
+
+
 if __name__ == '__main__':
     print(query_swap_info('20220223')[0])
     # print(update_swap_turnover('20220223', 201))
@@ -0,0 +1,192 @@
+"""
+静态文件（static目录）：服务启动时读入内存并预压缩（gzip；安装brotli时同时生成br），请求时按Accept-Encoding
+直接返回内存中的内容；ETag为文件内容摘要，客户端缓存有效时返回304；文件修改后下次请求时重新读取
+
+环境变量：
+    OTC_STATIC_DIR      静态文件目录，默认static
+    OTC_STATIC_MAX_AGE  静态文件浏览器缓存时间 单位：秒，默认604800（7天，到期后以ETag校验）
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+import compression
+import metrics
+
+STATIC_DIR = os.environ.get('OTC_STATIC_DIR', 'static')
+MAX_AGE = int(os.environ.get('OTC_STATIC_MAX_AGE', 604800))
+# 页面入口每次校验（304），页面更新后立即生效
+INDEX_CACHE_CONTROL = 'no-cache'
+# 小于该大小的文件不压缩 单位：字节
+MIN_COMPRESS_SIZE = 256
+BROTLI_QUALITY = 11
+
+_CACHE_HIT = metrics.CACHE_REQUESTS.labels('static', 'hit')
+_CACHE_MISS = metrics.CACHE_REQUESTS.labels('static', 'miss')
+
+
+def _token(path):
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class Asset:
+    """
+    内存中的静态文件：原始内容及各编码的预压缩内容
+    """
+
+    def __init__(self, body, media_type, token):
+        self.media_type = media_type
+        self.token = token
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        # 编码 -> 内容，None为原始内容
+        self.bodies = {None: body}
+        if media_type.split(';')[0] in compression.COMPRESSIBLE_TYPES and len(body) >= MIN_COMPRESS_SIZE:
+            encoded = {'gzip': compression.gzip_bytes(body)}
+            brotli = compression.brotli_module()
+            if brotli is not None:
+                encoded['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+            self.bodies.update((name, data) for name, data in encoded.items() if len(data) < len(body))
+
+    def response(self, headers, cache_control, head=False):
+        """
+        :param headers: 请求头
+        :param cache_control: Cache-Control
+        :param head: True HEAD请求，不返回内容
+        :return: Response
+        """
+        encoding = compression.choose(headers.get('accept-encoding'), self.bodies)
+        # 不同编码的内容不同，ETag加编码后缀区分
+        etag = self.etag if encoding is None else self.etag[:-1] + '-' + encoding + '"'
+        result = {'ETag': etag, 'Cache-Control': cache_control}
+        if len(self.bodies) > 1:
+            result['Vary'] = 'Accept-Encoding'
+        if_none_match = headers.get('if-none-match')
+        if if_none_match:
+            tags = [compression.strip_weak(tag.strip()) for tag in if_none_match.split(',')]
+            if etag in tags or '*' in tags:
+                return Response(status_code=304, headers=result)
+        if encoding is not None:
+            result['Content-Encoding'] = encoding
+        body = self.bodies[encoding]
+        if head:
+            result['Content-Length'] = str(len(body))
+            body = b''
+        return Response(content=body, media_type=self.media_type, headers=result)
+
+
+class AssetStore:
+    """
+    静态文件目录在内存中的副本，请求时校验文件标识（修改时间、大小），文件修改后重新读取
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # 相对路径 -> Asset
+        self._assets = {}
+
+    def root(self):
+        return os.path.abspath(self.directory or STATIC_DIR)
+
+    def _path(self, name):
+        """
+        请求路径对应的文件路径，不允许访问目录以外的文件
+        """
+        root = self.root()
+        path = os.path.normpath(os.path.join(root, *name.split('/')))
+        if path != root and path.startswith(root + os.sep):
+            return path
+        return None
+
+    def load(self):
+        """
+        读入并预压缩目录下全部文件（服务启动时调用）
+        :return: 文件数
+        """
+        root = self.root()
+        count = 0
+        for directory, _, files in os.walk(root):
+            for file in files:
+                name = os.path.relpath(os.path.join(directory, file), root).replace(os.sep, '/')
+                if self.get(name) is not None:
+                    count += 1
+        return count
+
+    def cached(self, name):
+        """
+        取得内存中的文件，未读取或文件已修改时返回None
+        """
+        asset = self._assets.get(name)
+        path = self._path(name)
+        if asset is not None and path is not None and asset.token == _token(path):
+            return asset
+        return None
+
+    def get(self, name):
+        """
+        取得文件，未读取或已修改时重新读取并压缩
+        :param name: 相对路径 如 js/app.js
+        :return: Asset，文件不存在时返回None
+        """
+        asset = self.cached(name)
+        if asset is not None:
+            _CACHE_HIT.inc()
+            return asset
+        path = self._path(name)
+        token = None if path is None else _token(path)
+        if token is None or not os.path.isfile(path):
+            with self._lock:
+                self._assets.pop(name, None)
+            return None
+        _CACHE_MISS.inc()
+        with open(path, 'rb') as f:
+            body = f.read()
+        media_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        # text/类型由Response加charset
+        if media_type == 'application/javascript':
+            media_type += '; charset=utf-8'
+        asset = Asset(body, media_type, token)
+        with self._lock:
+            self._assets[name] = asset
+        return asset
+
+    async def response(self, name, headers, cache_control=None, head=False):
+        """
+        :param name: 相对路径
+        :param headers: 请求头
+        :param cache_control: Cache-Control，默认缓存MAX_AGE秒
+        :param head: True HEAD请求
+        :return: Response
+        """
+        asset = self.cached(name)
+        if asset is not None:
+            _CACHE_HIT.inc()
+        else:
+            # 读取及压缩文件在线程池中执行，不阻塞事件循环
+            asset = await run_in_threadpool(self.get, name)
+        if asset is None:
+            return Response(status_code=404, content=b'Not Found', media_type='text/plain')
+        return asset.response(headers, cache_control or 'public, max-age=%d' % MAX_AGE, head)
+
+    async def __call__(self, scope, receive, send):
+        """
+        ASGI应用，挂载到/static
+        """
+        if scope['method'] not in ('GET', 'HEAD'):
+            response = Response(status_code=405, headers={'Allow': 'GET, HEAD'})
+        else:
+            response = await self.response(scope['path'].lstrip('/'), Headers(scope=scope),
+                                           head=scope['method'] == 'HEAD')
+        await response(scope, receive, send)
+
+
+store = AssetStore()
@@ -0,0 +1,792 @@
+import argparse
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from atomic_file import atomic_write
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# 数据目录
+DATA_DIR = os.environ.get('OTC_DATA_DIR', 'data')
+# 存储格式 csv：文本文件（默认） parquet：Parquet列式文件 feather：Arrow IPC列式文件（内存映射读取）
+# sqlite：SQLite数据库，按(date, type)主键点查询与单行更新
+BACKEND = os.environ.get('OTC_STORAGE', 'csv')
+# 年度数据表缓存上限（按年份计）
+CACHE_SIZE = int(os.environ.get('OTC_TABLE_CACHE_SIZE', 8))
+# SQLite数据库文件名
+SQLITE_FILE = 'otc.sqlite3'
+# SQLite连接池大小（每个进程）
+SQLITE_POOL_SIZE = 8
+# 数据文件写锁等待超时 单位：秒
+LOCK_TIMEOUT = float(os.environ.get('OTC_LOCK_TIMEOUT', 30))
+
+# 年度数据表字段
+COLUMNS = ['date', 'type', 'variety_ids', 'variety_names', 'trade_num', 'volume', 'turnover']
+KEY = ['date', 'type']
+TEXT_COLUMNS = ['variety_ids', 'variety_names']
+
+_lock = threading.Lock()
+# 缓存：缓存键 -> (数据标识, DataFrame)
+_cache = OrderedDict()
+# 进程内写入版本号：数据文件路径 -> 版本号
+_versions = {}
+# 数据变更监听：fn(year, dates)
+_listeners = []
+# 本线程最近一次写入前后的年度数据标识 tokens：年份 -> (写入前, 写入后)
+_write_tokens = threading.local()
+
+_CACHE_HIT = metrics.CACHE_REQUESTS.labels('table', 'hit')
+_CACHE_MISS = metrics.CACHE_REQUESTS.labels('table', 'miss')
+_READ_SECONDS = metrics.STORAGE_SECONDS.labels('read')
+_WRITE_SECONDS = metrics.STORAGE_SECONDS.labels('write')
+_LOCK_SECONDS = metrics.STORAGE_SECONDS.labels('lock_wait')
+
+
+def _cache_get(key, token):
+    """
+    读取缓存，数据标识不一致时视为未命中
+    :param key: 缓存键
+    :param token: 当前数据标识
+    :return: DataFrame，未命中时返回None
+    """
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == token:
+            _cache.move_to_end(key)
+            _CACHE_HIT.inc()
+            return cached[1]
+    _CACHE_MISS.inc()
+    return None
+
+
+def _cache_put(key, token, df):
+    """
+    写入缓存，超出上限时淘汰最久未使用的数据表
+    :param key: 缓存键
+    :param token: 数据标识
+    :param df: DataFrame
+    :return:
+    """
+    with _lock:
+        _cache[key] = (token, df)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _file_token(path):
+    """
+    获得数据文件标识（修改时间、文件大小、写入版本号），任一变化即视为文件已修改
+    :param path: 数据文件路径
+    :return: 文件标识，文件不存在时返回None
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, _versions.get(path, 0)
+
+
+def invalidate(path=None):
+    """
+    使数据文件缓存失效，写入数据文件后调用
+    :param path: 数据文件路径，为None时清空全部缓存
+    :return:
+    """
+    with _lock:
+        if path is None:
+            for key in list(_versions):
+                _versions[key] += 1
+            _cache.clear()
+        else:
+            _versions[path] = _versions.get(path, 0) + 1
+            _cache.pop(path, None)
+
+
+def _try_lock(fd):
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path, timeout=None):
+    """
+    数据文件写锁：跨进程（各uvicorn worker、定时任务、手工更新）互斥，同一进程的不同线程之间同样互斥
+    锁文件为同目录下的 .{文件名}.lock，读取方不加锁（写入为原子替换，总是读到完整的文件）
+    :param path: 数据文件路径
+    :param timeout: 等待超时 单位：秒，默认LOCK_TIMEOUT，超时抛出TimeoutError
+    :return:
+    """
+    timeout = LOCK_TIMEOUT if timeout is None else timeout
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(os.path.join(directory, '.' + os.path.basename(path) + '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        with _LOCK_SECONDS.time():
+            deadline = time.monotonic() + timeout
+            delay = 0.001
+            while not _try_lock(fd):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError('lock timeout: ' + path)
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+def add_listener(fn):
+    """
+    注册数据变更监听，本进程写入年度数据后调用 fn(year, dates)
+    :param fn: 监听函数，year：年份，dates：变更的日期集合
+    :return:
+    """
+    _listeners.append(fn)
+
+
+def _record_write(year, before, after):
+    if not hasattr(_write_tokens, 'tokens'):
+        _write_tokens.tokens = {}
+    _write_tokens.tokens[year] = (before, after)
+
+
+def written_tokens(year):
+    """
+    本线程最近一次写入年度数据前后的数据标识（在数据变更监听中调用，监听与写入在同一线程）
+    写入前的标识与缓存记录的标识相同时，缓存依赖的数据期间未被其他进程修改
+    :param year: 年份 yyyy
+    :return: (写入前, 写入后)，本线程未写入该年度时返回(None, None)
+    """
+    return getattr(_write_tokens, 'tokens', {}).get(year, (None, None))
+
+
+def _notify(written):
+    """
+    通知数据变更
+    :param written: 年份 -> 变更的日期集合
+    :return:
+    """
+    for year, dates in written.items():
+        for fn in _listeners:
+            fn(year, dates)
+
+
+def _normalize(df):
+    """
+    转换为与读取数据文件一致的类型，用于写入后直接更新缓存
+    :param df: DataFrame
+    :return: DataFrame
+    """
+    df = df.reset_index(drop=True)
+    df['date'] = df['date'].astype('str')
+    for col in TEXT_COLUMNS:
+        df[col] = df[col].astype(object).where(df[col].notna() & (df[col] != ''), np.nan)
+    for col in ('trade_num', 'volume', 'turnover'):
+        df[col] = pd.to_numeric(df[col])
+    return df
+
+
+def _to_columnar(df):
+    """
+    转换为列式存储类型：date -> int32，type -> category，空字符串 -> null
+    :param df: DataFrame
+    :return: DataFrame
+    """
+    df = df.reset_index(drop=True)
+    df['date'] = df['date'].astype('int32')
+    df['type'] = df['type'].astype('category')
+    for col in TEXT_COLUMNS:
+        df[col] = df[col].astype(object).where(df[col].notna() & (df[col] != ''), None)
+    return df
+
+
+def _from_columnar(df):
+    """
+    转换为与CSV读取结果一致的类型：date -> str，type -> str，null -> NaN
+    :param df: DataFrame
+    :return: DataFrame
+    """
+    df['date'] = df['date'].astype('str')
+    df['type'] = df['type'].astype(object)
+    for col in TEXT_COLUMNS:
+        df[col] = df[col].astype(object).where(df[col].notna(), np.nan)
+    return df
+
+
+def _new_records(records):
+    """
+    记录列表转换为DataFrame，同一(date, type)保留最后一条
+    :param records: 记录列表，每条记录为字段顺序同COLUMNS的元组或dict
+    :return: DataFrame
+    """
+    df = pd.DataFrame([r if isinstance(r, dict) else dict(zip(COLUMNS, r)) for r in records], columns=COLUMNS)
+    df['date'] = df['date'].astype('str')
+    return df.drop_duplicates(KEY, keep='last')
+
+
+class FileBackend:
+    """
+    按年度分文件存储，每个年度一个数据文件，子类实现文件格式的读写
+    """
+    name = None
+    suffix = None
+
+    def read(self, path):
+        raise NotImplementedError
+
+    def write(self, df, path):
+        raise NotImplementedError
+
+    def path(self, year):
+        return os.path.join(DATA_DIR, '{year}{suffix}'.format(year=year, suffix=self.suffix))
+
+    def years(self):
+        if not os.path.isdir(DATA_DIR):
+            return []
+        return sorted(name[:-len(self.suffix)] for name in os.listdir(DATA_DIR)
+                      if name.endswith(self.suffix) and len(name) == 4 + len(self.suffix)
+                      and name[:4].isdigit())
+
+    def year_exists(self, year):
+        return os.path.exists(self.path(year))
+
+    def year_token(self, year):
+        return _file_token(self.path(year))
+
+    def read_year(self, year):
+        return read_table(self.path(year))
+
+    def load_year(self, year):
+        return load_table(self.path(year))
+
+    def save_year(self, year, df):
+        path = self.path(year)
+        with file_lock(path):
+            write_table(path, df)
+
+    def get_record(self, date, ctype):
+        df = self.load_year(date[:4])
+        rows = df[(df['date'] == date) & (df['type'] == ctype)]
+        if rows.empty:
+            return None
+        return rows.iloc[0].to_dict()
+
+    def upsert(self, new_df, preserve):
+        written = {}
+        for year, year_df in new_df.groupby(new_df['date'].str[:4], sort=True):
+            path = self.path(year)
+            new_rows = year_df.set_index(KEY)
+            with file_lock(path):
+                before = _file_token(path)
+                if os.path.exists(path):
+                    merged = _load_locked(path).set_index(KEY)
+                    exists = new_rows.index.isin(merged.index)
+                    updated = new_rows[exists].copy()
+                    for ctype, fields in preserve.items():
+                        keep = updated.index.get_level_values('type') == ctype
+                        updated.loc[keep, fields] = merged.loc[updated.index[keep], fields].values
+                    merged.loc[updated.index, updated.columns] = updated
+                    merged = pd.concat([merged, new_rows[~exists]])
+                else:
+                    merged = new_rows
+                write_table(path, merged.reset_index())
+                _record_write(year, before, _file_token(path))
+            written[year] = set(year_df['date'])
+        return written
+
+    def update_record(self, date, ctype, fields):
+        path = self.path(date[:4])
+        with file_lock(path):
+            before = _file_token(path)
+            df = _load_locked(path)
+            if df[(df['date'] == date) & (df['type'] == ctype)].empty:
+                return False
+            df = df.set_index(KEY)
+            for field, value in fields.items():
+                df.loc[(date, ctype), field] = value
+            write_table(path, df.reset_index())
+            _record_write(date[:4], before, _file_token(path))
+        return True
+
+
+class CsvBackend(FileBackend):
+    """
+    CSV文本格式，与原有数据文件兼容
+    """
+    name = 'csv'
+    suffix = '.csv'
+
+    def read(self, path):
+        return pd.read_csv(path, dtype={'date': str})
+
+    def write(self, df, path):
+        df.to_csv(path, index=False)
+
+
+class ParquetBackend(FileBackend):
+    """
+    Parquet列式格式，date存储为int32，type存储为分类类型，读取时无需文本解析与类型推断
+    """
+    name = 'parquet'
+    suffix = '.parquet'
+
+    def read(self, path):
+        return _from_columnar(pd.read_parquet(path))
+
+    def write(self, df, path):
+        _to_columnar(df).to_parquet(path, index=False)
+
+
+class FeatherBackend(FileBackend):
+    """
+    Arrow IPC（Feather v2）列式格式，内存映射读取，数值列零拷贝
+    """
+    name = 'feather'
+    suffix = '.feather'
+
+    def read(self, path):
+        from pyarrow import feather
+        return _from_columnar(feather.read_table(path, memory_map=True).to_pandas())
+
+    def write(self, df, path):
+        from pyarrow import feather
+        feather.write_feather(_to_columnar(df), path, compression='uncompressed')
+
+
+def _sql_value(value):
+    """
+    转换为SQLite可绑定的值：NaN -> NULL，numpy标量 -> Python标量
+    :param value: 字段值
+    :return: 字段值
+    """
+    if value is None:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+class SqliteBackend:
+    """
+    SQLite存储，全部年度数据保存在一张以(date, type)为主键的表中
+    WAL模式下读写互不阻塞，适用于多个uvicorn进程与定时任务同时访问
+    """
+    name = 'sqlite'
+
+    SCHEMA = [
+        # 主键(date, type)聚簇存储，按日期的点查询与范围查询均走主键索引
+        'CREATE TABLE IF NOT EXISTS otc_daily ('
+        ' date TEXT NOT NULL, type TEXT NOT NULL, variety_ids TEXT, variety_names TEXT,'
+        ' trade_num INTEGER, volume REAL, turnover REAL,'
+        ' PRIMARY KEY (date, type)) WITHOUT ROWID',
+        # 年度数据版本号，写入时递增，用于跨进程的数据表缓存校验
+        'CREATE TABLE IF NOT EXISTS otc_version (year TEXT PRIMARY KEY, version INTEGER NOT NULL)',
+    ]
+    BUMP_VERSION = ('INSERT INTO otc_version (year, version) VALUES (?, 1) '
+                    'ON CONFLICT(year) DO UPDATE SET version = version + 1')
+
+    def __init__(self):
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+
+    def path(self, year=None):
+        return os.path.join(DATA_DIR, SQLITE_FILE)
+
+    def _connect(self, path):
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        return conn
+
+    def _pool(self, path):
+        # 连接池按进程区分，fork后的子进程不复用父进程连接
+        key = (os.getpid(), path)
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                conn = self._connect(path)
+                for sql in self.SCHEMA:
+                    conn.execute(sql)
+                pool = queue.LifoQueue()
+                pool.put(conn)
+                self._pools[key] = pool
+        return pool
+
+    @contextmanager
+    def connection(self):
+        """
+        从连接池获取连接，使用完毕后归还
+        """
+        path = self.path()
+        pool = self._pool(path)
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect(path)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            if pool.qsize() < SQLITE_POOL_SIZE:
+                pool.put(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        写事务，开始时即获取写锁，避免读锁升级冲突
+        """
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _bump(self, conn, year):
+        """
+        写事务中增加年度数据版本号，记录写入前后的数据标识
+        """
+        row = conn.execute('SELECT version FROM otc_version WHERE year = ?', (year,)).fetchone()
+        before = row[0] if row else 0
+        conn.execute(self.BUMP_VERSION, (year,))
+        _record_write(year, before, before + 1)
+
+    def years(self):
+        with self.connection() as conn:
+            rows = conn.execute('SELECT DISTINCT substr(date, 1, 4) FROM otc_daily ORDER BY 1').fetchall()
+        return [row[0] for row in rows]
+
+    def year_token(self, year):
+        with self.connection() as conn:
+            row = conn.execute('SELECT version FROM otc_version WHERE year = ?', (year,)).fetchone()
+        return row[0] if row else 0
+
+    def year_exists(self, year):
+        with self.connection() as conn:
+            row = conn.execute('SELECT 1 FROM otc_daily WHERE date BETWEEN ? AND ? LIMIT 1',
+                               (year + '0101', year + '1231')).fetchone()
+        return row is not None
+
+    @metrics.timed(_READ_SECONDS)
+    def _read_year(self, conn, year):
+        df = pd.read_sql_query(
+            'SELECT ' + ', '.join(COLUMNS) + ' FROM otc_daily WHERE date BETWEEN ? AND ? ORDER BY date, type',
+            conn, params=(year + '0101', year + '1231'))
+        for col in TEXT_COLUMNS:
+            df[col] = df[col].astype(object).where(df[col].notna() & (df[col] != ''), np.nan)
+        df['volume'] = df['volume'].astype(float)
+        df['turnover'] = df['turnover'].astype(float)
+        return df
+
+    def read_year(self, year):
+        with self.connection() as conn:
+            return self._read_year(conn, year)
+
+    def load_year(self, year):
+        with self.connection() as conn:
+            # 同一读事务内读取版本号与数据，保证二者一致
+            conn.execute('BEGIN')
+            row = conn.execute('SELECT version FROM otc_version WHERE year = ?', (year,)).fetchone()
+            token = row[0] if row else 0
+            key = (self.path(), year)
+            df = _cache_get(key, token)
+            if df is None:
+                df = self._read_year(conn, year)
+                if df.empty:
+                    conn.execute('COMMIT')
+                    raise FileNotFoundError(self.path() + ':' + year)
+                _cache_put(key, token, df)
+            conn.execute('COMMIT')
+        return df
+
+    def save_year(self, year, df):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM otc_daily WHERE date BETWEEN ? AND ?', (year + '0101', year + '1231'))
+            conn.executemany(
+                'INSERT INTO otc_daily (' + ', '.join(COLUMNS) + ') VALUES (' + ', '.join('?' * len(COLUMNS)) + ')',
+                [[_sql_value(v) for v in row] for row in df[COLUMNS].itertuples(index=False)])
+            conn.execute(self.BUMP_VERSION, (year,))
+
+    def get_record(self, date, ctype):
+        with self.connection() as conn:
+            row = conn.execute('SELECT ' + ', '.join(COLUMNS) + ' FROM otc_daily WHERE date = ? AND type = ?',
+                               (date, ctype)).fetchone()
+        if row is None:
+            return None
+        return {col: (np.nan if value is None or value == '' else value) for col, value in zip(COLUMNS, row)}
+
+    def upsert(self, new_df, preserve):
+        written = {}
+        with self.transaction() as conn:
+            for row in new_df[COLUMNS].itertuples(index=False):
+                fields = [col for col in COLUMNS[2:] if col not in preserve.get(row.type, ())]
+                conn.execute(
+                    'INSERT INTO otc_daily (' + ', '.join(COLUMNS) + ') VALUES (' + ', '.join('?' * len(COLUMNS)) + ')'
+                    ' ON CONFLICT(date, type) DO UPDATE SET '
+                    + ', '.join('{col} = excluded.{col}'.format(col=col) for col in fields),
+                    [_sql_value(v) for v in row])
+                written.setdefault(row.date[:4], set()).add(row.date)
+            for year in written:
+                self._bump(conn, year)
+        return written
+
+    def update_record(self, date, ctype, fields):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE otc_daily SET ' + ', '.join(col + ' = ?' for col in fields) + ' WHERE date = ? AND type = ?',
+                [_sql_value(v) for v in fields.values()] + [date, ctype])
+            if cursor.rowcount == 0:
+                return False
+            self._bump(conn, date[:4])
+        return True
+
+
+BACKENDS = {backend.name: backend for backend in
+            (CsvBackend(), ParquetBackend(), FeatherBackend(), SqliteBackend())}
+
+
+def get_backend(name=None):
+    """
+    获得存储格式
+    :param name: 存储格式名称，默认取BACKEND配置
+    :return: 存储格式对象
+    """
+    name = name or BACKEND
+    if name not in BACKENDS:
+        raise ValueError('unknown storage backend: ' + str(name))
+    return BACKENDS[name]
+
+
+def _backend_of(path):
+    """
+    根据文件后缀获得文件存储格式
+    :param path: 数据文件路径
+    :return: 存储格式对象
+    """
+    for backend in BACKENDS.values():
+        if isinstance(backend, FileBackend) and path.endswith(backend.suffix):
+            return backend
+    return get_backend()
+
+
+def year_path(year, backend=None):
+    """
+    获得年度数据文件路径（SQLite存储时为数据库文件路径）
+    :param year: 年份 yyyy
+    :param backend: 存储格式名称，默认取BACKEND配置
+    :return: 数据文件路径
+    """
+    return get_backend(backend).path(str(year))
+
+
+def year_exists(year):
+    """
+    判断年度数据是否存在
+    :param year: 年份 yyyy
+    :return: True 存在，False 不存在
+    """
+    return get_backend().year_exists(str(year))
+
+
+def years(backend=None):
+    """
+    获得已有数据的年份列表
+    :param backend: 存储格式名称，默认取BACKEND配置
+    :return: 年份列表（升序）
+    """
+    return get_backend(backend).years()
+
+
+def read_table(path):
+    """
+    解析数据文件（不使用缓存），date列统一为str类型
+    :param path: 数据文件路径
+    :return: DataFrame
+    """
+    with _READ_SECONDS.time():
+        return _backend_of(path).read(path)
+
+
+def load_table(path):
+    """
+    读取数据文件（带缓存），文件修改后自动重新加载
+    返回的DataFrame为各调用方共享，调用方不可原地修改
+    :param path: 数据文件路径
+    :return: DataFrame
+    """
+    token = _file_token(path)
+    if token is None:
+        raise FileNotFoundError(path)
+    df = _cache_get(path, token)
+    if df is None:
+        df = read_table(path)
+        _cache_put(path, token, df)
+    return df
+
+
+def _load_locked(path):
+    """
+    持有写锁时读取数据文件：其他进程在同一时间精度内写入相同大小的文件时文件标识不变，
+    缓存可能是旧数据，因此重新解析文件，并以解析结果更新缓存
+    :param path: 数据文件路径
+    :return: DataFrame，文件不存在时抛出FileNotFoundError
+    """
+    token = _file_token(path)
+    if token is None:
+        raise FileNotFoundError(path)
+    df = read_table(path)
+    _cache_put(path, token, df)
+    return df
+
+
+def load_year(year):
+    """
+    读取年度数据表（带缓存）
+    返回的DataFrame为各调用方共享，调用方不可原地修改
+    :param year: 年份 yyyy
+    :return: DataFrame
+    """
+    return get_backend().load_year(str(year))
+
+
+def write_table(path, df):
+    """
+    原子写入数据文件：先写入同目录临时文件，再替换原文件，读取方不会读到写入一半的文件
+    :param path: 数据文件路径
+    :param df: DataFrame，字段同COLUMNS
+    :return:
+    """
+    try:
+        with _WRITE_SECONDS.time(), atomic_write(path) as tmp_path:
+            _backend_of(path).write(df, tmp_path)
+    except BaseException:
+        invalidate(path)
+        raise
+    invalidate(path)
+    # 写入后直接更新缓存，后续读取无需重新解析文件
+    _cache_put(path, _file_token(path), _normalize(df))
+
+
+def year_token(year):
+    """
+    获得年度数据标识，数据变更（包括其他进程写入）后标识随之变化
+    :param year: 年份 yyyy
+    :return: 数据标识
+    """
+    return get_backend().year_token(str(year))
+
+
+def get_record(date, ctype):
+    """
+    查询单条记录
+    :param date: 日期 yyyymmdd
+    :param ctype: 类型
+    :return: 字段 -> 值，记录不存在时返回None
+    """
+    return get_backend().get_record(date, ctype)
+
+
+@metrics.timed(metrics.STORAGE_SECONDS.labels('upsert'))
+def upsert_records(records, preserve=None):
+    """
+    批量新增或更新记录，每个年度数据只写入一次
+    :param records: 记录列表，每条记录为字段顺序同COLUMNS的元组或dict
+    :param preserve: 更新已有记录时保留原值的字段 类型 -> 字段列表
+    :return: 年份 -> 写入的日期集合
+    """
+    new_df = _new_records(records)
+    if new_df.empty:
+        return {}
+    written = get_backend().upsert(new_df, preserve or {})
+    _notify(written)
+    return written
+
+
+@metrics.timed(metrics.STORAGE_SECONDS.labels('update'))
+def update_record(date, ctype, fields):
+    """
+    更新已有记录的部分字段
+    :param date: 日期 yyyymmdd
+    :param ctype: 类型
+    :param fields: 字段 -> 新值
+    :return: 更新标志 True：更新成功，False：记录不存在
+    """
+    if not get_backend().update_record(date, ctype, fields):
+        return False
+    _notify({date[:4]: {date}})
+    return True
+
+
+def convert(src, dst, year_list=None, verify=True):
+    """
+    在存储格式之间转换年度数据（CSV导入列式格式/SQLite，或导出为CSV）
+    :param src: 源存储格式名称
+    :param dst: 目标存储格式名称
+    :param year_list: 转换的年份列表，默认全部
+    :param verify: 是否校验转换前后数据一致
+    :return: 已转换的年份列表
+    """
+    src_backend = get_backend(src)
+    dst_backend = get_backend(dst)
+    converted = []
+    for year in year_list or src_backend.years():
+        df = src_backend.read_year(year)
+        dst_backend.save_year(year, df)
+        if verify:
+            pd.testing.assert_frame_equal(
+                df.sort_values(KEY).reset_index(drop=True),
+                dst_backend.read_year(year).sort_values(KEY).reset_index(drop=True),
+                check_dtype=False)
+        converted.append(year)
+    return converted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='年度数据存储格式转换')
+    parser.add_argument('--src', default='csv', choices=sorted(BACKENDS))
+    parser.add_argument('--dst', default='parquet', choices=sorted(BACKENDS))
+    parser.add_argument('--years', nargs='*')
+    parser.add_argument('--no-verify', action='store_true')
+    args = parser.parse_args()
+    for y in convert(args.src, args.dst, args.years, not args.no_verify):
+        print('{year}: {src} -> {dst}'.format(year=y, src=year_path(y, args.src), dst=year_path(y, args.dst)))
@@ -0,0 +1,109 @@
+import csv
+import os
+import threading
+from bisect import bisect_left, bisect_right
+
+import storage
+
+# 交易日历文件名（数据目录下），每行一个交易日 yyyymmdd
+CALENDAR_FILE = 'trade_date.csv'
+
+_lock = threading.Lock()
+# 日历文件路径 -> (文件标识, TradeCalendar)
+_calendars = {}
+
+
+class TradeCalendar:
+    """
+    交易日历：有序交易日数组及集合，判断是否交易日O(1)，前后N个交易日二分查找O(log n)
+    """
+
+    def __init__(self, dates):
+        self.dates = sorted(set(dates))
+        self._date_set = frozenset(self.dates)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, date):
+        return date in self._date_set
+
+    def is_trading_day(self, date):
+        """
+        :param date: 日期 yyyymmdd
+        :return: True 交易日
+        """
+        return date in self._date_set
+
+    def previous(self, date, n, inclusive=True):
+        """
+        date之前的最后n个交易日
+        :param date: 日期 yyyymmdd
+        :param n: 交易日数
+        :param inclusive: True date为交易日时包含date
+        :return: 日期列表（升序），日历中不足n个时返回全部
+        """
+        i = bisect_right(self.dates, date) if inclusive else bisect_left(self.dates, date)
+        return self.dates[max(i - n, 0):i]
+
+    def next(self, date, n, inclusive=False):
+        """
+        date之后的前n个交易日
+        :param date: 日期 yyyymmdd
+        :param n: 交易日数
+        :param inclusive: True date为交易日时包含date
+        :return: 日期列表（升序），日历中不足n个时返回全部
+        """
+        i = bisect_left(self.dates, date) if inclusive else bisect_right(self.dates, date)
+        return self.dates[i:i + n]
+
+    def between(self, start, end):
+        """
+        日期区间[start, end]内的交易日
+        :param start: 起始日期 yyyymmdd（含）
+        :param end: 截止日期 yyyymmdd（含）
+        :return: 日期列表（升序）
+        """
+        return self.dates[bisect_left(self.dates, start):bisect_right(self.dates, end)]
+
+
+def calendar_path():
+    return os.path.join(storage.DATA_DIR, CALENDAR_FILE)
+
+
+def token():
+    """
+    交易日历文件标识（修改时间、文件大小），文件不存在时返回None
+    """
+    try:
+        st = os.stat(calendar_path())
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def load(path):
+    """
+    读取交易日历文件
+    :param path: 文件路径
+    :return: TradeCalendar
+    """
+    with open(path, 'r') as f:
+        return TradeCalendar(line[0].strip() for line in csv.reader(f) if line and line[0].strip())
+
+
+def get():
+    """
+    获得交易日历，首次使用时读取，日历文件修改后重新读取
+    :return: TradeCalendar
+    """
+    path = calendar_path()
+    current = token()
+    with _lock:
+        cached = _calendars.get(path)
+        if cached is not None and cached[0] == current:
+            return cached[1]
+    calendar = load(path)
+    with _lock:
+        _calendars[path] = (current, calendar)
+    return calendar
@@ -1,19 +1,48 @@
+import importlib
 import logging
-import datetime
+
+import logger
 
 
 def get_log():
     """
-    获取日志输出对象
+    获取日志输出对象（兼容旧代码，新代码使用logging.getLogger(__name__)，并在入口处调用logger.setup()）
     :return: 日志输出对象
     """
-    today = datetime.date.today()
-    today_date = today.strftime('%Y%m%d')
-    file = open('logs/log' + '_' + today_date + '.log', encoding="utf-8", mode="a")
-    logging.basicConfig(
-        stream=file,
-        level=logging.INFO,
-        format='%(asctime)s  %(filename)s : %(levelname)s  %(message)s',
-        datefmt='%Y-%m-%d %A %H:%M:%S'
-    )
+    logger.setup()
     return logging.getLogger()
+
+
+class LazyModule:
+    """
+    延迟导入的模块：首次访问属性时才导入（导入由模块锁保证线程安全）
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        """
+        导入模块
+        :return: 模块
+        """
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return '<LazyModule %s%s>' % (self._name, '' if self._module is None else ' (loaded)')
+
+
+def lazy_import(name):
+    """
+    延迟导入模块，用于只在部分请求或部分进程中使用的模块（pandas等导入耗时较长）
+    :param name: 模块名称
+    :return: LazyModule
+    """
+    return LazyModule(name)
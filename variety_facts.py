@@ -0,0 +1,268 @@
+"""
+品种明细数据：各(日期, 业务类型, 品种)的交易笔数、成交量与成交额，按年度保存在 data/variety/{year}.csv
+品种以整数编码保存，编码表为 data/variety/varieties.json（已有品种按variety_order编码，新品种依次追加编码）
+
+查询使用年度索引：明细按(品种, 类型, 日期)排序，保存每个(品种, 类型)在数组中的起止位置及累计值，
+任意日期区间的合计为两个累计行之差，起止位置由组内日期二分查找得到
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import storage
+
+# 品种明细目录名（数据目录下）
+FACT_DIR = 'variety'
+CODES_FILE = 'varieties.json'
+COLUMNS = ['date', 'type', 'variety', 'trade_num', 'volume', 'turnover']
+KEY = ['date', 'type', 'variety']
+METRICS = ['trade_num', 'volume', 'turnover']
+
+_lock = threading.Lock()
+# (编码表文件标识, 品种名称 -> 编码)
+_codes = (None, {})
+# 明细文件路径 -> (文件标识, VarietyIndex)
+_indexes = {}
+
+_CACHE_HIT = metrics.CACHE_REQUESTS.labels('variety', 'hit')
+_CACHE_MISS = metrics.CACHE_REQUESTS.labels('variety', 'miss')
+
+
+def fact_dir():
+    return os.path.join(storage.DATA_DIR, FACT_DIR)
+
+
+def year_path(year):
+    return os.path.join(fact_dir(), '{year}.csv'.format(year=year))
+
+
+def _token(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _write_atomic(path, write):
+    """
+    原子写入：先写入同目录临时文件，再替换原文件
+    :param path: 文件路径
+    :param write: fn(临时文件路径)
+    :return:
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with storage.atomic_write(path) as tmp_path:
+        write(tmp_path)
+
+
+def _read_codes(path):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    from schedule_service.otc_daily_rept import variety_order
+    return dict(variety_order)
+
+
+def codes():
+    """
+    品种编码表
+    :return: 品种名称 -> 编码
+    """
+    global _codes
+    path = os.path.join(fact_dir(), CODES_FILE)
+    token = _token(path)
+    with _lock:
+        if token is not None and _codes[0] == token:
+            return _codes[1]
+    result = _read_codes(path)
+    with _lock:
+        _codes = (token, result)
+    return result
+
+
+def _assign(names):
+    """
+    为新品种分配编码（编码表加写锁，多个进程同时采集时编码不冲突）
+    :param names: 品种名称集合
+    :return: 品种名称 -> 编码
+    """
+    global _codes
+    current = codes()
+    if all(name in current for name in names):
+        return current
+    path = os.path.join(fact_dir(), CODES_FILE)
+    with storage.file_lock(path):
+        result = _read_codes(path)
+        for name in sorted(set(names) - set(result)):
+            result[name] = max(result.values(), default=0) + 1
+
+        def write(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=1)
+        _write_atomic(path, write)
+        with _lock:
+            _codes = (_token(path), result)
+    return result
+
+
+def names():
+    """
+    :return: 编码 -> 品种名称
+    """
+    return {code: name for name, code in codes().items()}
+
+
+def read_year(path):
+    """
+    解析年度品种明细文件
+    :param path: 文件路径
+    :return: DataFrame columns：COLUMNS
+    """
+    return pd.read_csv(path, dtype={'date': str, 'type': str, 'variety': 'int64', 'trade_num': 'int64',
+                                    'volume': float, 'turnover': float})
+
+
+class VarietyIndex:
+    """
+    年度品种明细索引
+    """
+
+    def __init__(self, df):
+        df = df.sort_values(['variety', 'type', 'date'], kind='mergesort')
+        self.dates = df['date'].to_numpy(dtype=object)
+        self.values = df[METRICS].to_numpy(dtype=float)
+        # cum[i]：前i行累计值（各组累计值之差即为组内区间合计）
+        self.cum = np.zeros((len(df) + 1, len(METRICS)))
+        np.cumsum(np.nan_to_num(self.values), axis=0, out=self.cum[1:])
+        keys = list(zip(df['variety'].tolist(), df['type'].tolist()))
+        # (品种编码, 类型) -> (起始位置, 截止位置)
+        self.groups = {}
+        start = 0
+        for i in range(1, len(keys) + 1):
+            if i == len(keys) or keys[i] != keys[start]:
+                self.groups[keys[start]] = (start, i)
+                start = i
+
+    def _select(self, varieties=None, types=None):
+        return [(key, bounds) for key, bounds in self.groups.items()
+                if (varieties is None or key[0] in varieties) and (types is None or key[1] in types)]
+
+    def buckets(self, starts, end, varieties=None, types=None):
+        """
+        按统计周期汇总各(品种, 类型)：第i个统计周期为[starts[i], starts[i+1])，最后一个统计周期截至end
+        :param starts: 各统计周期起始日期 yyyymmdd（升序）
+        :param end: 截止日期 yyyymmdd（含）
+        :param varieties: 品种编码集合，默认全部
+        :param types: 类型集合，默认全部
+        :return: (品种编码数组, 类型数组, 统计周期序号数组, 汇总值数组[行, METRICS])，仅包含有记录的统计周期
+        """
+        starts = np.asarray(starts, dtype=object)
+        codes, ctypes, periods, values = [], [], [], []
+        for (code, ctype), (lo, hi) in self._select(varieties, types):
+            dates = self.dates[lo:hi]
+            positions = lo + np.append(np.searchsorted(dates, starts, 'left'), np.searchsorted(dates, end, 'right'))
+            present = np.flatnonzero(positions[1:] > positions[:-1])
+            if len(present) == 0:
+                continue
+            codes.append(np.full(len(present), code))
+            ctypes.append(np.full(len(present), ctype, dtype=object))
+            periods.append(present)
+            values.append(self.cum[positions[present + 1]] - self.cum[positions[present]])
+        if not codes:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=object), np.zeros(0, dtype=int), \
+                np.zeros((0, len(METRICS)))
+        return np.concatenate(codes), np.concatenate(ctypes), np.concatenate(periods), np.concatenate(values)
+
+    def days(self, start, end, varieties=None, types=None):
+        """
+        日期区间[start, end]内各(品种, 类型)每日明细
+        :return: (品种编码数组, 类型数组, 日期数组, 明细数组[行, METRICS])
+        """
+        codes, ctypes, rows = [], [], []
+        for (code, ctype), (lo, hi) in self._select(varieties, types):
+            dates = self.dates[lo:hi]
+            s, e = lo + np.searchsorted(dates, start, 'left'), lo + np.searchsorted(dates, end, 'right')
+            if e > s:
+                codes.append(np.full(e - s, code))
+                ctypes.append(np.full(e - s, ctype, dtype=object))
+                rows.append(np.arange(s, e))
+        if not rows:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=object), np.zeros(0, dtype=object), \
+                np.zeros((0, len(METRICS)))
+        rows = np.concatenate(rows)
+        return np.concatenate(codes), np.concatenate(ctypes), self.dates[rows], np.nan_to_num(self.values[rows])
+
+
+def get(year):
+    """
+    获得年度品种明细索引，明细文件被其他进程修改后重建
+    :param year: 年份 yyyy
+    :return: VarietyIndex，没有明细文件时返回None
+    """
+    year = str(year)
+    path = year_path(year)
+    token = _token(path)
+    if token is None:
+        return None
+    with _lock:
+        cached = _indexes.get(path)
+        if cached is not None and cached[0] == token:
+            _CACHE_HIT.inc()
+            return cached[1]
+    _CACHE_MISS.inc()
+    index = VarietyIndex(read_year(path))
+    with _lock:
+        _indexes[path] = (token, index)
+    return index
+
+
+def _same(old, new):
+    """
+    两组明细是否相同（按KEY排序后比较，空值视为相等）
+    """
+    if len(old) != len(new):
+        return False
+    old = old.sort_values(KEY).reset_index(drop=True)
+    new = new.sort_values(KEY).reset_index(drop=True)
+    return old[KEY].equals(new[KEY]) and \
+        np.allclose(old[METRICS].to_numpy(float), new[METRICS].to_numpy(float), equal_nan=True)
+
+
+def save(items):
+    """
+    保存品种明细，每个(日期, 业务类型)的明细整体替换，与已保存的明细相同时不写入
+    :param items: [(日期, 业务类型, {品种名称: (交易笔数, 成交量, 成交额)})]，成交量、成交额未知时为None
+    :return: 年份 -> 写入的日期集合
+    """
+    items = list(items)
+    if not items:
+        return {}
+    code_map = _assign(set(name for date, ctype, breakdown in items for name in breakdown))
+    rows = [(date, ctype, code_map[name], int(values[0]),
+             np.nan if values[1] is None else float(values[1]), np.nan if values[2] is None else float(values[2]))
+            for date, ctype, breakdown in items for name, values in breakdown.items()]
+    new_df = pd.DataFrame(rows, columns=COLUMNS).astype({'variety': 'int64', 'trade_num': 'int64'})
+    keys = pd.MultiIndex.from_tuples(sorted(set((date, ctype) for date, ctype, breakdown in items)))
+    written = {}
+    for year in sorted(set(date[:4] for date, ctype, breakdown in items)):
+        path = year_path(year)
+        year_keys = keys[keys.get_level_values(0).str[:4] == year]
+        year_new = new_df[new_df['date'].str[:4] == year]
+        with storage.file_lock(path):
+            old = read_year(path) if os.path.exists(path) else pd.DataFrame(columns=COLUMNS)
+            replaced = pd.MultiIndex.from_frame(old[['date', 'type']]).isin(year_keys) if len(old) else \
+                np.zeros(0, dtype=bool)
+            if _same(old[replaced], year_new):
+                continue
+            merged = pd.concat([old[~replaced], year_new], ignore_index=True).sort_values(KEY, ignore_index=True)
+            _write_atomic(path, lambda tmp_path: merged.to_csv(tmp_path, index=False))
+            index = VarietyIndex(merged)
+            with _lock:
+                _indexes[path] = (_token(path), index)
+        written[year] = set(year_keys.get_level_values(0))
+    return written